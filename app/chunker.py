@@ -1,35 +1,27 @@
+import logging
+import multiprocessing
 import os
-from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter, Language
-
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-# === НАСТРОЙКИ ===
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter, Language
 
-IGNORE_DIRS = {
-    # Сборка и зависимости
-    'node_modules', '.next', 'dist', 'build', '.vercel', 'node_modules',
-    'venv', '.venv', '__pycache__', 'mediafiles', 'staticfiles', 'static',
+from app.config import settings
+from app.ingest import check_file, estimate_seconds_saved, format_skip_report, iter_text_windows, new_skip_report, record_skip
+from app.project_tree import IGNORE_DIRS, IGNORE_FILES, project_trees  # noqa: F401
+from app.symbols import JS_EXTENSIONS, PYTHON_EXTENSIONS, extract_symbols
 
-    # Кэши инструментов
-    '.ruff_cache', '.mypy_cache', '.pytest_cache', '.cursor', '.husky',
-    '.git', '.github', '.vscode', '_TMP', '.brv', '.ci',
+# Воркеры пула наследуют stdout, а он занят JSON-RPC — всё пишем в лог (stderr)
+logger = logging.getLogger("vox-brain")
 
-    # Тесты (на первом этапе лучше скрыть, чтобы не путать модель)
-    'cypress', 'tests'
-}
 
-IGNORE_FILES = {
-    # Секреты и конфиги окружения
-    '.env', '.env.example', '.env.local', '.env.backup', '.env.production.local',
-    'sample.env', 'db.sqlite3',
+# === НАСТРОЙКИ ===
 
-    # Лок-файлы (огромные и бесполезные для RAG)
-    'yarn.lock', 'package-lock.json', 'uv.lock', 'tsconfig.strict.tsbuildinfo',
+# IGNORE_DIRS / IGNORE_FILES живут в app.project_tree (общие с деревом проекта)
 
-    # Конфиги инструментов (лучше убрать, чтобы не забивать контекст)
-    '.eslintrc.json', '.prettierrc.json', '.eslintignore', '.prettierignore',
-    '.cursorignore', '.gitignore', '.dockerignore', '.vercelignore',
-    'docker-compose.yml', 'Dockerfile', '.flake8', '.ruffignore'
-}
 # Указываем, по каким заголовкам делить
 headers_to_split_on = [
     ("#", "Header 1"),
@@ -54,82 +46,298 @@ ALLOWED_EXTENSIONS = {
     '': None # Для файлов без расширения
 }
 
-def load_and_chunk_project(root_path):
-    documents = []
+@lru_cache(maxsize=None)
+def get_splitter(language):
+    """
+    Returns the splitter for a language (None = generic).
+    Built once per process, not once per file.
+    """
+    if language:
+        return RecursiveCharacterTextSplitter.from_language(
+            language=language,
+            chunk_size=1000,
+            chunk_overlap=100
+        )
+    # Универсальный сплиттер для SQL, TXT и прочего
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=100
+    )
 
-    print(f"🚀 Начинаем сканирование: {os.path.abspath(root_path)}")
 
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        # 1. Фильтрация папок (удаляем ненужные из обхода)
-        dirnames[:] = [d for d in dirnames if d not in IGNORE_DIRS]
+def _split_with_lines(text, start_line, language):
+    """Splits text and returns (piece, first_line, last_line) for each piece."""
+    pieces = []
+    cursor = 0
+    for piece in get_splitter(language).split_text(text):
+        offset = text.find(piece, cursor)
+        if offset < 0:
+            offset = cursor
+        first = start_line + text.count("\n", 0, offset)
+        pieces.append((piece, first, first + piece.count("\n")))
+        cursor = offset + 1
+    return pieces
 
-        for filename in filenames:
-            if filename in IGNORE_FILES:
-                continue
 
-            file_ext = os.path.splitext(filename)[1]
-            if file_ext not in ALLOWED_EXTENSIONS:
-                continue
+def chunk_by_symbols(content, file_ext, language, metadata):
+    """
+    One chunk per function/class (oversized ones are split further), with
+    `symbol`, `symbol_kind`, `start_line` and `end_line` metadata. Code
+    outside definitions is grouped into module-level chunks.
+    Returns None when the file can't be parsed.
+    """
+    max_chars = settings.symbol_chunk_max_chars
+    units = extract_symbols(content, file_ext, max_chars)
+    if units is None:
+        return None
 
-            full_path = os.path.join(dirpath, filename)
-            relative_path = os.path.relpath(full_path, root_path)
+    lines = content.splitlines()
+    chunks = []
+    covered = set()
 
-            # 2. Чтение файла
-            try:
-                with open(full_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except Exception as e:
-                print(f"⚠️ Ошибка чтения {relative_path}: {e}")
-                continue
+    for unit in units:
+        text = "\n".join(
+            "\n".join(lines[start - 1 : end]) for start, end in unit.ranges
+        )
+        for start, end in unit.ranges:
+            covered.update(range(start, end + 1))
+        if not text.strip():
+            continue
 
-            # Пропускаем пустые файлы
-            if not content.strip():
+        unit_meta = {
+            **metadata,
+            "symbol": unit.name,
+            "symbol_kind": unit.kind,
+            "start_line": unit.start_line,
+            "end_line": unit.end_line,
+        }
+        if len(text) <= max_chars:
+            chunks.append(Document(page_content=text, metadata=unit_meta))
+            continue
+        # Диапазоны несмежные: режем каждый отдельно, чтобы номера строк считались от его начала
+        for start, end in unit.ranges:
+            range_text = "\n".join(lines[start - 1 : end])
+            if not range_text.strip():
                 continue
+            for piece, first, last in _split_with_lines(range_text, start, language):
+                chunks.append(Document(
+                    page_content=piece,
+                    metadata={**unit_meta, "start_line": first, "end_line": last},
+                ))
+
+    # Код вне определений (импорты, константы, вызовы) — группами до chunk_size
+    group, group_start = [], None
+
+    def flush_group():
+        text = "\n".join(group)
+        if text.strip():
+            for piece, first, last in _split_with_lines(text, group_start, language):
+                chunks.append(Document(
+                    page_content=piece,
+                    metadata={**metadata, "symbol_kind": "module", "start_line": first, "end_line": last},
+                ))
+
+    for number, line in enumerate(lines, start=1):
+        if number in covered:
+            if group:
+                flush_group()
+                group, group_start = [], None
+            continue
+        if group_start is None:
+            group_start = number
+        group.append(line)
+    if group:
+        flush_group()
+
+    chunks.sort(key=lambda chunk: chunk.metadata["start_line"])
+    return chunks
+
+
+def iter_project_files(root_path):
+    """
+    Yields absolute paths of indexable files under root_path.
+    Discovery goes through the shared project tree snapshot, so only
+    directories that changed since the last run are re-listed.
+    """
+    tree = project_trees.get(root_path)
+    tree.refresh()
+    yield from tree.iter_files(extensions=ALLOWED_EXTENSIONS, skip_files=IGNORE_FILES)
+
+
+def is_indexable(relative_path):
+    """Same rules as iter_project_files, for a single path relative to the root."""
+    parts = os.path.normpath(relative_path).split(os.sep)
+    if any(part in IGNORE_DIRS for part in parts[:-1]):
+        return False
+    filename = parts[-1]
+    return filename not in IGNORE_FILES and os.path.splitext(filename)[1] in ALLOWED_EXTENSIONS
+
+
+def chunk_windows(full_path, relative_path, language, metadata):
+    """
+    Chunks a large text file window by window (see ingest.iter_text_windows)
+    instead of reading it whole; chunks keep their line numbers.
+    Raises UnicodeDecodeError if any window is not valid UTF-8, so no
+    partial result escapes.
+    """
+    chunks = []
+    for text, first_line in iter_text_windows(full_path, settings.ingest_window_bytes):
+        for piece, first, last in _split_with_lines(text, first_line, language):
+            chunks.append(Document(
+                page_content=piece,
+                metadata={**metadata, "start_line": first, "end_line": last},
+            ))
+    return chunks
+
+
+def chunk_file(full_path, root_path, content=None):
+    """
+    Splits a single file into chunks.
+    If content is None the file is read from disk (in windows if it is
+    larger than ingest_stream_bytes; markdown is always read whole so the
+    header-aware split sees the full document).
+    Returns an empty list for empty or unreadable files. Raises
+    UnicodeDecodeError if a windowed read hits invalid UTF-8 (the caller
+    reports the file as binary).
+    """
+    relative_path = os.path.relpath(full_path, root_path)
+    filename = os.path.basename(full_path)
+    file_ext = os.path.splitext(filename)[1]
+    language = ALLOWED_EXTENSIONS.get(file_ext)
+
+    # Мы добавляем метаданные СРАЗУ, чтобы потом не потерять контекст
+    metadata = {
+        "source": relative_path,
+        "filename": filename,
+        "extension": file_ext
+    }
+
+    # 2. Чтение файла
+    if content is None:
+        try:
+            if file_ext != '.md' and os.path.getsize(full_path) > settings.ingest_stream_bytes:
+                return chunk_windows(full_path, relative_path, language, metadata)
+        except UnicodeDecodeError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка чтения {relative_path}: {e}")
+            return []
+        try:
+            with open(full_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка чтения {relative_path}: {e}")
+            return []
+
+    # Пропускаем пустые файлы
+    if not content.strip():
+        return []
+
+    # 3. Выбор сплиттера в зависимости от языка
+    if file_ext == '.md':
+        # ЭТАП 1: Режем по заголовкам
+        md_header_chunks = md_header_splitter.split_text(content)
+
+        # ЭТАП 2: Дорезаем слишком длинные секции (если внутри раздела 5000 символов)
+        # и объединяем метаданные
+        chunks = get_splitter(None).split_documents(md_header_chunks)
+
+        # Добавляем свои метаданные (путь к файлу) к уже созданным заголовкам
+        for chunk in chunks:
+            chunk.metadata.update({**metadata, "type": "documentation"})
+        # Секции по заголовкам и есть нарезка — общий сплиттер ниже их не перерезает
+        return chunks
+
+    # 4. Нарезка на чанки
+    # Код режем по определениям (функции/классы), а не по 1000 символов
+    if settings.symbol_chunking and file_ext in PYTHON_EXTENSIONS | JS_EXTENSIONS:
+        chunks = chunk_by_symbols(content, file_ext, language, metadata)
+        if chunks is not None:
+            return chunks
+
+    return get_splitter(language).create_documents([content], metadatas=[metadata])
+
+
+def resolve_workers(workers=None):
+    workers = settings.chunk_workers if workers is None else workers
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def map_files(func, items, workers=None):
+    """
+    Applies func to every item on a process pool and yields the results
+    in input order. Small inputs (or workers=1) run in-process, since
+    spawning workers costs more than it saves.
+    func must be a picklable top-level function.
+    """
+    items = list(items)
+    workers = resolve_workers(workers)
+    if workers <= 1 or len(items) < settings.chunk_parallel_min_files:
+        for item in items:
+            yield func(item)
+        return
+
+    # Держим ограниченное окно задач в полёте, чтобы память не росла с размером репо
+    window = workers * 8
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _chunk_path(args):
+    """Pool worker: returns (full_path, size, skip reason, chunks)."""
+    full_path, root_path = args
+    try:
+        size = os.path.getsize(full_path)
+        reason = check_file(full_path, size)
+    except OSError as e:
+        logger.warning(f"⚠️ Ошибка чтения {os.path.relpath(full_path, root_path)}: {e}")
+        return full_path, 0, None, []
+    if reason is not None:
+        return full_path, size, reason, []
+    try:
+        return full_path, size, None, chunk_file(full_path, root_path)
+    except UnicodeDecodeError:
+        # Невалидный UTF-8 дальше выборки sniff — файл всё-таки бинарный
+        return full_path, size, "binary", []
+
+
+def iter_chunks(root_path, workers=None):
+    """
+    Lazily yields chunks file by file, so callers can stream them
+    into the vector store without holding the whole project in memory.
+    Files are chunked on a process pool; output order is deterministic.
+    Files rejected by the ingestion policy (app.ingest) are skipped and
+    summarized at the end.
+    """
+    logger.info(f"🚀 Начинаем сканирование: {os.path.abspath(root_path)}")
+
+    report = new_skip_report()
+    bytes_read = 0
+    start = time.perf_counter()
+    paths = [(full_path, root_path) for full_path in iter_project_files(root_path)]
+    for full_path, size, reason, chunks in map_files(_chunk_path, paths, workers):
+        if reason is not None:
+            record_skip(report, reason, size)
+            continue
+        bytes_read += size
+        if not chunks:
+            continue
+
+        logger.info(f"✅ Обработан: {os.path.relpath(full_path, root_path)} -> {len(chunks)} чанков")
+        yield from chunks
+
+    if report["files_skipped"]:
+        # Здесь только чтение и нарезка — экономия без учёта эмбеддингов
+        report["seconds_saved"] = estimate_seconds_saved(report, bytes_read, time.perf_counter() - start)
+        logger.info(format_skip_report(report))
+
 
-            # 3. Выбор сплиттера в зависимости от языка
-            language = ALLOWED_EXTENSIONS.get(file_ext)
-            if file_ext == '.md':
-                # ЭТАП 1: Режем по заголовкам
-                md_header_chunks = md_header_splitter.split_text(content)
-
-                # ЭТАП 2: Дорезаем слишком длинные секции (если внутри раздела 5000 символов)
-                # и объединяем метаданные
-                final_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-                chunks = final_splitter.split_documents(md_header_chunks)
-
-                # Добавляем свои метаданные (путь к файлу) к уже созданным заголовкам
-                for chunk in chunks:
-                    chunk.metadata.update({
-                        "source": relative_path,
-                        "filename": filename,
-                        "type": "documentation"
-                    })
-
-            if language:
-                splitter = RecursiveCharacterTextSplitter.from_language(
-                    language=language,
-                    chunk_size=1000,
-                    chunk_overlap=100
-                )
-            else:
-                # Универсальный сплиттер для SQL, TXT и прочего
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=100
-                )
-
-            # 4. Нарезка на чанки
-            # Мы добавляем метаданные СРАЗУ, чтобы потом не потерять контекст
-            chunks = splitter.create_documents(
-                [content],
-                metadatas=[{
-                    "source": relative_path,
-                    "filename": filename,
-                    "extension": file_ext
-                }]
-            )
-
-            documents.extend(chunks)
-            print(f"✅ Обработан: {relative_path} -> {len(chunks)} чанков")
-
-    return documents
+def load_and_chunk_project(root_path, workers=None):
+    return list(iter_chunks(root_path, workers))
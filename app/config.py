@@ -0,0 +1,123 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Runtime settings, overridable through RAG_MCP_* environment variables."""
+
+    model_config = SettingsConfigDict(env_prefix="RAG_MCP_", extra="ignore")
+
+    # Load heavy dependencies and the reranker in the background at startup
+    prewarm: bool = False
+
+    # Ollama
+    ollama_url: str = "http://localhost:11434"
+
+    # Process-wide caches that don't belong to a single project
+    cache_dir: str = "~/.cache/rag-mcp"
+
+    # Query rewrite (LLM keyword expansion); timeout 0 = always wait
+    rewrite_cache_size: int = 2000
+    rewrite_cache_ttl: float = 7 * 24 * 3600
+    # Seconds between a cache change and its (background) save to disk
+    rewrite_cache_flush_delay: float = 5.0
+    rewrite_timeout: float = 0.0
+
+    # Hybrid retrieval: BM25 over code tokens fused with vector hits (RRF)
+    hybrid_search: bool = True
+    query_rewrite: bool = True
+    bm25_k1: float = 1.2
+    bm25_b: float = 0.75
+    rrf_k: int = 60
+
+    # Reranking (cross-encoder); threads 0 = torch default, skip margin 0 = off
+    rerank_candidates: int = 20
+    rerank_batch_size: int = 32
+    rerank_threads: int = 0
+    rerank_cache_size: int = 10_000
+    rerank_skip_margin: float = 0.0
+
+    # Final search results cache (0 entries = off); invalidated by index writes
+    search_cache_size: int = 1000
+    search_cache_max_mb: float = 32.0
+
+    # Federated search (search_projects): stores searched at once, seconds a
+    # store may take (0 = no limit), min candidates each store adds to the rerank
+    federated_workers: int = 8
+    federated_timeout: float = 10.0
+    federated_store_candidates: int = 10
+
+    # Vector store (per project: <project>/<db_dirname>)
+    db_dirname: str = ".rag_db"
+    store_registry_size: int = 8
+    store_idle_ttl: float = 600.0
+    # "chroma" or "numpy" (memory-mapped float16/int8 vectors, exact search)
+    vector_backend: str = "chroma"
+    vector_dtype: str = "float16"
+
+    # Near-duplicate chunks (MinHash estimate of shingle Jaccard >= threshold)
+    # are stored once, with the other files listed in `alternate_sources`
+    dedup_enabled: bool = True
+    dedup_threshold: float = 0.9
+
+    # Background indexing jobs running at once
+    index_job_workers: int = 2
+
+    # Embedding pipeline
+    embed_batch_size: int = 32
+    embed_concurrency: int = 4
+    embed_max_retries: int = 5
+    embed_retry_backoff: float = 0.5
+    embed_timeout: float = 120.0
+
+    # Chunking (0 workers = one per CPU core)
+    chunk_workers: int = 0
+    chunk_parallel_min_files: int = 500
+
+    # Ingestion policy: size caps in bytes per extension (ingest_max_bytes for
+    # the rest, 0 = no cap); minified/generated/binary files are detected from
+    # the first ingest_sample_bytes; text files over ingest_stream_bytes are
+    # read and chunked in windows of ingest_window_bytes
+    ingest_max_bytes: int = 1_000_000
+    ingest_size_limits: dict[str, int] = {".json": 200_000, ".sql": 500_000, "": 200_000}
+    ingest_sample_bytes: int = 8192
+    ingest_skip_generated: bool = True
+    ingest_stream_bytes: int = 512_000
+    ingest_window_bytes: int = 128_000
+
+    # One chunk per function/class for Python and JS/TS
+    symbol_chunking: bool = True
+    symbol_chunk_max_chars: int = 3000
+
+    # Chunks embedded and committed to the store per batch
+    index_batch_size: int = 256
+
+    # Embedding cache (stored next to the Chroma store)
+    embedding_cache_enabled: bool = True
+    embedding_cache_size: int = 200_000
+
+    # ask_project: context window, answer length and how many hits feed the
+    # context; the context is packed into what's left (estimated tokens)
+    ask_num_ctx: int = 8192
+    ask_num_predict: int = 1024
+    ask_top_k: int = 20
+    ask_context_margin: int = 256
+    context_chars_per_token: float = 3.5
+    # Min seconds between streamed answer progress notifications
+    stream_progress_interval: float = 0.2
+
+    # Project tree snapshot: min seconds between refreshes on reads, max lines
+    tree_refresh_interval: float = 2.0
+    tree_max_entries: int = 5000
+
+    # Live index updates (watch_project): backend auto/watchdog/poll, quiet
+    # period before applying changes, poll period, queue size before a full sync
+    watch_backend: str = "auto"
+    watch_debounce: float = 1.0
+    watch_poll_interval: float = 2.0
+    watch_max_pending: int = 2000
+
+    # Prometheus text dump rewritten after each tool call ("" = off)
+    metrics_prometheus_file: str = ""
+
+
+settings = Settings()
@@ -0,0 +1,269 @@
+import os
+
+
+def estimate_tokens(text: str, chars_per_token: float = 3.5) -> int:
+    """Cheap token estimate; code averages ~3-4 characters per token."""
+    return int(len(text) / chars_per_token) + 1
+
+
+class ContextBlock:
+    """
+    A contiguous piece of one file built from one or more search hits.
+    `rank` is the best (lowest) rank of its hits; line numbers are None
+    for chunks indexed without them.
+    """
+
+    __slots__ = ("source", "start_line", "end_line", "lines", "rank", "chunk_ids")
+
+    def __init__(self, source: str, start_line: int | None, lines: list[str], rank: int, chunk_ids: list[str]):
+        self.source = source
+        self.start_line = start_line
+        self.end_line = start_line + len(lines) - 1 if start_line is not None else None
+        self.lines = lines
+        self.rank = rank
+        self.chunk_ids = chunk_ids
+
+    @property
+    def content(self) -> str:
+        return "\n".join(self.lines)
+
+    def header(self) -> str:
+        if self.start_line is None:
+            return self.source
+        return f"{self.source}:{self.start_line}-{self.end_line}"
+
+
+def _has_exact_lines(result: dict, file_lines: list[str] | None) -> bool:
+    """
+    Line numbers describe the content only if it is one contiguous range
+    and the file on disk still has that text there (the index may be
+    behind an edit that shifted the file).
+    """
+    if result.get("start_line") is None or file_lines is None:
+        return False
+    start, end = result["start_line"], result["end_line"]
+    content = result.get("content", "")
+    if content.count("\n") + 1 != end - start + 1 or end > len(file_lines):
+        return False
+    # Сплиттер срезает отступ первой строки, поэтому сравниваем без краевых пробелов
+    return "\n".join(file_lines[start - 1 : end]).strip() == content.strip()
+
+
+def _read_lines(root: str | None, source: str) -> list[str] | None:
+    if root is None:
+        return None
+    try:
+        with open(os.path.join(root, source), "r", encoding="utf-8") as f:
+            return f.read().split("\n")
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _merge_by_lines(hits: list[tuple[int, dict]]) -> list[ContextBlock]:
+    blocks = []
+    for rank, result in sorted(hits, key=lambda hit: hit[1]["start_line"]):
+        lines = result.get("content", "").split("\n")
+        start = result["start_line"]
+        last = blocks[-1] if blocks else None
+        if last is not None and start <= last.end_line + 1:
+            # Пересекается или примыкает: дописываем только новые строки
+            overlap = last.end_line - start + 1
+            if overlap < len(lines):
+                last.lines.extend(lines[max(0, overlap):])
+                last.end_line = last.start_line + len(last.lines) - 1
+            last.rank = min(last.rank, rank)
+            last.chunk_ids.append(result["id"])
+            continue
+        blocks.append(ContextBlock(result["source"], start, lines, rank, [result["id"]]))
+    return blocks
+
+
+def _text_overlap(left: str, right: str, min_overlap: int) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    for size in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_by_text(hits: list[tuple[int, dict]], min_overlap: int) -> list[ContextBlock]:
+    """For chunks without line numbers: glue pieces whose edges overlap (splitter overlap)."""
+    pieces = [[rank, result.get("content", ""), [result["id"]]] for rank, result in hits]
+    merged = True
+    while merged and len(pieces) > 1:
+        merged = False
+        for i, left in enumerate(pieces):
+            for j, right in enumerate(pieces):
+                if i == j:
+                    continue
+                size = _text_overlap(left[1], right[1], min_overlap)
+                if size:
+                    left[0] = min(left[0], right[0])
+                    left[1] += right[1][size:]
+                    left[2].extend(right[2])
+                    del pieces[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [
+        ContextBlock(hits[0][1]["source"], None, text.split("\n"), rank, chunk_ids)
+        for rank, text, chunk_ids in pieces
+    ]
+
+
+def merge_results(results: list[dict], min_overlap: int = 40, root: str | None = None) -> list[ContextBlock]:
+    """
+    Turns ranked search results into blocks: hits of the same file that
+    overlap or touch are merged, and blocks whose text is contained in
+    another block are dropped. Blocks come back best rank first.
+    Hits are merged by line numbers only if their ranges match the file
+    under `root` (federated hits use their own project); otherwise they
+    are glued by overlapping text and shown without line numbers.
+    """
+    by_source: dict[tuple, tuple[list, list]] = {}
+    files: dict[tuple, list[str] | None] = {}
+    for rank, result in enumerate(results):
+        key = (result.get("project") or root, result.get("source", "unknown"))
+        if key not in files:
+            files[key] = _read_lines(key[0], key[1]) if result.get("source") else None
+        with_lines, without_lines = by_source.setdefault(key, ([], []))
+        (with_lines if _has_exact_lines(result, files[key]) else without_lines).append((rank, result))
+
+    blocks = []
+    for with_lines, without_lines in by_source.values():
+        blocks.extend(_merge_by_lines(with_lines))
+        if without_lines:
+            blocks.extend(_merge_by_text(without_lines, min_overlap))
+
+    # Дубликаты: одинаковый текст (в т.ч. копии файлов) или кусок внутри другого блока
+    blocks.sort(key=lambda block: (block.rank, -len(block.lines)))
+    kept: list[ContextBlock] = []
+    for block in blocks:
+        content = block.content
+        if not content.strip():
+            continue
+        if any(content in other.content for other in kept):
+            continue
+        kept.append(block)
+    return kept
+
+
+def pack_blocks(
+    blocks: list[ContextBlock], budget_tokens: int, chars_per_token: float = 3.5, min_tokens: int = 64
+) -> list[ContextBlock]:
+    """
+    Takes blocks best first while they fit in the budget. A block that
+    doesn't fit is cut at a line boundary if at least `min_tokens` remain.
+    """
+    packed = []
+    remaining = budget_tokens
+    for block in blocks:
+        cost = estimate_tokens(block.content, chars_per_token) + 16  # + заголовок блока
+        if cost <= remaining:
+            packed.append(block)
+            remaining -= cost
+            continue
+        if remaining < min_tokens:
+            break
+        max_chars = int((remaining - 16) * chars_per_token)
+        lines, size = [], 0
+        for line in block.lines:
+            size += len(line) + 1
+            if size > max_chars:
+                break
+            lines.append(line)
+        if lines:
+            packed.append(ContextBlock(block.source, block.start_line, lines, block.rank, block.chunk_ids))
+        break
+    return packed
+
+
+def _format_documents(documents: list[tuple[str, str]]) -> str:
+    """XML-like context: each (file path, content) pair as a numbered document."""
+    parts = ["<context>"]
+    for i, (path, content) in enumerate(documents):
+        # Четко отделяем каждый документ
+        parts.append(
+            f"### DOCUMENT {i+1}\n"
+            f"FILE_PATH: {path}\n"
+            f"CODE_CONTENT:\n{content}\n"
+            f"--- END OF DOCUMENT {i+1} ---"
+        )
+    parts.append("</context>")
+    return "\n\n".join(parts)
+
+
+def _result_path(result: dict) -> str:
+    path = result.get("source", "unknown")
+    if result.get("project"):
+        # Федеративный поиск: одинаковые пути бывают в разных репозиториях
+        path = f"[{os.path.basename(result['project'])}] {path}"
+    # Чанк, схлопнутый с почти одинаковыми из других файлов, показывает и их
+    alternates = result.get("alternate_sources")
+    return f"{path} (also in: {', '.join(alternates)})" if alternates else path
+
+
+def format_results(results: list[dict]) -> str:
+    """Search results verbatim, one document per hit (search_project output)."""
+    return _format_documents([(_result_path(r), r.get("content", "")) for r in results])
+
+
+def format_grouped_results(groups: list[tuple[str, list[dict]]]) -> str:
+    """
+    Results of several queries, grouped by query. Documents are numbered
+    across groups; a chunk already shown for an earlier query is listed
+    as a reference to its document instead of being repeated.
+    """
+    parts = ["<context>"]
+    shown: dict[str, int] = {}
+    for q, (query, results) in enumerate(groups):
+        parts.append(f"## QUERY {q+1}: {query}")
+        if not results:
+            parts.append("No relevant results found.")
+        for result in results:
+            source = _result_path(result)
+            number = shown.get(result.get("id"))
+            if number is not None:
+                parts.append(f"### SEE DOCUMENT {number} (FILE_PATH: {source})")
+                continue
+            number = shown[result.get("id")] = len(shown) + 1
+            parts.append(
+                f"### DOCUMENT {number}\n"
+                f"FILE_PATH: {source}\n"
+                f"CODE_CONTENT:\n{result.get('content', '')}\n"
+                f"--- END OF DOCUMENT {number} ---"
+            )
+    parts.append("</context>")
+    return "\n\n".join(parts)
+
+
+def format_blocks(blocks: list[ContextBlock]) -> str:
+    """Assembled blocks, with line ranges when known."""
+    return _format_documents([(block.header(), block.content) for block in blocks])
+
+
+def assemble_context(
+    results: list[dict], budget_tokens: int, chars_per_token: float = 3.5, root: str | None = None
+) -> tuple[str, dict]:
+    """
+    Builds the prompt context from ranked results; `root` is the project
+    the hits' line numbers are checked against (see merge_results).
+    Returns (context, stats) where stats compares against pasting every
+    hit verbatim.
+    """
+    raw_tokens = estimate_tokens(format_results(results), chars_per_token)
+    blocks = merge_results(results, root=root)
+    packed = pack_blocks(blocks, budget_tokens, chars_per_token)
+    context = format_blocks(packed)
+    context_tokens = estimate_tokens(context, chars_per_token)
+    stats = {
+        "hits": len(results),
+        "blocks": len(blocks),
+        "packed_blocks": len(packed),
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(0, raw_tokens - context_tokens),
+        "budget_tokens": budget_tokens,
+    }
+    return context, stats
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+# Сколько байт начала файла сверяем, чтобы отличить дозапись от перезаписи
+HEAD_BYTES = 4096
+
+
+def context_path(*parts: str) -> str:
+    """Path inside the VOX context store ($VOX_HOME/context/...)."""
+    return os.path.expandvars(os.path.expanduser(os.path.join("$VOX_HOME", "context", *parts)))
+
+
+def docs_path(project_id: str) -> str:
+    return context_path("docs", project_id, "docs.jsonl")
+
+
+class ContextStore:
+    """
+    Parsed view of one project's docs.jsonl, grouped by entry type.
+
+    The file is re-read only when its mtime or size changes; when it only
+    grew (`vox add-doc` appends), just the new lines are parsed. Rendered
+    resource texts are cached per type until the next change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp: tuple[int, int] | None = None
+        self._offset = 0
+        self._head_hash = b""
+        self._by_type: dict[str, list[dict]] = {}
+        self._rendered: dict[str, str] = {}
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def exists(self) -> bool:
+        with self._lock:
+            return self._refresh()
+
+    def entries(self, doc_type: str, title: str = "", offset: int = 0, limit: int | None = None) -> tuple[list[dict], int]:
+        """
+        Entries of a type, optionally filtered by a case-insensitive title
+        substring, in file order. Returns (page, total matches).
+        """
+        with self._lock:
+            self._refresh()
+            entries = self._by_type.get(doc_type, [])
+            if title:
+                needle = title.lower()
+                entries = [e for e in entries if needle in str(e.get("title")).lower()]
+            end = None if limit is None else offset + limit
+            return entries[offset:end], len(entries)
+
+    def render(self, doc_type: str) -> str:
+        """All entries of a type as `### title` sections ("" if none)."""
+        with self._lock:
+            self._refresh()
+            text = self._rendered.get(doc_type)
+            if text is None:
+                text = render_entries(self._by_type.get(doc_type, []))
+                self._rendered[doc_type] = text
+            return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "entries": {doc_type: len(items) for doc_type, items in self._by_type.items()},
+                "full_loads": self.full_loads,
+                "incremental_loads": self.incremental_loads,
+            }
+
+    def _refresh(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._reset()
+            return False
+
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return True
+
+        with open(self.path, "rb") as f:
+            head = f.read(min(HEAD_BYTES, self._offset))
+            appended = (
+                self._stamp is not None
+                and st.st_size > self._offset
+                and hashlib.blake2b(head).digest() == self._head_hash
+            )
+            if appended:
+                f.seek(self._offset)
+                self.incremental_loads += 1
+            else:
+                f.seek(0)
+                self._by_type = {}
+                self._offset = 0
+                self.full_loads += 1
+            data = f.read()
+
+        self._parse(data)
+        self._offset += len(data)
+        with open(self.path, "rb") as f:
+            self._head_hash = hashlib.blake2b(f.read(min(HEAD_BYTES, self._offset))).digest()
+        # Незавершённую последнюю строку при дозаписи разобрать заново нельзя —
+        # в этом случае следующее изменение перечитает файл целиком
+        if data and not data.endswith(b"\n"):
+            self._head_hash = b""
+        self._stamp = stamp
+        self._rendered = {}
+        return True
+
+    def _parse(self, data: bytes):
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if not isinstance(item, dict):
+                continue
+            self._by_type.setdefault(item.get("type"), []).append(
+                {"title": item.get("title"), "content": item.get("content")}
+            )
+
+    def _reset(self):
+        self._stamp = None
+        self._offset = 0
+        self._head_hash = b""
+        self._by_type = {}
+        self._rendered = {}
+
+
+def render_entries(entries: list[dict]) -> str:
+    return "\n\n".join(f"### {e['title']}\n{e['content']}" for e in entries)
+
+
+class ContextStoreRegistry:
+    """LRU of open ContextStores keyed by docs.jsonl path."""
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max_size
+        self._stores: OrderedDict[str, ContextStore] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, project_id: str) -> ContextStore:
+        path = docs_path(project_id)
+        with self._lock:
+            store = self._stores.get(path)
+            if store is None:
+                store = self._stores[path] = ContextStore(path)
+                while len(self._stores) > self.max_size:
+                    self._stores.popitem(last=False)
+            self._stores.move_to_end(path)
+            return store
+
+
+context_stores = ContextStoreRegistry()
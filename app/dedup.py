@@ -0,0 +1,284 @@
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from app.tokens import tokenize
+
+
+NUM_PERM = 64
+# LSH: 8 полос по 8 хэшей — пара с Jaccard 0.9 становится кандидатом с вероятностью ~99%, с 0.5 — ~3%
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_TOKENS = 3
+# Короткие чанки (импорты, заглушки) одинаковы везде и без контекста файла бесполезны — не схлопываем
+MIN_TOKENS = 16
+
+_rng = np.random.default_rng(0x5EED)
+# Хэши вида (a·x + b) >> 32 по модулю 2^64 (multiply-shift), a нечётные
+_PERM_A = (_rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+
+def minhash_signature(text: str) -> np.ndarray | None:
+    """MinHash of the text's token 3-shingles; None for texts too short to compare."""
+    tokens = tokenize(text)
+    if len(tokens) < MIN_TOKENS:
+        return None
+    shingles = {
+        zlib.crc32(" ".join(tokens[i : i + SHINGLE_TOKENS]).encode("utf-8"))
+        for i in range(len(tokens) - SHINGLE_TOKENS + 1)
+    }
+    values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    hashed = (_PERM_A[:, None] * values[None, :] + _PERM_B[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def similarity(left: np.ndarray, right: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(left == right)) / NUM_PERM
+
+
+class DedupIndex:
+    """
+    Near-duplicate groups of chunks, found by MinHash + LSH over token
+    shingles. Only the group's stored chunk (the first one indexed) is
+    embedded and written to the vector store; the other members are
+    aliases that resolve to it. Members are [chunk_id, source, start_line,
+    end_line]; the first member is the primary whose location the stored
+    chunk's metadata shows, the rest are listed in `alternate_sources`.
+
+    A chunk never joins a group whose primary comes from the same file, so
+    editing a file re-embeds its chunks instead of aliasing the new text
+    to the old one.
+    """
+
+    def __init__(self, path: str | Path, threshold: float = 0.9):
+        self.path = Path(path)
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._groups: dict[str, list[list]] = {}
+        self._member_of: dict[str, str] = {}
+        self._signatures: dict[str, np.ndarray] = {}
+        self._buckets: dict[tuple[int, bytes], set[str]] | None = None
+        self._dirty: set[str] = set()
+        self._changed = False
+        self.load()
+
+    # --- lookups ---
+
+    def resolve(self, chunk_id: str) -> str:
+        """Id under which the chunk's vector is stored (itself unless it is an alias)."""
+        return self._member_of.get(chunk_id, chunk_id)
+
+    def member(self, chunk_id: str) -> list | None:
+        stored = self._member_of.get(chunk_id)
+        if stored is None:
+            return None
+        return next((m for m in self._groups[stored] if m[0] == chunk_id), None)
+
+    def group_metadata(self, stored_id: str) -> dict | None:
+        """Location metadata for the stored chunk: its primary member plus the alternates."""
+        members = self._groups.get(stored_id)
+        if not members:
+            return None
+        _, source, start_line, end_line = members[0]
+        metadata = {"source": source, "filename": os.path.basename(source)}
+        if start_line is not None:
+            metadata["start_line"] = start_line
+            metadata["end_line"] = end_line
+        alternates = dict.fromkeys(m[1] for m in members[1:] if m[1] != source)
+        metadata["alternate_sources"] = ", ".join(alternates)
+        return metadata
+
+    # --- updates ---
+
+    def add(self, chunk_id: str, text: str, source: str, start_line: int | None, end_line: int | None) -> str | None:
+        """
+        Registers a chunk about to be indexed. Returns the stored id it is
+        a near-duplicate of (the chunk must not be embedded), or None if it
+        starts its own group and has to be written.
+        """
+        with self._lock:
+            stored = self._member_of.get(chunk_id)
+            if stored is not None:
+                return stored if stored != chunk_id else None
+            record = [chunk_id, source, start_line, end_line]
+            if chunk_id in self._groups:
+                self._changed = True
+                # Вектор этого чанка всё ещё хранится (группу держали другие участники) — снова главный
+                self._groups[chunk_id].insert(0, record)
+                self._member_of[chunk_id] = chunk_id
+                self._dirty.add(chunk_id)
+                return None
+
+            signature = minhash_signature(text)
+            if signature is None:
+                return None
+            self._changed = True
+            best, best_score = None, self.threshold
+            for candidate in self._candidates(signature):
+                if self._groups[candidate][0][1] == source:
+                    continue
+                score = similarity(signature, self._signatures[candidate])
+                if score >= best_score:
+                    best, best_score = candidate, score
+            if best is not None:
+                self._groups[best].append(record)
+                self._member_of[chunk_id] = best
+                self._dirty.add(best)
+                return best
+
+            self._groups[chunk_id] = [record]
+            self._member_of[chunk_id] = chunk_id
+            self._signatures[chunk_id] = signature
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(chunk_id)
+            return None
+
+    def relocate(self, chunk_id: str, start_line: int | None, end_line: int | None) -> bool:
+        """
+        Updates a member's line range after its file shifted. Returns False
+        if the chunk is not in any group (its own metadata needs the update).
+        """
+        with self._lock:
+            member = self.member(chunk_id)
+            if member is None:
+                return False
+            if member[2:] != [start_line, end_line]:
+                member[2:] = [start_line, end_line]
+                self._changed = True
+                stored = self._member_of[chunk_id]
+                if self._groups[stored][0] is member:
+                    self._dirty.add(stored)
+            return True
+
+    def remove(self, chunk_ids) -> list[str]:
+        """
+        Drops chunks from their groups. Returns the ids whose vectors must
+        be deleted from the store: untracked chunks and groups left empty.
+        Groups that lost their primary promote the next member.
+        """
+        to_delete = []
+        with self._lock:
+            for chunk_id in chunk_ids:
+                stored = self._member_of.pop(chunk_id, None)
+                if stored is None:
+                    if chunk_id not in self._groups:
+                        to_delete.append(chunk_id)
+                    continue
+                self._changed = True
+                members = self._groups[stored]
+                members[:] = [m for m in members if m[0] != chunk_id]
+                if members:
+                    self._dirty.add(stored)
+                    continue
+                self._drop_group(stored)
+                to_delete.append(stored)
+        return to_delete
+
+    def take_dirty(self) -> list[str]:
+        """Stored ids whose membership changed since the last call (metadata needs a refresh)."""
+        with self._lock:
+            dirty = [stored for stored in self._dirty if stored in self._groups]
+            self._dirty = set()
+            return dirty
+
+    def clear(self):
+        with self._lock:
+            self._changed = bool(self._groups)
+            self._groups = {}
+            self._member_of = {}
+            self._signatures = {}
+            self._buckets = None
+            self._dirty = set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            members = len(self._member_of)
+            return {
+                "threshold": self.threshold,
+                "groups": len(self._groups),
+                "chunks": members,
+                # У каждой группы ровно один вектор в хранилище
+                "collapsed": members - len(self._groups),
+                "largest_group": max((len(group) for group in self._groups.values()), default=0),
+            }
+
+    # --- LSH ---
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(BANDS):
+            yield band, signature[band * ROWS : (band + 1) * ROWS].tobytes()
+
+    def _candidates(self, signature: np.ndarray) -> set[str]:
+        if self._buckets is None:
+            # Корзины нужны только при индексации — строим при первом добавлении
+            self._buckets = {}
+            for stored, stored_signature in self._signatures.items():
+                for key in self._band_keys(stored_signature):
+                    self._buckets.setdefault(key, set()).add(stored)
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self._buckets.get(key, set())
+        return candidates
+
+    def _drop_group(self, stored: str):
+        del self._groups[stored]
+        signature = self._signatures.pop(stored, None)
+        if signature is not None and self._buckets is not None:
+            for key in self._band_keys(signature):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(stored)
+                    if not bucket:
+                        del self._buckets[key]
+        self._dirty.discard(stored)
+
+    # --- persistence ---
+
+    def load(self):
+        """(Re)reads the saved state, discarding unsaved changes."""
+        with self._lock:
+            self.clear()
+            self._changed = False
+            try:
+                with np.load(self.path, allow_pickle=False) as data:
+                    stored_ids = data["stored_ids"].tolist()
+                    signatures = data["signatures"]
+                    groups = json.loads(str(data["groups"]))
+            except (OSError, KeyError, ValueError):
+                return
+            self._signatures = dict(zip(stored_ids, signatures))
+            self._groups = groups
+            for stored, members in groups.items():
+                for member in members:
+                    self._member_of[member[0]] = stored
+
+    def discard_unsaved(self):
+        """Rolls back to the saved state, e.g. after an indexing run failed midway."""
+        with self._lock:
+            if self._changed:
+                self.load()
+
+    def save(self):
+        with self._lock:
+            if not self._changed:
+                return
+            stored_ids = list(self._signatures)
+            signatures = (
+                np.stack([self._signatures[stored] for stored in stored_ids])
+                if stored_ids else np.zeros((0, NUM_PERM), dtype=np.uint32)
+            )
+            tmp_path = self.path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_path,
+                stored_ids=np.asarray(stored_ids, dtype=str),
+                signatures=signatures,
+                groups=np.asarray(json.dumps(self._groups, ensure_ascii=False)),
+            )
+            os.replace(tmp_path, self.path)
+            self._changed = False
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+KEY_BYTES = 16
+INITIAL_CAPACITY = 1024
+
+
+def normalize_text(text: str) -> str:
+    return text.replace("\r\n", "\n").strip()
+
+
+def cache_key(model: str, text: str) -> bytes:
+    """Hash of (model, normalized text)."""
+    return hashlib.blake2b(
+        f"{model}\0{normalize_text(text)}".encode("utf-8"), digest_size=KEY_BYTES
+    ).digest()
+
+
+class EmbeddingCache:
+    """
+    Size-bounded on-disk LRU cache of embeddings for one model.
+
+    Vectors live in a memory-mapped float32 matrix; keys and last-use
+    ticks live in parallel memory-mapped arrays, so lookups and writes
+    touch only the affected slots and nothing has to be re-serialized.
+    A slot with tick 0 is empty.
+    """
+
+    def __init__(self, cache_dir: str | Path, model: str, max_entries: int):
+        self.model = model
+        self.max_entries = max(1, max_entries)
+        self.dir = Path(cache_dir) / re.sub(r"[^A-Za-z0-9._-]", "_", model)
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._dim = None
+        self._capacity = 0
+        self._vectors = None
+        self._keys = None
+        self._ticks = None
+        self._slots: dict[bytes, int] = {}
+        self._free: list[int] = []
+        self._tick = 0
+        self._load()
+
+    # --- public API ---
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """Returns cached vectors (or None) for each text, updating recency."""
+        results = []
+        with self._lock:
+            for text in texts:
+                slot = self._slots.get(cache_key(self.model, text))
+                if slot is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self.hits += 1
+                self._tick += 1
+                self._ticks[slot] = self._tick
+                results.append(self._vectors[slot].tolist())
+        return results
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        if not texts:
+            return
+        with self._lock:
+            if self._dim is None:
+                self._init_storage(len(vectors[0]))
+            elif len(vectors[0]) != self._dim:
+                # Размерность поменялась (другая версия модели) — кэш невалиден
+                self._reset(len(vectors[0]))
+
+            for text, vector in zip(texts, vectors):
+                key = cache_key(self.model, text)
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._allocate_slot()
+                    self._slots[key] = slot
+                    self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._vectors[slot] = vector
+                self._tick += 1
+                self._ticks[slot] = self._tick
+
+    def flush(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._keys.flush()
+                self._ticks.flush()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model,
+            "entries": len(self._slots),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    # --- storage ---
+
+    def _paths(self):
+        return (
+            self.dir / "meta.json",
+            self.dir / "vectors.f32",
+            self.dir / "keys.bin",
+            self.dir / "ticks.i64",
+        )
+
+    def _load(self):
+        meta_path, vectors_path, keys_path, ticks_path = self._paths()
+        if not meta_path.exists():
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._dim = meta["dim"]
+            self._capacity = meta["capacity"]
+            self._open_maps()
+        except (OSError, ValueError, KeyError):
+            self._dim = None
+            self._capacity = 0
+            return
+
+        occupied = np.nonzero(self._ticks)[0]
+        self._slots = {bytes(self._keys[slot]): int(slot) for slot in occupied}
+        self._free = sorted(set(range(self._capacity)) - set(occupied.tolist()), reverse=True)
+        self._tick = int(self._ticks.max()) if self._capacity else 0
+
+    def _open_maps(self):
+        _, vectors_path, keys_path, ticks_path = self._paths()
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(self._capacity, self._dim))
+        self._keys = np.memmap(keys_path, dtype=np.uint8, mode="r+", shape=(self._capacity, KEY_BYTES))
+        self._ticks = np.memmap(ticks_path, dtype=np.int64, mode="r+", shape=(self._capacity,))
+
+    def _write_meta(self):
+        meta_path = self._paths()[0]
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "capacity": self._capacity, "model": self.model}, f)
+
+    def _resize_files(self, capacity: int):
+        _, vectors_path, keys_path, ticks_path = self._paths()
+        for path, row_bytes in (
+            (vectors_path, self._dim * 4),
+            (keys_path, KEY_BYTES),
+            (ticks_path, 8),
+        ):
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+
+    def _init_storage(self, dim: int):
+        self._dim = dim
+        self._capacity = min(INITIAL_CAPACITY, self.max_entries)
+        self._resize_files(self._capacity)
+        self._open_maps()
+        self._free = list(range(self._capacity - 1, -1, -1))
+        self._write_meta()
+
+    def _reset(self, dim: int):
+        self._close_maps()
+        for path in self._paths()[1:]:
+            path.unlink(missing_ok=True)
+        self._slots = {}
+        self._tick = 0
+        self._init_storage(dim)
+
+    def _close_maps(self):
+        for array in (self._vectors, self._keys, self._ticks):
+            if array is not None:
+                array.flush()
+        self._vectors = self._keys = self._ticks = None
+
+    def _grow(self) -> bool:
+        if self._capacity >= self.max_entries:
+            return False
+        old_capacity = self._capacity
+        self._close_maps()
+        self._capacity = min(self._capacity * 2, self.max_entries)
+        self._resize_files(self._capacity)
+        self._open_maps()
+        self._free.extend(range(self._capacity - 1, old_capacity - 1, -1))
+        self._write_meta()
+        return True
+
+    def _allocate_slot(self) -> int:
+        if not self._free and not self._grow():
+            self._evict()
+        return self._free.pop()
+
+    def _evict(self):
+        # Выкидываем ~1% самых давно использованных записей за раз,
+        # чтобы не сканировать массив на каждую вставку
+        count = max(1, self._capacity // 100)
+        victims = np.argpartition(self._ticks, count - 1)[:count]
+        for slot in victims.tolist():
+            self._slots.pop(bytes(self._keys[slot]), None)
+            self._ticks[slot] = 0
+            self._free.append(slot)
+        self.evictions += len(victims)
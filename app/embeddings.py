@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+from app.metrics import metrics
+
+
+class EmbeddingError(RuntimeError):
+    """Raised when Ollama cannot produce embeddings after all retries."""
+
+
+# Статусы, при которых имеет смысл повторить запрос
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class OllamaEmbedder:
+    """
+    Batched embedding client for Ollama's /api/embed endpoint.
+
+    Keeps one pooled keep-alive session, sends texts in batches and runs
+    at most `concurrency` requests at once.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str | None = None,
+        batch_size: int | None = None,
+        concurrency: int | None = None,
+        max_retries: int | None = None,
+        retry_backoff: float | None = None,
+        timeout: float | None = None,
+    ):
+        self.model = model
+        self.base_url = (base_url or settings.ollama_url).rstrip("/")
+        self.batch_size = max(1, batch_size or settings.embed_batch_size)
+        self.concurrency = max(1, concurrency or settings.embed_concurrency)
+        self.max_retries = settings.embed_max_retries if max_retries is None else max_retries
+        self.retry_backoff = settings.embed_retry_backoff if retry_backoff is None else retry_backoff
+        self.timeout = timeout or settings.embed_timeout
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="ollama-embed"
+        )
+
+    def embed(self, text: str) -> list[float]:
+        """Embeds a single text."""
+        return self._post_batch([text])[0]
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds a list of texts, preserving order.
+        Batches are sent concurrently, bounded by the executor size.
+        """
+        if not texts:
+            return []
+
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) == 1:
+            return self._post_batch(batches[0])
+
+        embeddings = []
+        for batch_embeddings in self._executor.map(self._post_batch, batches):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def _post_batch(self, batch: list[str]) -> list[list[float]]:
+        url = f"{self.base_url}/api/embed"
+        payload = {"model": self.model, "input": batch}
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.span("ollama.embed"):
+                    response = self._session.post(url, json=payload, timeout=self.timeout)
+                if response.status_code in RETRYABLE_STATUSES:
+                    raise requests.HTTPError(
+                        f"{response.status_code} from Ollama: {response.text[:200]}",
+                        response=response,
+                    )
+                response.raise_for_status()
+                embeddings = response.json()["embeddings"]
+                if len(embeddings) != len(batch):
+                    metrics.inc("ollama.errors")
+                    metrics.inc("ollama.embed.failures")
+                    raise EmbeddingError(
+                        f"Ollama returned {len(embeddings)} embeddings for {len(batch)} inputs"
+                    )
+                return embeddings
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in RETRYABLE_STATUSES:
+                    metrics.inc("ollama.errors")
+                    metrics.inc("ollama.embed.failures")
+                    raise EmbeddingError(f"Ollama embedding request failed: {e}") from e
+                last_error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+
+            metrics.inc("ollama.errors")
+            if attempt < self.max_retries:
+                metrics.inc("ollama.embed.retries")
+                # Экспоненциальная задержка с джиттером
+                delay = self.retry_backoff * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay / 2))
+
+        metrics.inc("ollama.embed.failures")
+        raise EmbeddingError(
+            f"Ollama embedding failed after {self.max_retries + 1} attempts: {last_error}. "
+            "Please ensure Ollama is running and the model is available."
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+
+_embedders: dict[str, OllamaEmbedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model: str) -> OllamaEmbedder:
+    """Returns the shared embedder for a model, creating it on first use."""
+    with _embedders_lock:
+        embedder = _embedders.get(model)
+        if embedder is None:
+            embedder = OllamaEmbedder(model)
+            _embedders[model] = embedder
+        return embedder
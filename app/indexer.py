@@ -0,0 +1,395 @@
+import logging
+import os
+import threading
+import time
+
+from app.chunker import chunk_file, is_indexable, iter_project_files, map_files
+from app.config import settings
+from app.ingest import check_file, estimate_seconds_saved, format_skip_report, new_skip_report, record_skip, size_limit
+from app.manifest import IndexManifest, assign_chunk_ids, hash_bytes, hash_file
+from app.metrics import metrics
+from app.symbols import symbol_entries
+
+# stdout занят JSON-RPC (MCP по stdio) — пишем только в лог (stderr)
+logger = logging.getLogger("vox-brain")
+
+
+def manifest_path_for(vector_store) -> str:
+    return vector_store.backend_file("manifest.json")
+
+
+_write_locks: dict[str, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+
+
+def project_write_lock(root_path: str) -> threading.Lock:
+    """Serializes writers (index jobs, the file watcher) of one project's store."""
+    key = os.path.abspath(root_path)
+    with _write_locks_guard:
+        lock = _write_locks.get(key)
+        if lock is None:
+            lock = _write_locks[key] = threading.Lock()
+        return lock
+
+
+def _load_file(args):
+    """
+    Pool worker: applies the ingestion policy, then reads, hashes and
+    chunks one file. Returns (sha256, chunks, read_seconds, split_seconds,
+    skip_reason), None on read errors and chunks=None if the hash is
+    unchanged. Files over ingest_stream_bytes are hashed and chunked in
+    blocks instead of being read whole. Invalid UTF-8 anywhere in the file
+    is reported as a "binary" skip.
+    """
+    full_path, root_path, known_sha256, size = args
+    relative_path = os.path.relpath(full_path, root_path)
+    start = time.perf_counter()
+    try:
+        reason = check_file(full_path, size)
+        if reason is not None:
+            return "", [], time.perf_counter() - start, 0.0, reason
+        if size > settings.ingest_stream_bytes:
+            sha256 = hash_file(full_path)
+            raw = None
+        else:
+            with open(full_path, "rb") as f:
+                raw = f.read()
+            sha256 = hash_bytes(raw)
+    except OSError as e:
+        logger.warning(f"⚠️ Ошибка чтения {relative_path}: {e}")
+        return None
+
+    read_seconds = time.perf_counter() - start
+    if sha256 == known_sha256:
+        return sha256, None, read_seconds, 0.0, None
+
+    # Невалидный UTF-8 дальше выборки sniff: файл бинарный, уже нарезанные окна выбрасываем
+    if raw is None:
+        start = time.perf_counter()
+        try:
+            chunks = chunk_file(full_path, root_path)
+        except UnicodeDecodeError:
+            return "", [], read_seconds, 0.0, "binary"
+        return sha256, chunks, read_seconds, time.perf_counter() - start, None
+
+    try:
+        content = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return "", [], read_seconds, 0.0, "binary"
+
+    start = time.perf_counter()
+    chunks = chunk_file(full_path, root_path, content=content)
+    return sha256, chunks, read_seconds, time.perf_counter() - start, None
+
+
+def iter_changed_files(
+    root_path: str,
+    manifest: IndexManifest,
+    stats: dict,
+    seen_paths: set,
+    workers: int | None = None,
+    paths=None,
+):
+    """
+    Lazily yields (relative_path, file_state, chunks, chunk_ids) for files
+    that differ from the manifest. Unchanged files are only counted.
+    `paths` limits the check to these files (default: the whole project).
+    Reading and chunking run on a process pool (see chunker.map_files).
+    Files rejected by the ingestion policy (app.ingest) are yielded with
+    no chunks, so they are recorded in the manifest and any chunks they
+    had are dropped; they are counted in the stats' skip report.
+    """
+    candidates = []
+    candidate_stats = []
+    skipped = []
+    with metrics.span("index.walk"):
+        for full_path in (iter_project_files(root_path) if paths is None else paths):
+            relative_path = os.path.relpath(full_path, root_path)
+            seen_paths.add(relative_path)
+            stats["files_seen"] += 1
+
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+
+            entry = manifest.get(relative_path)
+            if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+                stats["files_unchanged"] += 1
+                continue
+
+            # Лимит размера проверяем по stat — такой файл даже не открываем
+            limit = size_limit(os.path.splitext(relative_path)[1])
+            if limit and st.st_size > limit:
+                skipped.append((relative_path, st.st_mtime, st.st_size, "too_large"))
+                continue
+
+            candidates.append((full_path, root_path, entry["sha256"] if entry else None, st.st_size))
+            candidate_stats.append((relative_path, st.st_mtime, st.st_size))
+
+    for relative_path, mtime, size, reason in skipped:
+        record_skip(stats, reason, size)
+        yield relative_path, (mtime, size, ""), [], []
+
+    results = map_files(_load_file, candidates, workers)
+    for (relative_path, mtime, size), result in zip(candidate_stats, results):
+        if result is None:
+            continue
+
+        sha256, chunks, read_seconds, split_seconds, reason = result
+        metrics.observe("index.read", read_seconds)
+        if reason is not None:
+            record_skip(stats, reason, size)
+            yield relative_path, (mtime, size, sha256), [], []
+            continue
+        if chunks is None:
+            # Файл "тронули", но содержимое то же самое
+            entry = manifest.get(relative_path)
+            manifest.record(relative_path, mtime, size, sha256, entry["chunk_ids"], entry.get("lines"))
+            stats["files_unchanged"] += 1
+            continue
+
+        metrics.observe("index.split", split_seconds)
+        stats["bytes_read"] += size
+        yield relative_path, (mtime, size, sha256), chunks, assign_chunk_ids(chunks)
+
+
+class _BatchWriter:
+    """
+    Buffers chunks of changed files and commits them to the store in
+    fixed-size batches. A file is recorded in the manifest only after
+    all of its chunks have been written, so an interrupted run resumes
+    from the last committed batch.
+    """
+
+    def __init__(
+        self, vector_store, manifest: IndexManifest, model: str, batch_size: int, stats: dict, progress=None
+    ):
+        self.vector_store = vector_store
+        self.manifest = manifest
+        self.model = model
+        self.batch_size = batch_size
+        self.stats = stats
+        self.progress = progress
+        self.docs = []
+        self.ids = []
+        self.stale_ids = []
+        self.moved = {}
+        self.files = []
+
+    def add_file(self, relative_path: str, file_state: tuple, chunks: list, chunk_ids: list[str]):
+        entry = self.manifest.get(relative_path)
+        old_ids = set(entry["chunk_ids"]) if entry else set()
+        old_lines = self.manifest.chunk_lines(relative_path)
+        lines = [[chunk.metadata.get("start_line"), chunk.metadata.get("end_line")] for chunk in chunks]
+
+        for chunk, chunk_id, chunk_lines in zip(chunks, chunk_ids, lines):
+            if chunk_id in old_ids:
+                # Текст тот же, но строки выше могли добавить или удалить — обновляем только диапазон
+                if chunk_lines[0] is not None and old_lines.get(chunk_id) != chunk_lines:
+                    self.moved[chunk_id] = tuple(chunk_lines)
+                continue
+            if settings.dedup_enabled and self._is_duplicate(chunk, chunk_id):
+                continue
+            self.docs.append(chunk)
+            self.ids.append(chunk_id)
+        self.stale_ids.extend(old_ids - set(chunk_ids))
+        self.files.append((relative_path, file_state, chunk_ids, lines, symbol_entries(chunks, chunk_ids)))
+
+        if len(self.docs) >= self.batch_size:
+            self.flush()
+
+    def _is_duplicate(self, chunk, chunk_id: str) -> bool:
+        """Registers the chunk with the dedup index; True if it only aliases a stored chunk."""
+        metadata = chunk.metadata
+        stored_id = self.vector_store.dedup.add(
+            chunk_id, chunk.page_content, metadata["source"], metadata.get("start_line"), metadata.get("end_line")
+        )
+        if stored_id is None:
+            return False
+        self.stats["chunks_deduplicated"] += 1
+        return True
+
+    def flush(self):
+        for i in range(0, len(self.docs), self.batch_size):
+            self.vector_store.upsert_documents(
+                self.docs[i : i + self.batch_size], self.ids[i : i + self.batch_size], self.model
+            )
+        if self.docs:
+            self.vector_store.flush_embeddings()
+        if self.stale_ids:
+            self.vector_store.delete_ids(self.stale_ids)
+        if self.moved:
+            self.vector_store.relocate(self.moved)
+        self.vector_store.refresh_duplicates()
+
+        for relative_path, (mtime, size, sha256), chunk_ids, lines, entries in self.files:
+            self.manifest.record(relative_path, mtime, size, sha256, chunk_ids, lines)
+            self.vector_store.symbols.update_file(relative_path, entries)
+        self.manifest.save()
+        self.vector_store.dedup.save()
+        if self.files:
+            self.vector_store.symbols.save()
+
+        self.stats["files_changed"] += len(self.files)
+        self.stats["chunks_embedded"] += len(self.docs)
+        self.stats["chunks_deleted"] += len(self.stale_ids)
+        self.stats["chunks_relocated"] += len(self.moved)
+        if self.docs:
+            logger.info(f"  Committed {self.stats['chunks_embedded']} chunks ({self.stats['files_changed']} files)")
+        if self.progress:
+            self.progress({"phase": "indexing", **self.stats})
+
+        self.docs = []
+        self.ids = []
+        self.stale_ids = []
+        self.moved = {}
+        self.files = []
+
+
+def index_project_incremental(
+    root_path: str,
+    vector_store,
+    model: str,
+    full: bool = False,
+    batch_size: int | None = None,
+    workers: int | None = None,
+    progress=None,
+) -> dict:
+    """
+    Brings the vector store in sync with the project on disk.
+
+    Files are discovered and chunked lazily and written in fixed-size
+    batches, so memory stays bounded. Only files whose mtime/size/content
+    hash changed are re-chunked, and only chunks whose content-derived id
+    is new are embedded. Chunks of deleted files are removed. With
+    full=True the collection is rebuilt. `progress`, if given, is called
+    with a stats dict after every committed batch.
+    """
+    started = time.perf_counter()
+    manifest = IndexManifest(manifest_path_for(vector_store))
+    # Группы дубликатов, не дошедшие до диска (прерванный прогон), описывают незаписанные чанки
+    vector_store.dedup.discard_unsaved()
+
+    # Без манифеста мы не знаем, что лежит в коллекции (например, старые doc_{i}),
+    # а устаревший манифест описывает чанки старой нарезки — начинаем с чистого листа.
+    # Таблицу символов без файла восстановить неоткуда (её общий файл мог описывать другой бэкенд)
+    needs_reset = manifest.outdated or (
+        not manifest.exists() and vector_store.get_stats()["total_items"] > 0
+    ) or (bool(manifest.files) and not os.path.exists(vector_store.backend_file("symbols.json")))
+    if full or needs_reset:
+        vector_store.reset()
+        manifest.clear()
+        manifest.save()
+
+    # Лексический индекс должен содержать ровно те чанки, что записаны в манифест
+    vector_store.sync_lexical(
+        {chunk_id for entry in manifest.files.values() for chunk_id in entry["chunk_ids"]}
+    )
+
+    stats = _new_stats()
+
+    seen_paths = set()
+    writer = _BatchWriter(
+        vector_store, manifest, model, batch_size or settings.index_batch_size, stats, progress
+    )
+
+    for relative_path, file_state, chunks, chunk_ids in iter_changed_files(
+        root_path, manifest, stats, seen_paths, workers
+    ):
+        writer.add_file(relative_path, file_state, chunks, chunk_ids)
+        logger.info(f"✅ Обработан: {relative_path} -> {len(chunks)} чанков")
+    writer.flush()
+
+    _remove_files(manifest.paths() - seen_paths, vector_store, manifest, stats)
+    return _finish(vector_store, manifest, stats, started, progress)
+
+
+def _new_stats() -> dict:
+    return {
+        "files_seen": 0,
+        "files_changed": 0,
+        "files_unchanged": 0,
+        "files_removed": 0,
+        "chunks_embedded": 0,
+        "chunks_deduplicated": 0,
+        "chunks_deleted": 0,
+        "chunks_relocated": 0,
+        "bytes_read": 0,
+        **new_skip_report(),
+    }
+
+
+def _remove_files(relative_paths, vector_store, manifest: IndexManifest, stats: dict):
+    """Drops files that are gone from disk: their chunks, symbols and manifest entries."""
+    removed_ids = []
+    for relative_path in relative_paths:
+        removed_ids.extend(manifest.remove(relative_path))
+        vector_store.symbols.remove_file(relative_path)
+        stats["files_removed"] += 1
+    if removed_ids:
+        vector_store.delete_ids(removed_ids)
+        stats["chunks_deleted"] += len(removed_ids)
+
+
+def _finish(vector_store, manifest: IndexManifest, stats: dict, started: float, progress=None) -> dict:
+    manifest.save()
+    vector_store.save_lexical()
+    vector_store.dedup.save()
+    if stats["files_removed"]:
+        vector_store.symbols.save()
+
+    stats["total_items"] = vector_store.get_stats()["total_items"]
+    stats["seconds_saved"] = estimate_seconds_saved(stats, stats["bytes_read"], time.perf_counter() - started)
+    if stats["files_skipped"]:
+        logger.info(format_skip_report(stats))
+    for key in (
+        "files_changed", "files_removed", "files_skipped",
+        "chunks_embedded", "chunks_deduplicated", "chunks_deleted", "chunks_relocated", "bytes_skipped",
+    ):
+        metrics.inc(f"index.{key}", stats[key])
+    if progress:
+        progress({"phase": "done", **stats})
+    return stats
+
+
+def update_files(
+    root_path: str,
+    vector_store,
+    model: str,
+    relative_paths,
+    batch_size: int | None = None,
+    progress=None,
+) -> dict:
+    """
+    Applies changes of the given files only (e.g. from the file watcher):
+    changed files are re-chunked and upserted, missing ones are removed.
+    Falls back to a full incremental sync when the store has no usable
+    manifest yet.
+    """
+    manifest = IndexManifest(manifest_path_for(vector_store))
+    if manifest.outdated or not manifest.exists():
+        return index_project_incremental(root_path, vector_store, model, batch_size=batch_size, progress=progress)
+    vector_store.dedup.discard_unsaved()
+
+    started = time.perf_counter()
+    stats = _new_stats()
+    present, removed = [], []
+    for relative_path in sorted(set(relative_paths)):
+        full_path = os.path.join(root_path, relative_path)
+        if is_indexable(relative_path) and os.path.isfile(full_path):
+            present.append(full_path)
+        elif manifest.get(relative_path):
+            removed.append(relative_path)
+
+    writer = _BatchWriter(
+        vector_store, manifest, model, batch_size or settings.index_batch_size, stats, progress
+    )
+    for relative_path, file_state, chunks, chunk_ids in iter_changed_files(
+        root_path, manifest, stats, set(), workers=1, paths=present
+    ):
+        writer.add_file(relative_path, file_state, chunks, chunk_ids)
+    writer.flush()
+
+    _remove_files(removed, vector_store, manifest, stats)
+    return _finish(vector_store, manifest, stats, started, progress)
@@ -0,0 +1,137 @@
+import os
+
+from app.config import settings
+
+
+# Маркеры сгенерированных файлов (protoc, openapi-generator, sqlc, go generate и т.п.)
+GENERATED_MARKERS = (
+    "@generated",
+    "auto-generated",
+    "autogenerated",
+    "code generated by",
+    "this file was generated",
+    "this file is generated",
+)
+# "DO NOT EDIT" встречается и в рукописных доках/конфигах ("do not edit this section manually"):
+# считается маркером только вместе со словом "generated" в шапке
+WEAK_GENERATED_MARKERS = ("do not edit",)
+# Маркер ищем только в шапке файла: в обычном коде эти слова встречаются в строках и комментариях
+GENERATED_HEADER_LINES = 20
+# Минифицированный код: строки длиннее этого при средней длине больше MINIFIED_AVG_LINE
+MINIFIED_MAX_LINE = 1000
+MINIFIED_AVG_LINE = 300
+# Доля управляющих символов, после которой файл считается бинарным
+BINARY_CONTROL_RATIO = 0.1
+_TEXT_CONTROLS = {7, 8, 9, 10, 12, 13, 27}
+
+
+def size_limit(file_ext: str) -> int:
+    """Max size in bytes for files with this extension (0 = no limit)."""
+    return settings.ingest_size_limits.get(file_ext, settings.ingest_max_bytes)
+
+
+def sniff(head: bytes, filename: str) -> str | None:
+    """
+    Classifies a file by its first bytes. Returns the skip reason
+    ("binary", "minified", "generated") or None for a normal text file.
+    """
+    if not head:
+        return None
+    if b"\0" in head:
+        return "binary"
+    try:
+        text = head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Многобайтовый символ мог обрезаться на границе выборки
+        if e.start < len(head) - 3:
+            return "binary"
+        text = head[: e.start].decode("utf-8")
+    controls = sum(1 for byte in head if byte < 32 and byte not in _TEXT_CONTROLS)
+    if controls > len(head) * BINARY_CONTROL_RATIO:
+        return "binary"
+
+    if not settings.ingest_skip_generated:
+        return None
+    if ".min." in filename:
+        return "minified"
+    lines = text.splitlines() or [""]
+    # В markdown абзац часто занимает одну длинную строку — это не минификация
+    if (
+        not filename.endswith(".md")
+        and max(len(line) for line in lines) > MINIFIED_MAX_LINE
+        and len(text) / len(lines) > MINIFIED_AVG_LINE
+    ):
+        return "minified"
+    header = "\n".join(lines[:GENERATED_HEADER_LINES]).lower()
+    if any(marker in header for marker in GENERATED_MARKERS):
+        return "generated"
+    if "generated" in header and any(marker in header for marker in WEAK_GENERATED_MARKERS):
+        return "generated"
+    return None
+
+
+def check_file(full_path: str, size: int) -> str | None:
+    """
+    Applies the ingestion policy to a file before it is read whole.
+    Returns the skip reason ("too_large", "binary", "minified",
+    "generated") or None if the file should be indexed.
+    """
+    filename = os.path.basename(full_path)
+    limit = size_limit(os.path.splitext(filename)[1])
+    if limit and size > limit:
+        return "too_large"
+    with open(full_path, "rb") as f:
+        head = f.read(settings.ingest_sample_bytes)
+    return sniff(head, filename)
+
+
+def iter_text_windows(full_path: str, window_bytes: int):
+    """
+    Reads a UTF-8 text file in windows of whole lines of about
+    `window_bytes`. Yields (text, first_line). Raises UnicodeDecodeError
+    on invalid UTF-8.
+    """
+    lines, size, first_line = [], 0, 1
+    with open(full_path, "rb") as f:
+        for number, line in enumerate(f, start=1):
+            if not lines:
+                first_line = number
+            lines.append(line)
+            size += len(line)
+            if size >= window_bytes:
+                yield b"".join(lines).decode("utf-8"), first_line
+                lines, size = [], 0
+    if lines:
+        yield b"".join(lines).decode("utf-8"), first_line
+
+
+def new_skip_report() -> dict:
+    return {"files_skipped": 0, "bytes_skipped": 0, "skipped": {}}
+
+
+def record_skip(report: dict, reason: str, size: int):
+    """Counts a skipped file in a stats dict (see new_skip_report)."""
+    report["files_skipped"] += 1
+    report["bytes_skipped"] += size
+    by_reason = report["skipped"].setdefault(reason, {"files": 0, "bytes": 0})
+    by_reason["files"] += 1
+    by_reason["bytes"] += size
+
+
+def estimate_seconds_saved(report: dict, bytes_read: int, seconds: float) -> float:
+    """Skipped bytes priced at this run's indexing cost per byte read."""
+    if not bytes_read or not report["bytes_skipped"]:
+        return 0.0
+    return round(report["bytes_skipped"] * seconds / bytes_read, 2)
+
+
+def format_skip_report(report: dict) -> str:
+    parts = [
+        f"{reason}: {counts['files']} files, {counts['bytes'] / (1024 * 1024):.2f} MB"
+        for reason, counts in sorted(report["skipped"].items())
+    ]
+    return (
+        f"⏭️ Skipped {report['files_skipped']} files "
+        f"({report['bytes_skipped'] / (1024 * 1024):.2f} MB, ~{report.get('seconds_saved', 0.0)}s saved): "
+        + "; ".join(parts)
+    )
@@ -0,0 +1,97 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class Job:
+    """A background task with polled progress."""
+
+    def __init__(self, kind: str, key: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.status = "queued"
+        self.progress: dict = {}
+        self.result = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.future: Future | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "elapsed_s": round(end - self.started_at, 3) if self.started_at else 0.0,
+        }
+
+
+class JobManager:
+    """
+    Runs long operations (indexing) on a small thread pool so the MCP event
+    loop stays responsive. At most one active job per key (e.g. project path).
+    """
+
+    def __init__(self, max_workers: int, max_finished: int = 50):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-job")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._max_finished = max_finished
+
+    def submit(self, kind: str, key: str, func, *args, **kwargs) -> Job:
+        """
+        Starts func(*args, progress=callback, **kwargs) in the background.
+        Returns the already running job if one is active for the same key.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and job.key == key and job.active:
+                    return job
+
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            self._prune()
+
+        def progress(update: dict):
+            job.progress = dict(update)
+
+        def run():
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = func(*args, progress=progress, **kwargs)
+                job.status = "done"
+                return job.result
+            except Exception as e:
+                job.error = f"{e}\n{traceback.format_exc(limit=5)}"
+                job.status = "failed"
+                raise
+            finally:
+                job.finished_at = time.time()
+
+        job.future = self._executor.submit(run)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+    def _prune(self):
+        finished = [job for job in self.jobs() if not job.active]
+        for job in finished[: max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job.id]
@@ -0,0 +1,213 @@
+import math
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from app.tokens import tokenize
+
+
+class LexicalIndex:
+    """
+    BM25 index over code tokens, stored next to the Chroma collection.
+
+    The forward index (doc -> term ids/frequencies) lives in flat numpy
+    arrays with per-doc offsets; postings (term -> docs) are derived from
+    it with one argsort whenever the index changed. Added documents are
+    buffered and merged in bulk, removed ones are tombstoned and dropped
+    on the next compaction.
+    """
+
+    def __init__(self, path: str | Path, k1: float = 1.2, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset_arrays()
+        self._load()
+
+    def _reset_arrays(self):
+        self._terms: list[str] = []
+        self._vocab: dict[str, int] = {}
+        self._doc_ids: list[str] = []
+        self._doc_index: dict[str, int] = {}
+        self._fwd_terms = np.zeros(0, dtype=np.uint32)
+        self._fwd_tf = np.zeros(0, dtype=np.uint32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._pending: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._postings_docs = None
+        self._postings_tf = None
+        self._postings_offsets = None
+        self._dirty = False
+
+    # --- updates ---
+
+    def add(self, chunk_id: str, text: str):
+        counts: dict[int, int] = {}
+        with self._lock:
+            for token in tokenize(text):
+                term_id = self._vocab.get(token)
+                if term_id is None:
+                    term_id = len(self._terms)
+                    self._vocab[token] = term_id
+                    self._terms.append(token)
+                counts[term_id] = counts.get(term_id, 0) + 1
+            self._remove_committed(chunk_id)
+            self._pending[chunk_id] = (
+                np.fromiter(counts.keys(), dtype=np.uint32, count=len(counts)),
+                np.fromiter(counts.values(), dtype=np.uint32, count=len(counts)),
+            )
+            self._dirty = True
+
+    def remove(self, chunk_id: str):
+        with self._lock:
+            self._pending.pop(chunk_id, None)
+            self._remove_committed(chunk_id)
+
+    def clear(self):
+        with self._lock:
+            self._reset_arrays()
+            self._dirty = True
+
+    def ids(self) -> set[str]:
+        with self._lock:
+            return {doc_id for doc_id in self._doc_index if self._alive[self._doc_index[doc_id]]} | set(self._pending)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._alive.sum()) + len(self._pending)
+
+    def _remove_committed(self, chunk_id: str):
+        idx = self._doc_index.pop(chunk_id, None)
+        if idx is not None:
+            self._alive[idx] = False
+            self._dirty = True
+
+    # --- search ---
+
+    def search(self, query: str, n_results: int = 10) -> list[tuple[str, float]]:
+        """Returns [(chunk_id, bm25_score)] best first."""
+        with self._lock:
+            self._materialize()
+            n_docs = len(self._doc_ids)
+            alive_count = int(self._alive.sum())
+            if alive_count == 0:
+                return []
+
+            term_ids = {self._vocab[t] for t in tokenize(query) if t in self._vocab}
+            if not term_ids:
+                return []
+
+            avg_len = float(self._doc_len[self._alive].mean()) or 1.0
+            norm = self.k1 * (1 - self.b + self.b * self._doc_len / avg_len)
+            scores = np.zeros(n_docs, dtype=np.float32)
+
+            for term_id in term_ids:
+                start, end = self._postings_offsets[term_id], self._postings_offsets[term_id + 1]
+                if start == end:
+                    continue
+                docs = self._postings_docs[start:end]
+                tf = self._postings_tf[start:end].astype(np.float32)
+                df = end - start
+                idf = math.log(1 + (alive_count - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+            scores[~self._alive] = 0
+            hits = np.nonzero(scores)[0]
+            if len(hits) > n_results:
+                hits = hits[np.argpartition(scores[hits], -n_results)[-n_results:]]
+            hits = hits[np.argsort(scores[hits])[::-1]]
+            return [(self._doc_ids[i], float(scores[i])) for i in hits]
+
+    def _materialize(self):
+        """Merges pending docs, compacts tombstones and rebuilds postings."""
+        if not self._dirty and self._postings_offsets is not None:
+            return
+
+        keep = np.nonzero(self._alive)[0]
+        lengths = np.diff(self._offsets)[keep]
+        if len(keep) < len(self._doc_ids):
+            # Компактификация: выбрасываем удалённые документы
+            new_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            shift = np.repeat(self._offsets[keep] - new_starts, lengths)
+            positions = np.arange(int(lengths.sum()), dtype=np.int64) + shift
+            self._fwd_terms = self._fwd_terms[positions]
+            self._fwd_tf = self._fwd_tf[positions]
+            self._doc_ids = [self._doc_ids[i] for i in keep]
+
+        pending_ids = list(self._pending)
+        pending = [self._pending[doc_id] for doc_id in pending_ids]
+        self._doc_ids.extend(pending_ids)
+        self._fwd_terms = np.concatenate([self._fwd_terms] + [terms for terms, _ in pending])
+        self._fwd_tf = np.concatenate([self._fwd_tf] + [tf for _, tf in pending])
+        all_lengths = np.concatenate([lengths, np.array([len(terms) for terms, _ in pending], dtype=np.int64)])
+        self._offsets = np.concatenate(([0], np.cumsum(all_lengths))).astype(np.int64)
+
+        doc_of_entry = np.repeat(np.arange(len(self._doc_ids), dtype=np.uint32), all_lengths)
+        self._doc_len = np.bincount(
+            doc_of_entry, weights=self._fwd_tf, minlength=len(self._doc_ids)
+        ).astype(np.float32)
+        self._alive = np.ones(len(self._doc_ids), dtype=bool)
+        self._doc_index = {doc_id: i for i, doc_id in enumerate(self._doc_ids)}
+        self._pending = {}
+
+        order = np.argsort(self._fwd_terms, kind="stable")
+        self._postings_docs = doc_of_entry[order]
+        self._postings_tf = self._fwd_tf[order]
+        counts = np.bincount(self._fwd_terms, minlength=len(self._terms))
+        self._postings_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._dirty = False
+
+    # --- persistence ---
+
+    def save(self):
+        with self._lock:
+            self._materialize()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp.npz")
+            np.savez(
+                tmp_path,
+                terms=np.array(self._terms, dtype=np.str_),
+                doc_ids=np.array(self._doc_ids, dtype=np.str_),
+                fwd_terms=self._fwd_terms,
+                fwd_tf=self._fwd_tf,
+                offsets=self._offsets,
+                doc_len=self._doc_len,
+                postings_docs=self._postings_docs,
+                postings_tf=self._postings_tf,
+                postings_offsets=self._postings_offsets,
+            )
+            os.replace(tmp_path, self.path)
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                self._terms = data["terms"].tolist()
+                self._doc_ids = data["doc_ids"].tolist()
+                self._fwd_terms = data["fwd_terms"]
+                self._fwd_tf = data["fwd_tf"]
+                self._offsets = data["offsets"]
+                self._doc_len = data["doc_len"]
+                self._postings_docs = data["postings_docs"]
+                self._postings_tf = data["postings_tf"]
+                self._postings_offsets = data["postings_offsets"]
+        except (OSError, ValueError, KeyError):
+            self._reset_arrays()
+            return
+        self._vocab = {term: i for i, term in enumerate(self._terms)}
+        self._alive = np.ones(len(self._doc_ids), dtype=bool)
+        self._doc_index = {doc_id: i for i, doc_id in enumerate(self._doc_ids)}
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fuses several ranked id lists: score(id) = sum 1 / (k + rank)."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+# Меняется, когда меняется нарезка на чанки: старый индекс тогда перестраивается целиком
+MANIFEST_VERSION = 3
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str, block_size: int = 1024 * 1024) -> str:
+    """sha256 of a file read in blocks (same digest as hash_bytes of its contents)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_id(source: str, content: str, occurrence: int = 0) -> str:
+    """
+    Stable chunk id derived from the file path and chunk text.
+    `occurrence` disambiguates identical chunks within the same file.
+    """
+    digest = hashlib.sha256(f"{source}\0{content}".encode("utf-8")).hexdigest()[:32]
+    return digest if occurrence == 0 else f"{digest}-{occurrence}"
+
+
+def assign_chunk_ids(chunks: list, seen: dict | None = None) -> list[str]:
+    """
+    Returns stable ids for the chunks, in order.
+    Pass the same `seen` dict across calls when one file's chunks arrive in several batches.
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "")
+        key = (source, chunk.page_content)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        ids.append(make_chunk_id(source, chunk.page_content, occurrence))
+    return ids
+
+
+class IndexManifest:
+    """
+    Persistent record of what has been indexed:
+    relative path -> {mtime, size, sha256, chunk_ids, lines}, where
+    `lines` holds each chunk's [start_line, end_line] as stored.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.files: dict[str, dict] = {}
+        self.outdated = False
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            self.files = {}
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.files = {}
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            self.files = {}
+            self.outdated = True
+            return
+        self.files = data.get("files", {})
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        # Атомарная замена, чтобы не получить битый манифест при падении
+        os.replace(tmp_path, self.path)
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def get(self, relative_path: str) -> dict | None:
+        return self.files.get(relative_path)
+
+    def record(
+        self, relative_path: str, mtime: float, size: int, sha256: str, chunk_ids: list[str], lines: list | None = None
+    ):
+        self.files[relative_path] = {
+            "mtime": mtime,
+            "size": size,
+            "sha256": sha256,
+            "chunk_ids": chunk_ids,
+            "lines": lines or [],
+        }
+
+    def chunk_lines(self, relative_path: str) -> dict[str, list]:
+        """chunk id -> [start_line, end_line] last written for the file's chunks."""
+        entry = self.files.get(relative_path)
+        if not entry:
+            return {}
+        # Манифесты до появления `lines` их не хранят: такие диапазоны считаем неизвестными
+        return dict(zip(entry["chunk_ids"], entry.get("lines", [])))
+
+    def remove(self, relative_path: str) -> list[str]:
+        """Drops a file from the manifest and returns its chunk ids."""
+        entry = self.files.pop(relative_path, None)
+        return entry["chunk_ids"] if entry else []
+
+    def clear(self):
+        self.files = {}
+        self.outdated = False
+
+    def paths(self) -> set[str]:
+        return set(self.files)
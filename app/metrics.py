@@ -0,0 +1,211 @@
+import cProfile
+import io
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Границы бакетов (сек.): от микросекундных BM25-запросов до минутных индексаций
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds)."""
+
+    __slots__ = ("buckets", "counts", "count", "total", "max")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний — +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding the q-th value."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_s": round(self.total, 6),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    """
+    In-process counters and latency histograms for the hot paths.
+    Span names are dotted (`search.rerank`, `index.embed`); every span
+    also feeds a histogram of the same name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._histograms: dict[str, Histogram] = {}
+        self._started = time.time()
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        """Times the block into histogram `name`; failures also count `<name>.errors`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}.errors")
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._started = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started)),
+                "counters": dict(sorted(self._counters.items())),
+                "histograms": {
+                    name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())
+                },
+            }
+
+    def prometheus(self, prefix: str = "rag_mcp") -> str:
+        """Prometheus text exposition format (counters as *_total, spans as *_seconds)."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = f"{prefix}_{_metric_name(name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value:g}")
+            for name, histogram in sorted(self._histograms.items()):
+                metric = f"{prefix}_{_metric_name(name)}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.total:.6f}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class ProfileCapture:
+    """
+    One-shot profiler: `arm()` marks the next matching request, which then
+    runs under cProfile and/or tracemalloc. On Python 3.12+ cProfile also
+    sees the worker threads the request offloads to; tracemalloc always
+    traces the whole process, so overlapping requests show up in it too.
+    """
+
+    MODES = ("cpu", "memory", "both")
+
+    def __init__(self, top: int = 25):
+        self.top = top
+        self._lock = threading.Lock()
+        self._armed: tuple[str, str] | None = None
+        self.last: dict | None = None
+
+    def arm(self, target: str, mode: str = "cpu"):
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {', '.join(self.MODES)}")
+        with self._lock:
+            self._armed = (target, mode)
+
+    def _take(self, name: str) -> str | None:
+        with self._lock:
+            if self._armed is None or self._armed[0] not in (name, "*"):
+                return None
+            mode = self._armed[1]
+            self._armed = None
+            return mode
+
+    @contextmanager
+    def capture(self, name: str):
+        """Profiles the block if a capture is armed for `name` (or `*`)."""
+        mode = self._take(name)
+        if mode is None:
+            yield
+            return
+
+        profiler = cProfile.Profile() if mode in ("cpu", "both") else None
+        trace_memory = mode in ("memory", "both") and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Другой профилировщик уже активен
+                profiler = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            result = {"request": name, "mode": mode, "elapsed_s": round(elapsed, 4)}
+            if profiler is not None:
+                profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.top)
+                result["cpu"] = out.getvalue()
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result["memory"] = {
+                    "current_kb": round(current / 1024, 1),
+                    "peak_kb": round(peak / 1024, 1),
+                    "top": [str(stat) for stat in snapshot.statistics("lineno")[: self.top]],
+                }
+            self.last = result
+
+
+metrics = Metrics()
+profiler = ProfileCapture()
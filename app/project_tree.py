@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+
+# === Правила обхода (общие для индексации и дерева проекта) ===
+
+IGNORE_DIRS = {
+    # Сборка и зависимости
+    'node_modules', '.next', 'dist', 'build', '.vercel', 'node_modules',
+    'venv', '.venv', '__pycache__', 'mediafiles', 'staticfiles', 'static',
+
+    # Кэши инструментов
+    '.ruff_cache', '.mypy_cache', '.pytest_cache', '.cursor', '.husky',
+    '.git', '.github', '.vscode', '_TMP', '.brv', '.ci',
+
+    # Собственное хранилище индекса (RAG_MCP_DB_DIRNAME)
+    os.path.basename(os.path.normpath(settings.db_dirname)),
+
+    # Тесты (на первом этапе лучше скрыть, чтобы не путать модель)
+    'cypress', 'tests'
+}
+
+IGNORE_FILES = {
+    # Секреты и конфиги окружения
+    '.env', '.env.example', '.env.local', '.env.backup', '.env.production.local',
+    'sample.env', 'db.sqlite3',
+
+    # Лок-файлы (огромные и бесполезные для RAG)
+    'yarn.lock', 'package-lock.json', 'uv.lock', 'tsconfig.strict.tsbuildinfo',
+
+    # Конфиги инструментов (лучше убрать, чтобы не забивать контекст)
+    '.eslintrc.json', '.prettierrc.json', '.eslintignore', '.prettierignore',
+    '.cursorignore', '.gitignore', '.dockerignore', '.vercelignore',
+    'docker-compose.yml', 'Dockerfile', '.flake8', '.ruffignore'
+}
+
+# Каталог, изменённый меньше чем за столько до сканирования, перечитываем и
+# в следующий раз: изменение в тот же тик mtime иначе можно пропустить
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class _DirNode:
+    __slots__ = ("mtime_ns", "racy", "files", "dirs")
+
+    def __init__(self, mtime_ns: int, racy: bool, files: list[str]):
+        self.mtime_ns = mtime_ns
+        self.racy = racy
+        self.files = files
+        self.dirs: dict[str, "_DirNode"] = {}
+
+
+class ProjectTree:
+    """
+    Cached directory snapshot of a project, pruned by IGNORE_DIRS.
+
+    A refresh stats every directory but re-lists (scandir) only those whose
+    mtime changed, since adding, removing or renaming an entry updates the
+    mtime of its parent directory. File contents are not tracked here;
+    the indexer stats the files it gets from the snapshot.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        self._node: _DirNode | None = None
+        self.refreshed_at = 0.0
+        self.last_refresh = {"dirs_listed": 0, "dirs_reused": 0, "seconds": 0.0}
+
+    def refresh(self, max_age: float = 0.0) -> dict:
+        """Brings the snapshot up to date unless it is younger than max_age seconds."""
+        with self._lock:
+            if self._node is not None and time.monotonic() - self.refreshed_at < max_age:
+                return self.last_refresh
+            start = time.perf_counter()
+            counts = {"dirs_listed": 0, "dirs_reused": 0}
+            self._node = self._scan(self.root, self._node, time.time_ns(), counts)
+            self.refreshed_at = time.monotonic()
+            self.last_refresh = {**counts, "seconds": round(time.perf_counter() - start, 4)}
+            return self.last_refresh
+
+    def _scan(self, path: str, old: _DirNode | None, now_ns: int, counts: dict) -> _DirNode | None:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        if old is not None and old.mtime_ns == mtime_ns and not old.racy:
+            counts["dirs_reused"] += 1
+            node = old
+            dir_names = list(old.dirs)
+        else:
+            counts["dirs_listed"] += 1
+            files, dir_names = [], []
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        try:
+                            # Симлинки на каталоги не обходим (как os.walk по умолчанию)
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.name not in IGNORE_DIRS:
+                                    dir_names.append(entry.name)
+                            elif entry.is_file():
+                                files.append(entry.name)
+                        except OSError:
+                            continue
+            except OSError:
+                return None
+            node = _DirNode(mtime_ns, now_ns - mtime_ns < RACY_WINDOW_NS, sorted(files))
+            dir_names.sort()
+
+        old_dirs = old.dirs if old is not None else {}
+        children = {}
+        for name in dir_names:
+            child = self._scan(os.path.join(path, name), old_dirs.get(name), now_ns, counts)
+            if child is not None:
+                children[name] = child
+        node.dirs = children
+        return node
+
+    def _find(self, subtree: str) -> tuple[str, _DirNode | None]:
+        node = self._node
+        parts = [p for p in os.path.normpath(subtree).split(os.sep) if p not in ("", ".")] if subtree else []
+        for part in parts:
+            if node is None:
+                break
+            node = node.dirs.get(part)
+        return os.path.join(self.root, *parts), node
+
+    def iter_files(self, subtree: str = "", extensions=None, skip_files=None):
+        """Absolute paths of files (optionally with an allowed extension), sorted per directory."""
+        with self._lock:
+            base, node = self._find(subtree)
+            if node is None:
+                return []
+            paths = []
+            stack = [(base, node)]
+            while stack:
+                path, current = stack.pop()
+                for name in current.files:
+                    if skip_files and name in skip_files:
+                        continue
+                    if extensions is not None and os.path.splitext(name)[1] not in extensions:
+                        continue
+                    paths.append(os.path.join(path, name))
+                for name in reversed(current.dirs):
+                    stack.append((os.path.join(path, name), current.dirs[name]))
+            return paths
+
+    def render(self, subtree: str = "", max_depth: int | None = None, max_entries: int | None = None) -> str | None:
+        """
+        Indented listing (directories end with `/`, hidden files skipped).
+        Directories deeper than max_depth are shown but not expanded.
+        Returns None if the subtree doesn't exist.
+        """
+        with self._lock:
+            base, node = self._find(subtree)
+            if node is None:
+                return None
+            lines = []
+            stack = [(os.path.basename(base), node, 0)]
+            while stack:
+                name, current, level = stack.pop()
+                if max_entries is not None and len(lines) >= max_entries:
+                    lines.append(f"... (truncated at {max_entries} entries; narrow with subtree/depth)")
+                    break
+                lines.append(f"{' ' * 4 * level}{name}/")
+                if max_depth is not None and level >= max_depth:
+                    continue
+                indent = " " * 4 * (level + 1)
+                lines.extend(f"{indent}{f}" for f in current.files if not f.startswith("."))
+                for child_name in reversed(current.dirs):
+                    stack.append((child_name, current.dirs[child_name], level + 1))
+            return "\n".join(lines)
+
+
+class ProjectTreeRegistry:
+    """LRU of ProjectTrees keyed by absolute project root."""
+
+    def __init__(self, max_size: int = 16):
+        self.max_size = max_size
+        self._trees: OrderedDict[str, ProjectTree] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, root: str) -> ProjectTree:
+        root = os.path.abspath(root)
+        with self._lock:
+            tree = self._trees.get(root)
+            if tree is None:
+                tree = self._trees[root] = ProjectTree(root)
+                while len(self._trees) > self.max_size:
+                    self._trees.popitem(last=False)
+            self._trees.move_to_end(root)
+            return tree
+
+
+project_trees = ProjectTreeRegistry()
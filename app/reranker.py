@@ -0,0 +1,141 @@
+import threading
+from collections import OrderedDict
+
+from app.config import settings
+from app.metrics import metrics
+from app.rewrite_cache import normalize_query
+from app.startup import timed_phase
+
+
+# Модель ms-marco-MiniLM-L-6-v2 — золотой стандарт: быстрая и точная.
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Returns the shared CrossEncoder, loading it on first use.
+    sentence_transformers (and torch) are imported only here.
+    """
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                with timed_phase("reranker_load"):
+                    from sentence_transformers import CrossEncoder
+
+                    if settings.rerank_threads > 0:
+                        import torch
+
+                        torch.set_num_threads(settings.rerank_threads)
+                    _reranker = CrossEncoder(RERANKER_MODEL)
+    return _reranker
+
+
+class RerankStage:
+    """
+    Cross-encoder reranking with batched inference and an LRU cache of
+    (query, chunk id) scores. Chunk ids are content-derived, so a cached
+    score stays valid until the chunk itself changes.
+    """
+
+    def __init__(self, cache_size: int, batch_size: int, skip_margin: float):
+        self.cache_size = max(0, cache_size)
+        self.batch_size = max(1, batch_size)
+        self.skip_margin = skip_margin
+        self._scores: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.pairs_scored = 0
+        self.early_exits = 0
+
+    def rerank(self, query: str, results: list[dict], top_k: int) -> list[dict]:
+        """
+        Scores results against the query and returns the best top_k,
+        each with a 'rerank_score'. Results must carry an 'id'.
+        """
+        return self.rerank_many([query], [results], top_k)[0]
+
+    def rerank_many(self, queries: list[str], result_lists: list[list[dict]], top_k: int) -> list[list[dict]]:
+        """rerank for several queries; all uncached pairs go through one batched predict call."""
+        candidate_lists = [self._select_candidates(results, top_k) for results in result_lists]
+        query_keys = [normalize_query(query) for query in queries]
+
+        score_lists = [[None] * len(candidates) for candidates in candidate_lists]
+        total = sum(len(candidates) for candidates in candidate_lists)
+        missing = []  # (номер запроса, номер кандидата)
+        with self._lock:
+            for q, (query_key, candidates) in enumerate(zip(query_keys, candidate_lists)):
+                for i, res in enumerate(candidates):
+                    key = (query_key, res["id"])
+                    score = self._scores.get(key)
+                    if score is None:
+                        missing.append((q, i))
+                    else:
+                        self._scores.move_to_end(key)
+                        score_lists[q][i] = score
+            self.cache_hits += total - len(missing)
+        metrics.inc("rerank.cache_hits", total - len(missing))
+
+        if missing:
+            pairs = [[queries[q], candidate_lists[q][i].get("content", "")] for q, i in missing]
+            model = get_reranker()
+            with metrics.span("rerank.predict"):
+                fresh = model.predict(pairs, batch_size=self.batch_size)
+            metrics.inc("rerank.pairs_scored", len(pairs))
+            with self._lock:
+                self.pairs_scored += len(pairs)
+                for (q, i), score in zip(missing, fresh):
+                    score_lists[q][i] = float(score)
+                    self._remember((query_keys[q], candidate_lists[q][i]["id"]), score_lists[q][i])
+
+        reranked = []
+        for candidates, scores in zip(candidate_lists, score_lists):
+            for res, score in zip(candidates, scores):
+                res["rerank_score"] = score
+            # Сортируем по убыванию релевантности и берем нужные top_k
+            reranked.append(sorted(candidates, key=lambda x: x["rerank_score"], reverse=True)[:top_k])
+        return reranked
+
+    def _select_candidates(self, results: list[dict], top_k: int) -> list[dict]:
+        """
+        Early exit: if the vector similarity of the top_k-th hit beats the
+        next one by at least skip_margin, the tail is clearly irrelevant and
+        only the top_k hits are sent to the cross-encoder. Hits found only
+        by BM25 (hybrid search) have no similarity to compare and are
+        always kept.
+        """
+        vector_hits = [res for res in results if not res.get("lexical_only")]
+        if self.skip_margin <= 0 or len(vector_hits) <= top_k:
+            return results
+        ranked = sorted(vector_hits, key=lambda x: x.get("relevance", 0), reverse=True)
+        gap = ranked[top_k - 1].get("relevance", 0) - ranked[top_k].get("relevance", 0)
+        if gap >= self.skip_margin:
+            self.early_exits += 1
+            return ranked[:top_k] + [res for res in results if res.get("lexical_only")]
+        return results
+
+    def _remember(self, key: tuple[str, str], score: float):
+        if self.cache_size == 0:
+            return
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.cache_size:
+            self._scores.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "cached_scores": len(self._scores),
+            "cache_hits": self.cache_hits,
+            "pairs_scored": self.pairs_scored,
+            "early_exits": self.early_exits,
+        }
+
+
+rerank_stage = RerankStage(
+    cache_size=settings.rerank_cache_size,
+    batch_size=settings.rerank_batch_size,
+    skip_margin=settings.rerank_skip_margin,
+)
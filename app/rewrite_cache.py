@@ -0,0 +1,114 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class QueryRewriteCache:
+    """
+    Bounded LRU cache of query rewrites with a TTL, persisted as JSON
+    so rewrites survive server restarts. Writes are debounced: put() only
+    marks the cache dirty, and a background timer saves it `flush_delay`
+    seconds later (and once more at exit), off the search path.
+    """
+
+    def __init__(self, path: str | Path, max_entries: int, ttl: float, flush_delay: float = 5.0):
+        self.path = Path(os.path.expanduser(str(path)))
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.flush_delay = max(0.0, flush_delay)
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Отдельный замок на запись файла: сериализация идёт без блокировки get/put
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._timer: threading.Timer | None = None
+        self._load()
+        atexit.register(self.flush)
+
+    def get(self, query: str) -> str | None:
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, rewrite: str):
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = (rewrite, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Writes the cache to disk if it changed since the last save."""
+        with self._save_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = [[key, rewrite, created_at] for key, (rewrite, created_at) in self._entries.items()]
+            self._save(entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _expired(self, entry: tuple[str, float]) -> bool:
+        return self.ttl > 0 and time.time() - entry[1] > self.ttl
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        # Файл хранится в порядке LRU: от самых старых к свежим
+        for key, rewrite, created_at in data.get("entries", []):
+            entry = (rewrite, created_at)
+            if not self._expired(entry):
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self, entries: list):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f, ensure_ascii=False)
+            # Атомарная замена, чтобы не получить битый кэш при падении
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Кэш — оптимизация, а не источник истины
+            pass
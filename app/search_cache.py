@@ -0,0 +1,123 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def normalize_search_query(query: str) -> str:
+    # Регистр не трогаем: от него зависят эмбеддинг и cross-encoder
+    return " ".join(query.split())
+
+
+class IndexGenerations:
+    """
+    Per-store change counters. Every write to a store bumps its generation,
+    so anything derived from the index can tell whether it is still current.
+    Keyed by the store's db path; counters live for the whole process, so a
+    store closed and reopened by the registry keeps counting.
+    """
+
+    def __init__(self):
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db_path) -> int:
+        with self._lock:
+            return self._generations.get(os.path.abspath(db_path), 0)
+
+    def bump(self, db_path) -> int:
+        key = os.path.abspath(db_path)
+        with self._lock:
+            generation = self._generations[key] = self._generations.get(key, 0) + 1
+            return generation
+
+
+class SearchCache:
+    """
+    LRU cache of final search results keyed by (project, normalized query,
+    top_k). Each entry remembers the index generation it was computed at
+    and is dropped on lookup once the project's index has changed.
+    Bounded by entry count and by the total size of cached chunk texts.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, tuple[int, list[dict], int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(project_path: str, query: str, top_k: int) -> tuple:
+        return (os.path.abspath(project_path), normalize_search_query(query), top_k)
+
+    def get(self, key: tuple, generation: int) -> list[dict] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != generation:
+                self._drop(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Копии: вызывающий код может дописывать поля в результаты
+            return [dict(hit) for hit in entry[1]]
+
+    def put(self, key: tuple, generation: int, results: list[dict]):
+        if not self.enabled:
+            return
+        size = sum(len(hit.get("content", "")) for hit in results) + 256
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (generation, [dict(hit) for hit in results], size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, project_path: str | None = None):
+        """Drops every entry (or those of one project)."""
+        with self._lock:
+            if project_path is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            root = os.path.abspath(project_path)
+            for key in [key for key in self._entries if key[0] == root]:
+                self._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def _drop(self, key: tuple):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+
+index_generations = IndexGenerations()
@@ -0,0 +1,55 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("vox-brain")
+
+# Время (сек.) каждой фазы старта и прогрева, в порядке выполнения
+_phases: dict[str, float] = {}
+_process_start = time.perf_counter()
+
+
+@contextmanager
+def timed_phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = round(time.perf_counter() - start, 4)
+
+
+def mark_ready():
+    """Records the time from process start until the server is ready to serve."""
+    _phases["ready"] = round(time.perf_counter() - _process_start, 4)
+
+
+def startup_timings() -> dict:
+    return dict(_phases)
+
+
+def warm_up():
+    """Imports heavy dependencies and loads models ahead of the first request."""
+    from app.reranker import get_reranker
+
+    with timed_phase("warmup.import_chromadb"):
+        import chromadb  # noqa: F401
+    with timed_phase("warmup.import_langchain"):
+        import app.chunker  # noqa: F401
+    with timed_phase("warmup.reranker"):
+        get_reranker()
+    logger.info(f"🔥 Warm-up complete: {startup_timings()}")
+
+
+def start_background_warmup() -> threading.Thread:
+    def run():
+        try:
+            with timed_phase("warmup.total"):
+                warm_up()
+        except Exception:
+            logger.exception("Warm-up failed; models will load on first use")
+
+    thread = threading.Thread(target=run, name="rag-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,192 @@
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from app.config import settings
+
+
+def get_collection_name(project_path: str) -> str:
+    """Gets the collection name from the project path."""
+    project_name = os.path.basename(os.path.abspath(project_path))
+    return f"rag-mcp-{project_name}"
+
+
+def resolve_db_path(project_path: str) -> str:
+    """The Chroma store of a project lives inside the project directory."""
+    return os.path.join(os.path.abspath(project_path), settings.db_dirname)
+
+
+class StoreRegistry:
+    """
+    Process-wide pool of open VectorStoreManagers keyed by (db path, collection).
+    Stores are opened lazily and handed out pinned (`checkout`, or
+    `acquire`/`release`): a pinned store is never closed by eviction, so
+    every holder — index jobs, the watcher, search threads — shares one
+    instance. Unpinned stores are evicted after `idle_ttl` seconds since
+    their last release, and the least recently used ones are dropped
+    once opening a store takes the pool over `max_size`.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: float):
+        self.max_size = max(1, max_size)
+        self.idle_ttl = idle_ttl
+        self._stores: OrderedDict[tuple[str, str], tuple] = OrderedDict()
+        # Сколько держателей у ключа; ключ можно закрепить и до открытия хранилища
+        self._pins: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _key(project_path: str) -> tuple[str, str]:
+        return resolve_db_path(project_path), get_collection_name(project_path)
+
+    def acquire(self, project_path: str):
+        """Returns the project's store, pinned until the matching release()."""
+        key = self._key(project_path)
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            return self._open(key)
+        except BaseException:
+            self._unpin([key])
+            raise
+
+    def release(self, project_path: str):
+        self._unpin([self._key(project_path)])
+
+    @contextmanager
+    def checkout(self, project_path: str):
+        """The project's store, pinned for the duration of the block."""
+        store = self.acquire(project_path)
+        try:
+            yield store
+        finally:
+            self.release(project_path)
+
+    @contextmanager
+    def pinned(self, project_paths):
+        """
+        Keeps these projects' stores (open or not yet) from being evicted
+        for the duration of the block, e.g. across one federated search
+        over more projects than `max_size`.
+        """
+        keys = [self._key(path) for path in project_paths]
+        with self._lock:
+            for key in keys:
+                self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self._unpin(keys)
+
+    def _unpin(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                count = self._pins[key] - 1
+                if count:
+                    self._pins[key] = count
+                else:
+                    del self._pins[key]
+                cached = self._stores.get(key)
+                if cached is not None:
+                    # Время простоя считаем от последнего освобождения, а не от выдачи
+                    self._stores[key] = (cached[0], now)
+
+    def _open(self, key: tuple[str, str]):
+        # Импорт здесь, чтобы старт сервера не тянул chromadb/numpy
+        from app.vector_store import VectorStoreManager
+
+        with self._lock:
+            closing = self._evict_idle()
+            cached = self._stores.get(key)
+            if cached is not None:
+                self._stores[key] = (cached[0], time.monotonic())
+                self._stores.move_to_end(key)
+                self.reused += 1
+                store = cached[0]
+            else:
+                store = VectorStoreManager(db_path=key[0], collection_name=key[1])
+                self._stores[key] = (store, time.monotonic())
+                self.opened += 1
+                closing += self._evict_overflow()
+        # close() пишет файлы — не держим блокировку реестра
+        for old_store in closing:
+            old_store.close()
+        return store
+
+    def evict(self, project_path: str) -> bool:
+        """Closes the project's store unless someone holds it."""
+        key = self._key(project_path)
+        with self._lock:
+            if self._pins.get(key) or key not in self._stores:
+                return False
+            store, _ = self._stores.pop(key)
+            self.evicted += 1
+        store.close()
+        return True
+
+    def clear(self):
+        """Closes every store (shutdown)."""
+        with self._lock:
+            stores = [store for store, _ in self._stores.values()]
+            self._stores.clear()
+            self.evicted += len(stores)
+        for store in stores:
+            store.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_stores": [
+                    {
+                        "db_path": key[0],
+                        "collection_name": key[1],
+                        "holders": self._pins.get(key, 0),
+                        "dedup": store.dedup.stats(),
+                    }
+                    for key, (store, _) in self._stores.items()
+                ],
+                "max_size": self.max_size,
+                "opened": self.opened,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+    def _evict_idle(self) -> list:
+        if self.idle_ttl <= 0:
+            return []
+        now = time.monotonic()
+        return self._drop(
+            [key for key, (_, last_used) in self._stores.items() if now - last_used > self.idle_ttl]
+        )
+
+    def _evict_overflow(self) -> list:
+        # Закреплённые пропускаем: пока их держат, пул может быть больше max_size
+        excess = len(self._stores) - self.max_size
+        if excess <= 0:
+            return []
+        return self._drop([key for key in self._stores if not self._pins.get(key)][:excess])
+
+    def _drop(self, keys) -> list:
+        """Removes unpinned stores from the pool; the caller closes them outside the lock."""
+        dropped = []
+        for key in keys:
+            if self._pins.get(key):
+                continue
+            store, _ = self._stores.pop(key)
+            dropped.append(store)
+            self.evicted += 1
+        return dropped
+
+
+registry = StoreRegistry(
+    max_size=settings.store_registry_size, idle_ttl=settings.store_idle_ttl
+)
+# Закрытие сбрасывает кэши (эмбеддинги запросов, BM25) на диск
+atexit.register(registry.clear)
@@ -0,0 +1,375 @@
+import ast
+import json
+import os
+import re
+import textwrap
+import threading
+from pathlib import Path
+
+
+PYTHON_EXTENSIONS = {'.py'}
+JS_EXTENSIONS = {'.js', '.jsx', '.ts', '.tsx'}
+
+
+class SymbolUnit:
+    """
+    A definition to be emitted as one chunk.
+    `ranges` are 1-based inclusive line ranges; a large class is reduced
+    to its own lines (header, attributes) with methods emitted separately.
+    """
+
+    __slots__ = ("name", "kind", "ranges")
+
+    def __init__(self, name: str, kind: str, ranges: list[tuple[int, int]]):
+        self.name = name
+        self.kind = kind
+        self.ranges = ranges
+
+    @property
+    def start_line(self) -> int:
+        return self.ranges[0][0]
+
+    @property
+    def end_line(self) -> int:
+        return self.ranges[-1][1]
+
+
+def extract_symbols(content: str, file_ext: str, max_chars: int) -> list[SymbolUnit] | None:
+    """
+    Returns definition units for a Python or JS/TS file, or None if the
+    file can't be parsed (callers then fall back to plain splitting).
+    """
+    lines = content.splitlines()
+    if file_ext in PYTHON_EXTENSIONS:
+        try:
+            tree = ast.parse(content)
+        except (SyntaxError, ValueError):
+            return None
+        return _python_units(tree.body, lines, "", False, max_chars)
+    if file_ext in JS_EXTENSIONS:
+        return _js_units(lines)
+    return None
+
+
+# === Python ===
+
+def _span_chars(lines: list[str], start: int, end: int) -> int:
+    return sum(len(line) + 1 for line in lines[start - 1 : end])
+
+
+def _python_units(body, lines, prefix, in_class, max_chars) -> list[SymbolUnit]:
+    units = []
+    for node in body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        end = node.end_lineno
+        name = f"{prefix}{node.name}"
+
+        if not isinstance(node, ast.ClassDef):
+            units.append(SymbolUnit(name, "method" if in_class else "function", [(start, end)]))
+            continue
+
+        if _span_chars(lines, start, end) <= max_chars:
+            units.append(SymbolUnit(name, "class", [(start, end)]))
+            continue
+
+        # Большой класс: методы — отдельными чанками, остальное — чанк самого класса
+        members = _python_units(node.body, lines, f"{name}.", True, max_chars)
+        taken = set()
+        for member in members:
+            for member_start, member_end in member.ranges:
+                taken.update(range(member_start, member_end + 1))
+        own_lines = [n for n in range(start, end + 1) if n not in taken]
+        units.append(SymbolUnit(name, "class", _to_ranges(own_lines)))
+        units.extend(members)
+    return units
+
+
+def _python_nested(text: str, start_line: int, prefix: str) -> list[tuple[str, str, int, int]]:
+    """
+    Definitions nested in a symbol's chunk (methods of a class kept whole,
+    inner functions) as (qualified name, kind, start_line, end_line).
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(text))
+    except (SyntaxError, ValueError):
+        return []
+    found = []
+
+    def walk(body, prefix, in_class):
+        for node in body:
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            name = f"{prefix}{node.name}"
+            is_class = isinstance(node, ast.ClassDef)
+            kind = "class" if is_class else "method" if in_class else "function"
+            start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            found.append((name, kind, start_line + start - 1, start_line + node.end_lineno - 1))
+            walk(node.body, f"{name}.", is_class)
+
+    # Верхний узел — сам символ чанка; вложенные получают его имя префиксом
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            walk(node.body, f"{prefix}.", isinstance(node, ast.ClassDef))
+    return found
+
+
+def _to_ranges(numbers: list[int]) -> list[tuple[int, int]]:
+    ranges = []
+    for n in numbers:
+        if ranges and ranges[-1][1] == n - 1:
+            ranges[-1] = (ranges[-1][0], n)
+        else:
+            ranges.append((n, n))
+    return ranges
+
+
+# === JS / TS (лёгкий разбор без AST: ищем определения на верхнем уровне) ===
+
+JS_DEFINITION_PATTERNS = [
+    (re.compile(r"^(?:export\s+(?:default\s+)?)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)"), "function"),
+    (re.compile(r"^(?:export\s+(?:default\s+)?)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)"), "class"),
+    (re.compile(r"^(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)"), "function"),
+    (re.compile(r"^(?:export\s+)?(?:declare\s+)?(?:interface|enum)\s+([A-Za-z_$][\w$]*)"), "type"),
+    (re.compile(r"^(?:export\s+)?(?:declare\s+)?type\s+([A-Za-z_$][\w$]*)"), "type"),
+]
+
+
+JS_METHOD_PATTERN = re.compile(
+    r"^(?:(?:public|private|protected|static|readonly|override|abstract|async|get|set)\s+)*\*?\s*"
+    r"(#?[A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\s*"
+    r"(?:\(|=\s*(?:async\s+)?(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*(?::[^=]+)?=>)"
+)
+JS_NOT_METHODS = {"if", "for", "while", "switch", "catch", "return", "function", "new", "super"}
+
+
+def _js_methods(text: str, start_line: int, prefix: str) -> list[tuple[str, str, int, int]]:
+    """Methods of a JS/TS class chunk (definitions at depth 1 of its body)."""
+    lines = text.splitlines()
+    depths = _js_line_depths(lines)
+    found = []
+    for i, line in enumerate(lines):
+        if depths[i] != 1:
+            continue
+        match = JS_METHOD_PATTERN.match(line.strip())
+        if not match or match.group(1) in JS_NOT_METHODS:
+            continue
+        end = i
+        while end + 1 < len(lines) and depths[end + 1] > 1:
+            end += 1
+        found.append((f"{prefix}.{match.group(1)}", "method", start_line + i, start_line + end))
+    return found
+
+
+def _js_line_depths(lines: list[str]) -> list[int]:
+    """Brace depth at the start of each line, skipping strings and comments."""
+    depths = []
+    depth = 0
+    in_block_comment = False
+    quote = None
+    for line in lines:
+        depths.append(depth)
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            nxt = line[i + 1] if i + 1 < len(line) else ""
+            if in_block_comment:
+                if ch == "*" and nxt == "/":
+                    in_block_comment = False
+                    i += 1
+            elif quote:
+                if ch == "\\":
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif ch == "/" and nxt == "/":
+                break
+            elif ch == "/" and nxt == "*":
+                in_block_comment = True
+                i += 1
+            elif ch in "'\"`":
+                quote = ch
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth = max(0, depth - 1)
+            i += 1
+        # Обычные строки не переносятся, шаблонные (`) — могут
+        if quote in ("'", '"'):
+            quote = None
+    depths.append(depth)
+    return depths
+
+
+def _js_units(lines: list[str]) -> list[SymbolUnit]:
+    depths = _js_line_depths(lines)
+    units = []
+    i = 0
+    while i < len(lines):
+        if depths[i] != 0:
+            i += 1
+            continue
+        stripped = lines[i].strip()
+        match = None
+        for pattern, kind in JS_DEFINITION_PATTERNS:
+            match = pattern.match(stripped)
+            if match:
+                break
+        if not match:
+            i += 1
+            continue
+
+        # Конец определения: либо блок { ... } закрылся (глубина вернулась к 0),
+        # либо выражение без блока закончилось `;` / пустой строкой
+        end = i
+        while True:
+            if depths[end + 1] > 0:
+                while end + 1 < len(lines) and depths[end + 1] > 0:
+                    end += 1
+                break
+            if (
+                lines[end].rstrip().endswith((";", "}"))
+                or end + 1 >= len(lines)
+                or not lines[end + 1].strip()
+            ):
+                break
+            end += 1
+        units.append(SymbolUnit(match.group(1), kind, [(i + 1, end + 1)]))
+        i = end + 1
+    return units
+
+
+# === Таблица символов ===
+
+class SymbolTable:
+    """
+    Persistent symbol -> chunk table for one collection.
+    Lookups by qualified name (`Class.method`) or short name are dict hits.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._files: dict[str, list[dict]] = {}
+        self._by_name: dict[str, list[dict]] = {}
+        self._load()
+
+    def update_file(self, source: str, entries: list[dict]):
+        with self._lock:
+            self._drop(source)
+            if entries:
+                self._files[source] = entries
+                self._index(source, entries)
+
+    def remove_file(self, source: str):
+        with self._lock:
+            self._drop(source)
+
+    def clear(self):
+        with self._lock:
+            self._files = {}
+            self._by_name = {}
+
+    def lookup(self, name: str) -> list[dict]:
+        """Exact qualified-name matches, else short-name matches."""
+        with self._lock:
+            bucket = self._by_name.get(name, [])
+            exact = [entry for entry in bucket if entry["name"] == name]
+            return [dict(entry) for entry in (exact or bucket)]
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._files.values())
+
+    def save(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._files, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._files = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._files = {}
+        for source, entries in self._files.items():
+            self._index(source, entries)
+
+    @staticmethod
+    def _keys(name: str) -> set[str]:
+        # `Outer.Inner.method` находится и как `Inner.method`, и как `method`
+        parts = name.split(".")
+        return {".".join(parts[i:]) for i in range(len(parts))}
+
+    def _index(self, source: str, entries: list[dict]):
+        for entry in entries:
+            entry["source"] = source
+            for key in self._keys(entry["name"]):
+                self._by_name.setdefault(key, []).append(entry)
+
+    def _drop(self, source: str):
+        for entry in self._files.pop(source, []):
+            for key in self._keys(entry["name"]):
+                bucket = self._by_name.get(key)
+                if bucket is None:
+                    continue
+                bucket[:] = [e for e in bucket if e is not entry]
+                if not bucket:
+                    del self._by_name[key]
+
+
+def symbol_entries(chunks: list, chunk_ids: list[str]) -> list[dict]:
+    """
+    Symbol table entries for one file's chunks. A symbol split into several
+    parts points at its first chunk and spans all of their lines. Methods
+    and inner definitions that stay inside their enclosing symbol's chunk
+    (e.g. methods of a small class) point at that chunk.
+    """
+    entries: dict[str, dict] = {}
+    parts: dict[str, int] = {}
+    for chunk, chunk_id in zip(chunks, chunk_ids):
+        name = chunk.metadata.get("symbol")
+        if not name:
+            continue
+        start, end = chunk.metadata.get("start_line"), chunk.metadata.get("end_line")
+        parts[name] = parts.get(name, 0) + 1
+        entry = entries.get(name)
+        if entry is None:
+            entries[name] = {
+                "name": name,
+                "kind": chunk.metadata.get("symbol_kind", ""),
+                "chunk_id": chunk_id,
+                "start_line": start,
+                "end_line": end,
+                "_text": chunk.page_content,
+                "_extension": chunk.metadata.get("extension", ""),
+            }
+        else:
+            entry["end_line"] = max(entry["end_line"], end)
+
+    nested: dict[str, dict] = {}
+    for name, entry in entries.items():
+        text, extension = entry.pop("_text"), entry.pop("_extension")
+        # Разрезанный на части символ целиком не разобрать (части перекрываются)
+        if parts[name] > 1:
+            continue
+        if extension in PYTHON_EXTENSIONS:
+            found = _python_nested(text, entry["start_line"], name)
+        elif extension in JS_EXTENSIONS and entry["kind"] == "class":
+            found = _js_methods(text, entry["start_line"], name)
+        else:
+            continue
+        for nested_name, kind, start, end in found:
+            # У методов большого класса свои чанки — их записи уже есть
+            if nested_name not in entries and nested_name not in nested:
+                nested[nested_name] = {
+                    "name": nested_name,
+                    "kind": kind,
+                    "chunk_id": entry["chunk_id"],
+                    "start_line": start,
+                    "end_line": end,
+                }
+    return [*entries.values(), *nested.values()]
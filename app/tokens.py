@@ -0,0 +1,34 @@
+import re
+
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def split_identifier(identifier: str) -> list[str]:
+    """getUserByID / get_user_by_id -> ['get', 'user', 'by', 'id']"""
+    parts = []
+    for piece in identifier.split("_"):
+        parts.extend(CAMEL_RE.findall(piece))
+    return [p.lower() for p in parts if p]
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Code-aware tokens: every identifier as a whole (lowercased) plus its
+    camelCase/snake_case parts, so both `getUserById` and `user` match.
+    """
+    tokens = []
+    for identifier in IDENTIFIER_RE.findall(text):
+        whole = identifier.lower()
+        if len(whole) > 1:
+            tokens.append(whole)
+        parts = split_identifier(identifier)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1)
+    return tokens
+
+
+def is_identifier_query(query: str) -> bool:
+    """True for queries that are a bare symbol, e.g. `VectorStoreManager` or `app.chunker`."""
+    return bool(re.fullmatch(r"[A-Za-z_][A-Za-z0-9_.:]*", query.strip()))
@@ -0,0 +1,738 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+INITIAL_CAPACITY = 1024
+# Строк за одно матричное умножение при поиске (блок float32-копии остаётся в кэше CPU)
+SCAN_BLOCK_ROWS = 4096
+# Журнал строк сворачивается в снимок, когда становится больше этого числа записей
+COMPACT_MIN_LOG_ROWS = 5000
+# Файл текстов переписывается при свёртке, только если мёртвые байты составляют больше половины
+COMPACT_MIN_TEXT_BYTES = 1 << 20
+
+
+class VectorBackend:
+    """
+    Storage engine behind VectorStoreManager: vectors with their chunk text
+    and flat metadata, addressed by chunk id. `query` returns
+    (id, document, metadata, distance) tuples, best first, where distance
+    is squared L2 (Chroma's default space).
+    """
+
+    name = ""
+
+    def upsert(self, ids: list[str], embeddings: list[list[float]], documents: list[str], metadatas: list[dict]):
+        raise NotImplementedError
+
+    def delete(self, ids: list[str]):
+        raise NotImplementedError
+
+    def get(self, ids: list[str]) -> list[tuple[str, str, dict]]:
+        raise NotImplementedError
+
+    def update_metadata(self, ids: list[str], metadatas: list[dict]):
+        """Merges the given keys into the metadata of existing items (unknown ids are skipped)."""
+        raise NotImplementedError
+
+    def query(self, embedding: list[float], n_results: int, where: dict | None = None) -> list[tuple[str, str, dict, float]]:
+        raise NotImplementedError
+
+    def query_many(self, embeddings: list[list[float]], n_results: int, where: dict | None = None) -> list[list[tuple]]:
+        """One result list per embedding; engines override this to share work across queries."""
+        return [self.query(embedding, n_results, where) for embedding in embeddings]
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class ChromaBackend(VectorBackend):
+    """Chroma persistent collection (HNSW index, SQLite metadata)."""
+
+    name = "chroma"
+
+    def __init__(self, db_path: Path, collection_name: str):
+        import chromadb
+
+        self.collection_name = collection_name
+        self._client = chromadb.PersistentClient(path=str(db_path))
+        self._collection = self._client.get_or_create_collection(name=collection_name)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        self._collection.delete(ids=ids)
+
+    def get(self, ids):
+        got = self._collection.get(ids=ids, include=["documents", "metadatas"])
+        metadatas = got.get("metadatas") or [{}] * len(got["ids"])
+        return list(zip(got["ids"], got["documents"], metadatas))
+
+    def update_metadata(self, ids, metadatas):
+        updates = dict(zip(ids, metadatas))
+        got = self.get(list(updates))
+        if got:
+            self._collection.update(
+                ids=[doc_id for doc_id, _, _ in got],
+                metadatas=[{**(meta or {}), **updates[doc_id]} for doc_id, _, meta in got],
+            )
+
+    def query(self, embedding, n_results, where=None):
+        return self.query_many([embedding], n_results, where)[0]
+
+    def query_many(self, embeddings, n_results, where=None):
+        results = self._collection.query(query_embeddings=embeddings, n_results=n_results, where=where)
+        if not results or not results.get("documents"):
+            return [[] for _ in embeddings]
+        hits = []
+        for i, documents in enumerate(results["documents"]):
+            count = len(results["ids"][i])
+            metadatas = results["metadatas"][i] if results.get("metadatas") else [{}] * count
+            distances = results["distances"][i] if results.get("distances") else [0.0] * count
+            hits.append(list(zip(results["ids"][i], documents or [], metadatas, distances)))
+        return hits
+
+    def count(self):
+        return self._collection.count()
+
+    def reset(self):
+        self._client.delete_collection(name=self.collection_name)
+        self._collection = self._client.get_or_create_collection(name=self.collection_name)
+
+
+class _Column:
+    """Dictionary-encoded metadata column: per-row codes into a value list (-1 = missing)."""
+
+    __slots__ = ("values", "index", "codes")
+
+    def __init__(self, capacity: int, values: list | None = None, codes: np.ndarray | None = None):
+        self.values = values or []
+        self.index = {_value_key(v): i for i, v in enumerate(self.values)}
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        if codes is not None:
+            self.codes[: len(codes)] = codes
+
+    def code(self, value, create: bool = False) -> int:
+        key = _value_key(value)
+        code = self.index.get(key)
+        if code is None:
+            if not create:
+                return -2  # не совпадает ни с одной строкой
+            code = self.index[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def grow(self, capacity: int):
+        codes = np.full(capacity, -1, dtype=np.int32)
+        codes[: len(self.codes)] = self.codes
+        self.codes = codes
+
+
+def _value_key(value):
+    # True == 1 в Python, а в фильтрах это разные значения
+    return (type(value).__name__, value)
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Compact local engine: one directory per collection.
+
+    Vectors are unit-normalized and stored as float16 (or int8 with a
+    per-row scale) in a memory-mapped matrix, next to their float32 norms,
+    so opening the store maps the files instead of loading them and
+    several processes share the same page cache. Chunk texts are appended
+    to a text file and addressed by (offset, length), so only the texts of
+    returned rows are ever read. Ids, text spans and metadata are kept
+    column-wise (metadata dictionary-encoded, which makes `where` filters
+    vectorized masks) in an .npz snapshot plus an append-only log of
+    changes; the log is folded into the snapshot on compaction, and the
+    text file is rewritten only once most of it is dead.
+
+    Search is exact up to quantization: masked rows are scored block by
+    block with one matrix-vector product and the top k taken with
+    argpartition.
+    """
+
+    name = "numpy"
+    DTYPES = ("float16", "int8")
+
+    def __init__(self, db_path: Path, collection_name: str, dtype: str = "float16"):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"vector dtype must be one of {', '.join(self.DTYPES)}")
+        self.dir = Path(db_path) / f"{collection_name}.vectors"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._clear_state()
+        self._load()
+
+    # --- public API ---
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._sync()
+            if self._dim is None:
+                self._init_storage(matrix.shape[1])
+            elif matrix.shape[1] != self._dim:
+                raise ValueError(f"embedding dimension {matrix.shape[1]} != index dimension {self._dim}")
+
+            slots, batch_slots = [], {}
+            for doc_id in ids:
+                slot = batch_slots.get(doc_id, self._slots.get(doc_id))
+                if slot is None:
+                    slot = self._allocate_slot()
+                batch_slots[doc_id] = slot
+                slots.append(slot)
+            self._write_vectors(np.asarray(slots), matrix)
+            spans = self._append_texts(documents)
+
+            records = []
+            for slot, doc_id, span, metadata in zip(slots, ids, spans, metadatas):
+                self._set_row(slot, doc_id, span, metadata or {})
+                records.append({"slot": slot, "id": doc_id, "span": span, "metadata": metadata or {}})
+            self._append_log(records)
+
+    def delete(self, ids):
+        with self._lock:
+            self._sync()
+            slots = list(dict.fromkeys(self._slots[doc_id] for doc_id in ids if doc_id in self._slots))
+            if not slots:
+                return
+            for slot in slots:
+                self._clear_row(slot)
+            self._append_log([{"delete": slots}])
+
+    def get(self, ids):
+        with self._lock:
+            self._sync()
+            rows = []
+            for doc_id in ids:
+                slot = self._slots.get(doc_id)
+                if slot is not None:
+                    rows.append((doc_id, self._document(slot), self._row_metadata(slot)))
+            return rows
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            self._sync()
+            records = []
+            for doc_id, metadata in zip(ids, metadatas):
+                slot = self._slots.get(doc_id)
+                if slot is None:
+                    continue
+                merged = {**self._row_metadata(slot), **metadata}
+                span = self._spans[slot].tolist()
+                self._set_row(slot, doc_id, span, merged)
+                records.append({"slot": slot, "id": doc_id, "span": span, "metadata": merged})
+            if records:
+                self._append_log(records)
+
+    def query(self, embedding, n_results, where=None):
+        return self.query_many([embedding], n_results, where)[0]
+
+    def query_many(self, embeddings, n_results, where=None):
+        """All queries share one scan: each block of rows is decoded once and scored with one matmul."""
+        with self._lock:
+            self._sync()
+            if self._dim is None or not self._slots or n_results <= 0 or not embeddings:
+                return [[] for _ in embeddings]
+            queries = np.asarray(embeddings, dtype=np.float32)
+            query_norms = np.linalg.norm(queries, axis=1)
+            units = (queries / np.where(query_norms == 0, 1, query_norms)[:, None]).T
+
+            mask = self._alive[: self._size]
+            if where:
+                mask = mask & self._where_mask(where)
+            candidates = int(mask.sum())
+            if candidates == 0:
+                return [[] for _ in embeddings]
+
+            if candidates * 4 < self._size:
+                # Избирательный фильтр: считаем только подходящие строки
+                rows = np.flatnonzero(mask)
+                distances = np.empty((rows.size, len(queries)), dtype=np.float32)
+                for start in range(0, rows.size, SCAN_BLOCK_ROWS):
+                    block = rows[start : start + SCAN_BLOCK_ROWS]
+                    distances[start : start + block.size] = self._partial_distances(block, units, query_norms)
+            else:
+                # Иначе — непрерывными блоками без копирующей выборки строк; отфильтрованные — +inf
+                rows = None
+                distances = np.full((self._size, len(queries)), np.inf, dtype=np.float32)
+                for start in range(0, self._size, SCAN_BLOCK_ROWS):
+                    end = min(start + SCAN_BLOCK_ROWS, self._size)
+                    block_mask = mask[start:end]
+                    if block_mask.any():
+                        block = self._partial_distances(slice(start, end), units, query_norms)
+                        distances[start:end] = np.where(block_mask[:, None], block, np.inf)
+
+            k = min(n_results, candidates)
+            if k < len(distances):
+                tops = np.argpartition(distances, k - 1, axis=0)[:k].T
+            else:
+                tops = np.tile(np.arange(len(distances)), (len(queries), 1))
+            results = []
+            for column, (top, query_norm) in enumerate(zip(tops, query_norms.tolist())):
+                column_distances = distances[top, column]
+                order = np.argsort(column_distances, kind="stable")[:k]
+                slots = top[order] if rows is None else rows[top[order]]
+                results.append([
+                    (self._ids[slot], self._document(slot), self._row_metadata(slot), max(distance + query_norm * query_norm, 0.0))
+                    for slot, distance in zip(slots.tolist(), column_distances[order].tolist())
+                ])
+            return results
+
+    def _partial_distances(self, rows, units: np.ndarray, query_norms: np.ndarray) -> np.ndarray:
+        """|a - b|² - |b|² for the given rows and every query: |a|² - 2|a||b|cos (|b|² is per query)."""
+        cosine = self._vectors[rows].astype(np.float32) @ units
+        if self._scales is not None:
+            cosine *= self._scales[rows][:, None]
+        norms = self._norms[rows][:, None]
+        return norms * (norms - 2 * query_norms[None, :] * cosine)
+
+    def count(self):
+        with self._lock:
+            self._sync()
+            return len(self._slots)
+
+    def reset(self):
+        with self._lock:
+            self._close_maps()
+            self._close_texts()
+            for path in self.dir.iterdir():
+                path.unlink()
+            self._clear_state()
+            self._stamp = self._file_stamp()
+
+    def close(self):
+        with self._lock:
+            if self._log_rows:
+                self._compact()
+            self._close_maps()
+            self._close_texts()
+            # Закрытый бэкенд можно использовать дальше: следующий вызов заново откроет файлы
+            self._clear_state()
+            self._stamp = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "dtype": self.dtype,
+                "dim": self._dim,
+                "items": len(self._slots),
+                "capacity": self._capacity,
+                "vector_bytes": self._capacity * (self._dim or 0) * np.dtype(self.dtype).itemsize,
+                "text_bytes": int(self._spans[: self._size][self._alive[: self._size], 1].sum()),
+                "log_rows": self._log_rows,
+            }
+
+    # --- metadata filters ---
+
+    def _where_mask(self, where: dict) -> np.ndarray:
+        """Chroma-style filter: {"key": value}, $eq/$ne/$in/$nin, $and/$or."""
+        mask = np.ones(self._size, dtype=bool)
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                masks = [self._where_mask(clause) for clause in condition]
+                combined = np.logical_and.reduce(masks) if key == "$and" else np.logical_or.reduce(masks)
+                mask &= combined
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, value in condition.items():
+                mask &= self._condition_mask(key, op, value)
+        return mask
+
+    def _condition_mask(self, key: str, op: str, value) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            codes = np.full(self._size, -1, dtype=np.int32)
+            column = _Column(0)
+        else:
+            codes = column.codes[: self._size]
+        if op == "$eq":
+            return codes == column.code(value)
+        if op == "$ne":
+            return codes != column.code(value)
+        if op in ("$in", "$nin"):
+            mask = np.isin(codes, [column.code(v) for v in value])
+            return mask if op == "$in" else ~mask
+        raise ValueError(f"Unsupported where operator: {op}")
+
+    # --- rows ---
+
+    def _clear_state(self):
+        self._dim = None
+        self._capacity = 0
+        self._size = 0  # строк когда-либо занятых (дальше — пустые слоты)
+        self._vectors = None
+        self._norms = None
+        self._scales = None
+        self._ids: list[str | None] = []
+        self._spans = np.zeros((0, 2), dtype=np.int64)  # (смещение, длина) текста строки в файле текстов
+        self._texts_name = "documents.0.bin"
+        self._texts = None
+        self._columns: dict[str, _Column] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._slots: dict[str, int] = {}
+        self._free: list[int] = []
+        self._log_rows = 0
+
+    def _set_row(self, slot: int, doc_id: str, span, metadata: dict):
+        old_id = self._ids[slot]
+        if old_id is not None and old_id != doc_id:
+            self._slots.pop(old_id, None)
+        self._ids[slot] = doc_id
+        self._spans[slot] = span
+        self._slots[doc_id] = slot
+        self._alive[slot] = True
+        self._size = max(self._size, slot + 1)
+        for column in self._columns.values():
+            column.codes[slot] = -1
+        for key, value in metadata.items():
+            column = self._columns.get(key)
+            if column is None:
+                column = self._columns[key] = _Column(self._capacity)
+            column.codes[slot] = column.code(value, create=True)
+
+    def _clear_row(self, slot: int):
+        doc_id = self._ids[slot]
+        if doc_id is not None:
+            self._slots.pop(doc_id, None)
+        self._ids[slot] = None
+        self._spans[slot] = 0
+        self._alive[slot] = False
+        for column in self._columns.values():
+            column.codes[slot] = -1
+        self._free.append(slot)
+
+    def _document(self, slot: int) -> str:
+        offset, length = self._spans[slot].tolist()
+        if self._texts is None:
+            self._texts = open(self.dir / self._texts_name, "rb")
+        self._texts.seek(offset)
+        return self._texts.read(length).decode("utf-8")
+
+    def _append_texts(self, documents: list[str]) -> list[list[int]]:
+        """Appends texts to the text file; returns their [offset, length] spans."""
+        spans = []
+        with open(self.dir / self._texts_name, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            for document in documents:
+                data = (document or "").encode("utf-8")
+                f.write(data)
+                spans.append([offset, len(data)])
+                offset += len(data)
+        return spans
+
+    def _close_texts(self):
+        if self._texts is not None:
+            self._texts.close()
+            self._texts = None
+
+    def _row_metadata(self, slot: int) -> dict:
+        metadata = {}
+        for key, column in self._columns.items():
+            code = column.codes[slot]
+            if code >= 0:
+                metadata[key] = column.values[code]
+        return metadata
+
+    def _allocate_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size >= self._capacity:
+            self._grow()
+        # Слот занимается в _set_row; до этого он числится за _size
+        slot = self._size
+        self._size += 1
+        return slot
+
+    # --- storage ---
+
+    def _paths(self):
+        suffix = "f16" if self.dtype == "float16" else "i8"
+        return {
+            "meta": self.dir / "meta.json",
+            "vectors": self.dir / f"vectors.{suffix}",
+            "norms": self.dir / "norms.f32",
+            "scales": self.dir / "scales.f32",
+            "snapshot": self.dir / "rows.npz",
+            "log": self.dir / "columns.log",
+            # Формат до файла текстов: тексты лежали в JSON-снимке и в журнале
+            "legacy": self.dir / "columns.json",
+        }
+
+    def _file_stamp(self):
+        paths = self._paths()
+        stamp = []
+        for key in ("meta", "snapshot", "log"):
+            try:
+                st = os.stat(paths[key])
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _sync(self):
+        """Picks up changes written by another process sharing the directory."""
+        if self._file_stamp() != self._stamp:
+            self._close_maps()
+            self._close_texts()
+            self._clear_state()
+            self._load()
+
+    def _load(self):
+        paths = self._paths()
+        try:
+            with open(paths["meta"], "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            self._stamp = self._file_stamp()
+            return
+        # Тип векторов задаётся при создании хранилища; настройка действует после full=True
+        self.dtype = meta.get("dtype", self.dtype)
+        self._dim = meta["dim"]
+        self._capacity = meta["capacity"]
+        self._open_maps()
+        self._ids = [None] * self._capacity
+        self._spans = np.zeros((self._capacity, 2), dtype=np.int64)
+        self._alive = np.zeros(self._capacity, dtype=bool)
+
+        migrate = not paths["snapshot"].exists() and paths["legacy"].exists()
+        ids = self._load_legacy_snapshot() if migrate else self._load_snapshot()
+        self._ids[: len(ids)] = ids
+        for slot, doc_id in enumerate(ids):
+            if doc_id is not None:
+                self._slots[doc_id] = slot
+                self._alive[slot] = True
+        self._size = len(ids)
+
+        self._replay_log()
+        self._free = sorted(set(range(self._size)) - set(self._slots.values()), reverse=True)
+        if migrate:
+            self._compact()
+            paths["legacy"].unlink(missing_ok=True)
+        self._stamp = self._file_stamp()
+
+    def _load_snapshot(self) -> list:
+        """Reads ids, text spans and metadata columns; returns the ids by slot."""
+        try:
+            with np.load(self._paths()["snapshot"], allow_pickle=False) as data:
+                ids = [doc_id or None for doc_id in data["ids"].tolist()]
+                spans = data["spans"]
+                codes = data["codes"]
+                header = json.loads(str(data["header"]))
+        except (OSError, KeyError, ValueError):
+            return []
+        self._texts_name = header["texts"]
+        self._spans[: len(ids)] = spans
+        for row, (key, values) in enumerate(header["columns"]):
+            self._columns[key] = _Column(self._capacity, values, codes[row])
+        return ids
+
+    def _load_legacy_snapshot(self) -> list:
+        """Reads a JSON snapshot that still holds the texts, moving them to the text file."""
+        try:
+            with open(self._paths()["legacy"], "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return []
+        ids = snapshot["ids"]
+        spans = self._append_texts(snapshot["documents"])
+        if spans:
+            self._spans[: len(ids)] = spans
+        for key, column in snapshot["columns"].items():
+            self._columns[key] = _Column(self._capacity, column["values"], np.asarray(column["codes"], dtype=np.int32))
+        return ids
+
+    def _replay_log(self):
+        try:
+            with open(self._paths()["log"], "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # Оборванная последняя запись (процесс упал посреди записи)
+                continue
+            self._log_rows += 1
+            if "delete" in record:
+                for slot in record["delete"]:
+                    if slot < self._size and self._ids[slot] is not None:
+                        self._slots.pop(self._ids[slot], None)
+                        self._ids[slot] = None
+                        self._spans[slot] = 0
+                        self._alive[slot] = False
+                        for column in self._columns.values():
+                            column.codes[slot] = -1
+                continue
+            slot = record["slot"]
+            if slot >= self._capacity:
+                continue
+            # Запись старого формата несёт сам текст (переносится в файл текстов при миграции)
+            span = record["span"] if "span" in record else self._append_texts([record["document"]])[0]
+            self._set_row(slot, record["id"], span, record["metadata"])
+
+    def _append_log(self, records: list[dict]):
+        # Векторы сбрасываем до журнала: запись в журнале означает, что вектор уже на диске
+        self._flush_maps()
+        with open(self._paths()["log"], "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._log_rows += len(records)
+        if self._log_rows > max(COMPACT_MIN_LOG_ROWS, len(self._slots)):
+            self._compact()
+        self._stamp = self._file_stamp()
+
+    def _compact(self):
+        """Writes the row snapshot and truncates the log; rewrites the text file if it is mostly dead."""
+        paths = self._paths()
+        old_texts = None
+        texts_size = (self.dir / self._texts_name).stat().st_size if (self.dir / self._texts_name).exists() else 0
+        live_bytes = int(self._spans[: self._size][self._alive[: self._size], 1].sum())
+        if texts_size > COMPACT_MIN_TEXT_BYTES and live_bytes * 2 < texts_size:
+            old_texts = self._texts_name
+            self._rewrite_texts()
+
+        columns = [
+            (key, column) for key, column in self._columns.items()
+            if (column.codes[: self._size] >= 0).any()
+        ]
+        header = {"texts": self._texts_name, "columns": [[key, column.values] for key, column in columns]}
+        codes = (
+            np.stack([column.codes[: self._size] for _, column in columns])
+            if columns else np.zeros((0, self._size), dtype=np.int32)
+        )
+        tmp_path = paths["snapshot"].with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            ids=np.asarray([doc_id or "" for doc_id in self._ids[: self._size]], dtype=str),
+            spans=self._spans[: self._size],
+            codes=codes,
+            header=np.asarray(json.dumps(header, ensure_ascii=False)),
+        )
+        # Снимок ссылается на новый файл текстов только после атомарной замены
+        os.replace(tmp_path, paths["snapshot"])
+        paths["log"].unlink(missing_ok=True)
+        if old_texts is not None:
+            (self.dir / old_texts).unlink(missing_ok=True)
+        self._log_rows = 0
+        self._stamp = self._file_stamp()
+
+    def _rewrite_texts(self):
+        """Copies live texts to a new text file (next generation name) and repoints their spans."""
+        generation = int(self._texts_name.split(".")[1]) + 1
+        name = f"documents.{generation}.bin"
+        spans = self._spans.copy()
+        offset = 0
+        with open(self.dir / name, "wb") as f:
+            for slot in np.flatnonzero(self._alive[: self._size]).tolist():
+                data = self._document(slot).encode("utf-8")
+                f.write(data)
+                spans[slot] = (offset, len(data))
+                offset += len(data)
+        self._close_texts()
+        self._spans = spans
+        self._texts_name = name
+
+    def _write_vectors(self, slots: np.ndarray, matrix: np.ndarray):
+        norms = np.linalg.norm(matrix, axis=1)
+        unit = matrix / np.where(norms == 0, 1, norms)[:, None]
+        self._norms[slots] = norms
+        if self._scales is None:
+            self._vectors[slots] = unit.astype(np.float16)
+            return
+        # Симметричное квантование строки: max|x| -> 127
+        scales = np.abs(unit).max(axis=1) / 127
+        scales[scales == 0] = 1
+        self._vectors[slots] = np.clip(np.rint(unit / scales[:, None]), -127, 127).astype(np.int8)
+        self._scales[slots] = scales
+
+    def _init_storage(self, dim: int):
+        self._dim = dim
+        self._capacity = INITIAL_CAPACITY
+        self._resize_files(self._capacity)
+        self._open_maps()
+        self._ids = [None] * self._capacity
+        self._spans = np.zeros((self._capacity, 2), dtype=np.int64)
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._write_meta()
+
+    def _grow(self):
+        old_capacity = self._capacity
+        self._close_maps()
+        self._capacity = old_capacity * 2
+        self._resize_files(self._capacity)
+        self._open_maps()
+        self._ids.extend([None] * (self._capacity - old_capacity))
+        spans = np.zeros((self._capacity, 2), dtype=np.int64)
+        spans[:old_capacity] = self._spans
+        self._spans = spans
+        alive = np.zeros(self._capacity, dtype=bool)
+        alive[:old_capacity] = self._alive
+        self._alive = alive
+        for column in self._columns.values():
+            column.grow(self._capacity)
+        self._write_meta()
+
+    def _resize_files(self, capacity: int):
+        paths = self._paths()
+        files = [(paths["vectors"], self._dim * (2 if self.dtype == "float16" else 1)), (paths["norms"], 4)]
+        if self.dtype == "int8":
+            files.append((paths["scales"], 4))
+        for path, row_bytes in files:
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+
+    def _open_maps(self):
+        paths = self._paths()
+        shape = (self._capacity, self._dim)
+        self._vectors = np.memmap(paths["vectors"], dtype=np.dtype(self.dtype), mode="r+", shape=shape)
+        self._norms = np.memmap(paths["norms"], dtype=np.float32, mode="r+", shape=(self._capacity,))
+        if self.dtype == "int8":
+            self._scales = np.memmap(paths["scales"], dtype=np.float32, mode="r+", shape=(self._capacity,))
+
+    def _flush_maps(self):
+        for array in (self._vectors, self._norms, self._scales):
+            if array is not None:
+                array.flush()
+
+    def _close_maps(self):
+        self._flush_maps()
+        self._vectors = self._norms = self._scales = None
+
+    def _write_meta(self):
+        tmp_path = self._paths()["meta"].with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "capacity": self._capacity, "dtype": self.dtype}, f)
+        os.replace(tmp_path, self._paths()["meta"])
+
+
+BACKENDS = {"chroma": ChromaBackend, "numpy": NumpyBackend}
+
+
+def open_backend(name: str, db_path: Path, collection_name: str, **options) -> VectorBackend:
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown vector backend {name!r}; expected one of {', '.join(BACKENDS)}")
+    return backend_class(db_path, collection_name, **options)
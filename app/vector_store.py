@@ -1,121 +1,401 @@
-import sys
-import json
-import requests
+import logging
+from itertools import islice
 from pathlib import Path
 
+from app.config import settings
+from app.dedup import DedupIndex
+from app.embedding_cache import EmbeddingCache
+from app.embeddings import get_embedder
+from app.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from app.manifest import assign_chunk_ids
+from app.metrics import metrics
+from app.search_cache import index_generations
+from app.symbols import SymbolTable
+from app.vector_backends import open_backend
+
+logger = logging.getLogger("vox-brain")
+
+
+def _as_result(doc_id: str, content: str, meta: dict | None, relevance: float) -> dict:
+    """Search result dict; line numbers are kept when the chunk has them."""
+    meta = meta or {}
+    result = {
+        "id": doc_id,
+        "content": content,
+        "source": meta.get("source", "unknown"),
+        "relevance": relevance,
+    }
+    if "start_line" in meta:
+        result["start_line"] = meta["start_line"]
+        result["end_line"] = meta.get("end_line", meta["start_line"])
+    if meta.get("alternate_sources"):
+        result["alternate_sources"] = meta["alternate_sources"].split(", ")
+    return result
+
+
 def get_ollama_embedding(model_name, prompt):
     """
     Gets an embedding from the Ollama API.
+    Raises EmbeddingError if Ollama is unreachable after retries.
     """
-    try:
-        response = requests.post(
-            "http://localhost:11434/api/embeddings",
-            data=json.dumps({
-                "model": model_name,
-                "prompt": prompt
-            })
-        )
-        response.raise_for_status()
-        return response.json()["embedding"]
-    except requests.exceptions.RequestException as e:
-        print(f"Error getting Ollama embedding: {e}")
-        print("Please ensure Ollama is running and the model is available.")
-        sys.exit(1)
+    return get_embedder(model_name).embed(prompt)
 
 
 class VectorStoreManager:
-    """Manages ChromaDB integration."""
+    """Manages a project's vector collection (Chroma or the NumPy backend)."""
 
-    def __init__(self, db_path: str, collection_name: str = "default"):
+    def __init__(self, db_path: str, collection_name: str = "default", backend: str | None = None):
         self.db_path = Path(db_path)
         self.db_path.mkdir(parents=True, exist_ok=True)
         self.collection_name = collection_name
-        import chromadb
+        self.backend_name = backend or settings.vector_backend
+        options = {"dtype": settings.vector_dtype} if self.backend_name == "numpy" else {}
+        self._backend = open_backend(self.backend_name, self.db_path, collection_name, **options)
+        self._embedding_caches: dict[str, EmbeddingCache] = {}
+        self._lexical: LexicalIndex | None = None
+        self._symbols: SymbolTable | None = None
+        self._dedup: DedupIndex | None = None
+
+    def backend_file(self, name: str) -> str:
+        """Path of a per-backend side file (manifest, dedup groups, BM25, symbols) next to the store."""
+        # У каждого бэкенда свои файлы: после переключения проект переиндексируется в новый
+        backend = "" if self.backend_name == "chroma" else f".{self.backend_name}"
+        return str(self.db_path / f"{self.collection_name}{backend}.{name}")
 
-        self._chroma_client = chromadb.PersistentClient(path=str(self.db_path))
-        self._collection = self._chroma_client.get_or_create_collection(
-            name=self.collection_name
-        )
+    @property
+    def lexical(self) -> LexicalIndex:
+        """BM25 index over the same chunks, loaded on first use."""
+        if self._lexical is None:
+            self._lexical = LexicalIndex(
+                self.backend_file("bm25.npz"),
+                k1=settings.bm25_k1,
+                b=settings.bm25_b,
+            )
+        return self._lexical
 
-    def add_documents(self, documents: list, model: str):
+    @property
+    def symbols(self) -> SymbolTable:
+        """Symbol -> chunk table, loaded on first use."""
+        if self._symbols is None:
+            self._symbols = SymbolTable(self.backend_file("symbols.json"))
+        return self._symbols
+
+    @property
+    def dedup(self) -> DedupIndex:
+        """Near-duplicate chunk groups, loaded on first use."""
+        if self._dedup is None:
+            self._dedup = DedupIndex(self.backend_file("dedup.npz"), settings.dedup_threshold)
+        return self._dedup
+
+    def _get_embedding_cache(self, model: str) -> EmbeddingCache | None:
+        if not settings.embedding_cache_enabled:
+            return None
+        cache = self._embedding_caches.get(model)
+        if cache is None:
+            cache = EmbeddingCache(
+                self.db_path / "embedding_cache", model, settings.embedding_cache_size
+            )
+            self._embedding_caches[model] = cache
+        return cache
+
+    def embed_texts(self, texts: list[str], model: str) -> list[list[float]]:
         """
-        Adds a list of documents to the vector store.
+        Embeds texts, serving repeats from the embedding cache and
+        sending only the misses to Ollama.
         """
-        print(f"Adding {len(documents)} documents to the vector store...")
+        cache = self._get_embedding_cache(model)
+        metrics.inc("embed.texts", len(texts))
+        if cache is None:
+            return get_embedder(model).embed_many(texts)
 
-        # Prepare documents for ChromaDB
-        doc_contents = []
-        metadatas = []
-        ids = []
-        embeddings = []
+        embeddings = cache.get_many(texts)
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        metrics.inc("embed.cache_hits", len(texts) - len(missing))
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = get_embedder(model).embed_many(missing_texts)
+            for i, emb in zip(missing, fresh):
+                embeddings[i] = emb
+            # На диск сбрасываем раз на батч индексации и при закрытии, а не на каждый промах
+            cache.put_many(missing_texts, fresh)
+        return embeddings
 
-        for i, doc in enumerate(documents):
-            doc_contents.append(doc.page_content)
-            metadatas.append(doc.metadata)
-            ids.append(f"doc_{i}") # Simple ID for now
+    def add_documents(self, documents, model: str, batch_size: int | None = None):
+        """
+        Adds documents to the vector store.
+        Accepts any iterable (e.g. chunker.iter_chunks); documents are
+        embedded and written in fixed-size batches as they arrive.
+        """
+        batch_size = batch_size or settings.index_batch_size
+        logger.info("Adding documents to the vector store...")
 
-            # Get embedding from Ollama
-            embedding = get_ollama_embedding(model, doc.page_content)
-            embeddings.append(embedding)
+        total = 0
+        seen = {}
+        iterator = iter(documents)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            self.upsert_documents(batch, assign_chunk_ids(batch, seen), model)
+            total += len(batch)
+            logger.info(f"  Indexed {total} items")
 
-            print(f"  Embedded document {i+1}/{len(documents)}")
+        logger.info(f"Indexed {total} items into {self.backend_name}")
 
-        # Add to ChromaDB in batches
-        batch_size = 100
-        for i in range(0, len(doc_contents), batch_size):
-            batch_docs = doc_contents[i : i + batch_size]
-            batch_meta = metadatas[i : i + batch_size]
-            batch_ids = ids[i : i + batch_size]
-            batch_embeddings = embeddings[i : i + batch_size]
+    def upsert_documents(self, documents: list, ids: list[str], model: str):
+        """
+        Embeds and upserts documents under the given ids.
+        """
+        if not documents:
+            return
 
-            self._collection.add(
-                documents=batch_docs,
-                metadatas=batch_meta,
-                ids=batch_ids,
-                embeddings=batch_embeddings
-            )
-            print(
-                f"  Indexed {min(i + batch_size, len(doc_contents))}/{len(doc_contents)} items"
-            )
+        with metrics.span("index.embed"):
+            embeddings = self.embed_texts([doc.page_content for doc in documents], model)
+        # Поколение меняется после записи (и при сбое посреди неё): поиск,
+        # начатый до конца записи, не попадёт в кэш как актуальный
+        try:
+            with metrics.span("index.write"):
+                self._backend.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=[doc.page_content for doc in documents],
+                    metadatas=[doc.metadata for doc in documents],
+                )
+                if settings.hybrid_search:
+                    for doc, doc_id in zip(documents, ids):
+                        self.lexical.add(doc_id, doc.page_content)
+        finally:
+            index_generations.bump(self.db_path)
+
+    def delete_ids(self, ids: list[str]):
+        """
+        Deletes items by id. Aliases of near-duplicate groups only leave
+        their group; a stored chunk is deleted once its group is empty.
+        """
+        ids = self.dedup.remove(ids)
+        try:
+            batch_size = 500
+            for i in range(0, len(ids), batch_size):
+                self._backend.delete(ids[i : i + batch_size])
+            if settings.hybrid_search:
+                for doc_id in ids:
+                    self.lexical.remove(doc_id)
+        finally:
+            index_generations.bump(self.db_path)
+        self.refresh_duplicates()
+
+    def relocate(self, ranges: dict[str, tuple]):
+        """
+        Rewrites start_line/end_line of already stored chunks whose text
+        moved within its file (no re-embedding). `ranges` maps chunk id to
+        (start_line, end_line).
+        """
+        own = {
+            chunk_id: lines for chunk_id, lines in ranges.items()
+            if not self.dedup.relocate(chunk_id, *lines)
+        }
+        if own:
+            try:
+                self._backend.update_metadata(
+                    list(own), [{"start_line": start, "end_line": end} for start, end in own.values()]
+                )
+            finally:
+                index_generations.bump(self.db_path)
+        self.refresh_duplicates()
+
+    def refresh_duplicates(self):
+        """Rewrites location metadata of stored chunks whose duplicate group changed."""
+        stored_ids = self.dedup.take_dirty()
+        if not stored_ids:
+            return
+        try:
+            self._backend.update_metadata(stored_ids, [self.dedup.group_metadata(doc_id) for doc_id in stored_ids])
+        finally:
+            index_generations.bump(self.db_path)
+
+    def reset(self):
+        """Drops every item in the collection."""
+        try:
+            self._backend.reset()
+            if settings.hybrid_search:
+                self.lexical.clear()
+                self.lexical.save()
+            self.symbols.clear()
+            self.symbols.save()
+            self.dedup.clear()
+            self.dedup.save()
+        finally:
+            index_generations.bump(self.db_path)
+
+    def sync_lexical(self, expected_ids: set[str]):
+        """
+        Makes the lexical index hold exactly `expected_ids`, fetching the
+        text of missing chunks from the vector store. Repairs an index left behind
+        by an interrupted run or built before hybrid search existed.
+        """
+        if not settings.hybrid_search:
+            return
+        # Псевдонимы дубликатов в индексе не хранятся — только их общий чанк
+        expected_ids = {self.dedup.resolve(doc_id) for doc_id in expected_ids}
+        present = self.lexical.ids()
+        extra = present - expected_ids
+        missing = list(expected_ids - present)
+        for doc_id in extra:
+            self.lexical.remove(doc_id)
+
+        batch_size = 500
+        for i in range(0, len(missing), batch_size):
+            for doc_id, doc, _ in self._backend.get(missing[i : i + batch_size]):
+                self.lexical.add(doc_id, doc or "")
 
-        print(f"Indexed {len(doc_contents)} items into ChromaDB")
+        if extra or missing:
+            self.lexical.save()
+
+    def save_lexical(self):
+        if settings.hybrid_search and self._lexical is not None:
+            self._lexical.save()
+
+    def flush_embeddings(self):
+        """Syncs the embedding caches' memory maps to disk."""
+        for cache in self._embedding_caches.values():
+            cache.flush()
+
+    def close(self):
+        """Flushes caches; the store can be reopened later."""
+        self.flush_embeddings()
+        self.save_lexical()
+        self._backend.close()
+
+    def get_by_ids(self, ids: list[str]) -> list[dict]:
+        """
+        Fetches chunks by id, in the given order, in the same shape as search
+        results. A near-duplicate alias comes back with the stored chunk's
+        text and its own location.
+        """
+        if not ids:
+            return []
+        stored = {doc_id: self.dedup.resolve(doc_id) for doc_id in ids}
+        by_id = {
+            doc_id: _as_result(doc_id, doc, meta, 0.0)
+            for doc_id, doc, meta in self._backend.get(list(dict.fromkeys(stored.values())))
+        }
+        results = []
+        for doc_id in ids:
+            hit = by_id.get(stored[doc_id])
+            if hit is None:
+                continue
+            if stored[doc_id] != doc_id:
+                _, source, start_line, end_line = self.dedup.member(doc_id)
+                hit = dict(hit, id=doc_id, source=source)
+                if start_line is not None:
+                    hit.update(start_line=start_line, end_line=end_line)
+            results.append(hit)
+        return results
+
+    def hybrid_search(
+        self, query_text: str, lexical_query: str, model: str, n_results: int = 10
+    ) -> list:
+        """
+        Vector search fused with BM25 hits by reciprocal rank fusion.
+        Results keep their vector 'relevance' (0 for lexical-only hits)
+        and gain 'lexical_score' and 'fusion_score'.
+        """
+        return self.hybrid_search_many([query_text], [lexical_query], model, n_results)[0]
+
+    def hybrid_search_many(
+        self,
+        query_texts: list[str],
+        lexical_queries: list[str],
+        model: str,
+        n_results: int = 10,
+        query_embeddings: list[list[float]] | None = None,
+    ) -> list[list]:
+        """hybrid_search for several queries: one embedding call, one vector query."""
+        vector_hits = self.search_many(query_texts, model, n_results=n_results, query_embeddings=query_embeddings)
+        with metrics.span("search.bm25"):
+            lexical_hits = [self.lexical.search(query, n_results=n_results) for query in lexical_queries]
+
+        fused = [
+            reciprocal_rank_fusion(
+                [[hit["id"] for hit in vector], [doc_id for doc_id, _ in lexical]], k=settings.rrf_k
+            )[:n_results] if lexical else None
+            for vector, lexical in zip(vector_hits, lexical_hits)
+        ]
+
+        # Тексты чанков, найденных только BM25, — одним запросом на все запросы
+        # (вектором найденные для другого запроса уже есть в known)
+        known = {hit["id"]: hit for hits in vector_hits for hit in hits}
+        lexical_only = {doc_id for ranking in fused if ranking for doc_id, _ in ranking if doc_id not in known}
+        known.update((hit["id"], hit) for hit in self.get_by_ids(sorted(lexical_only)))
+
+        results = []
+        for vector, lexical, ranking in zip(vector_hits, lexical_hits, fused):
+            if ranking is None:
+                results.append(vector)
+                continue
+            lexical_scores = dict(lexical)
+            by_id = {hit["id"]: hit for hit in vector}
+            merged = []
+            for doc_id, fusion_score in ranking:
+                hit = by_id.get(doc_id)
+                if hit is None and doc_id in known:
+                    # Найден только BM25: векторной близости для этого запроса нет
+                    hit = dict(known[doc_id], relevance=0.0, lexical_only=True)
+                if hit is None:
+                    continue
+                hit["lexical_score"] = lexical_scores.get(doc_id, 0.0)
+                hit["fusion_score"] = fusion_score
+                merged.append(hit)
+            results.append(merged)
+        return results
 
     def get_stats(self) -> dict:
         """Get collection statistics."""
         return {
             "collection_name": self.collection_name,
-            "total_items": self._collection.count(),
+            "total_items": self._backend.count(),
+            "backend": self._backend.stats(),
             "db_path": str(self.db_path),
+            "embedding_cache": [
+                cache.stats() for cache in self._embedding_caches.values()
+            ],
+            "lexical_items": len(self._lexical) if self._lexical is not None else None,
+            "symbols": len(self.symbols),
+            "dedup": self.dedup.stats(),
         }
 
     def search(self, query_text: str, model: str, n_results: int = 10, where_filter: dict | None = None) -> list:
         """
         Searches the vector store for a given query with optional metadata filtering.
         """
-        print(f"Searching for: '{query_text}' using model {model}")
+        return self.search_many([query_text], model, n_results, where_filter)[0]
+
+    def search_many(
+        self,
+        query_texts: list[str],
+        model: str,
+        n_results: int = 10,
+        where_filter: dict | None = None,
+        query_embeddings: list[list[float]] | None = None,
+    ) -> list[list]:
+        """
+        Vector search for several queries: embedded together and sent as one
+        multi-vector query. Pass `query_embeddings` when the caller already
+        has them (e.g. one query searched across several stores).
+        """
+        logger.debug(f"Searching for: {', '.join(repr(q) for q in query_texts)} using model {model}")
 
-        # Get embedding for the query
-        query_embedding = get_ollama_embedding(model, query_text)
+        # Get embeddings for the queries
+        if query_embeddings is None:
+            with metrics.span("search.embed_query"):
+                query_embeddings = self.embed_texts(query_texts, model)
 
         # Query the collection
-        results = self._collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where_filter
-        )
-
-        # Format and return results
-        formatted_results = []
-        if results and results.get("documents") and results["documents"][0]:
-            for i, doc in enumerate(results["documents"][0]):
-                meta = results["metadatas"][0][i] if results.get("metadatas") else {}
-                distance = results["distances"][0][i] if results.get("distances") else 0
-                formatted_results.append(
-                    {
-                        "content": doc,
-                        "source": meta.get("source", "unknown"),
-                        "relevance": 1 - distance,  # Convert distance to similarity
-                    }
-                )
+        with metrics.span("search.vector_query"):
+            hits = self._backend.query_many(query_embeddings, n_results, where=where_filter)
 
-        return formatted_results
+        # Convert distance to similarity
+        return [
+            [_as_result(doc_id, doc, meta, 1 - distance) for doc_id, doc, meta, distance in query_hits]
+            for query_hits in hits
+        ]
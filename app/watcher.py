@@ -0,0 +1,291 @@
+import logging
+import os
+import threading
+import time
+
+from app.config import settings
+from app.metrics import metrics
+
+
+logger = logging.getLogger("vox-brain")
+
+
+class ProjectWatcher:
+    """
+    Keeps one project's index live: filesystem changes are collected into a
+    pending set, debounced, and applied with indexer.update_files on a
+    background thread while searches keep being served from the store.
+
+    Changes are detected with watchdog (inotify/FSEvents) when it is
+    installed, otherwise by polling file mtimes/sizes. When more than
+    `max_pending` distinct paths pile up (or a whole directory changes),
+    the queue collapses into one incremental sync of the project.
+    """
+
+    def __init__(
+        self,
+        root_path: str,
+        model: str,
+        debounce: float | None = None,
+        poll_interval: float | None = None,
+        max_pending: int | None = None,
+        backend: str | None = None,
+    ):
+        self.root_path = os.path.abspath(root_path)
+        self.model = model
+        self.debounce = settings.watch_debounce if debounce is None else debounce
+        self.poll_interval = settings.watch_poll_interval if poll_interval is None else poll_interval
+        self.max_pending = max_pending or settings.watch_max_pending
+        self.backend = backend or settings.watch_backend
+
+        self._cond = threading.Condition()
+        self._pending: dict[str, float] = {}  # путь -> время последнего события
+        # При старте догоняем изменения, сделанные пока watcher был выключен
+        self._full_sync = True
+        self._first_pending_at: float | None = time.monotonic()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._observer = None
+        self._snapshot: dict[str, tuple[int, int]] = {}
+
+        self.events = 0
+        self.batches = 0
+        self.full_syncs = 0
+        self.overflows = 0
+        self.files_updated = 0
+        self.busy = False
+        self.last_batch: dict | None = None
+        self.last_error: str | None = None
+
+    # --- жизненный цикл ---
+
+    def start(self):
+        self.backend = self._start_detector()
+        worker = threading.Thread(target=self._run_worker, name="rag-watch-update", daemon=True)
+        worker.start()
+        self._threads.append(worker)
+        logger.info(f"👀 Watching {self.root_path} ({self.backend})")
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def _start_detector(self) -> str:
+        if self.backend in ("auto", "watchdog"):
+            try:
+                self._start_watchdog()
+                return "watchdog"
+            except ImportError:
+                if self.backend == "watchdog":
+                    raise
+        self._snapshot = self._scan()
+        poller = threading.Thread(target=self._run_poller, name="rag-watch-poll", daemon=True)
+        poller.start()
+        self._threads.append(poller)
+        return "poll"
+
+    # --- обнаружение изменений ---
+
+    def _start_watchdog(self):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed_no_write"):
+                    return
+                if event.is_directory:
+                    # Переименование/удаление каталога — проще пересинхронизировать проект
+                    if event.event_type in ("moved", "deleted"):
+                        watcher._request_full_sync()
+                    return
+                watcher._notify(event.src_path)
+                if getattr(event, "dest_path", None):
+                    watcher._notify(event.dest_path)
+
+        observer = Observer()
+        observer.schedule(Handler(), self.root_path, recursive=True)
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        from app.chunker import iter_project_files
+
+        snapshot = {}
+        for full_path in iter_project_files(self.root_path):
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            snapshot[os.path.relpath(full_path, self.root_path)] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _run_poller(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                current = self._scan()
+            except Exception as e:
+                self.last_error = f"poll: {e}"
+                continue
+            previous = self._snapshot
+            changed = [path for path, state in current.items() if previous.get(path) != state]
+            changed.extend(path for path in previous.keys() - current.keys())
+            self._snapshot = current
+            for path in changed:
+                self._notify(os.path.join(self.root_path, path))
+
+    def _notify(self, full_path: str):
+        from app.chunker import is_indexable
+
+        relative_path = os.path.relpath(full_path, self.root_path)
+        if relative_path.startswith("..") or not is_indexable(relative_path):
+            return
+        now = time.monotonic()
+        with self._cond:
+            self.events += 1
+            metrics.inc("watch.events")
+            if self._full_sync:
+                return
+            self._pending[relative_path] = now
+            if self._first_pending_at is None:
+                self._first_pending_at = now
+            if len(self._pending) > self.max_pending:
+                # Обратное давление: вместо бесконечной очереди — одна полная синхронизация
+                self.overflows += 1
+                metrics.inc("watch.overflows")
+                self._pending = {}
+                self._full_sync = True
+            self._cond.notify()
+
+    def _request_full_sync(self):
+        with self._cond:
+            self._pending = {}
+            self._full_sync = True
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            self._cond.notify()
+
+    # --- применение изменений ---
+
+    def _take_batch(self) -> tuple[list[str], bool] | None:
+        """Waits for a quiet period (or the max delay) and takes the pending changes."""
+        with self._cond:
+            while not self._stop.is_set():
+                if not self._pending and not self._full_sync:
+                    self._cond.wait(timeout=1.0)
+                    continue
+                now = time.monotonic()
+                last_event = max(self._pending.values(), default=self._first_pending_at or now)
+                quiet_for = now - last_event
+                waited = now - (self._first_pending_at or now)
+                # Пока файлы продолжают меняться — ждём, но не дольше 10 × debounce
+                if quiet_for < self.debounce and waited < self.debounce * 10:
+                    self._cond.wait(timeout=self.debounce - quiet_for)
+                    continue
+                paths, full = list(self._pending), self._full_sync
+                self._pending = {}
+                self._full_sync = False
+                self._first_pending_at = None
+                return paths, full
+        return None
+
+    def _run_worker(self):
+        from app.indexer import index_project_incremental, project_write_lock, update_files
+        from app.store_registry import registry
+
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            paths, full = batch
+            self.busy = True
+            start = time.perf_counter()
+            try:
+                with (
+                    project_write_lock(self.root_path),
+                    registry.checkout(self.root_path) as vector_store,
+                    metrics.span("watch.update"),
+                ):
+                    if full:
+                        stats = index_project_incremental(self.root_path, vector_store, self.model)
+                        self.full_syncs += 1
+                    else:
+                        stats = update_files(self.root_path, vector_store, self.model, paths)
+                self.batches += 1
+                self.files_updated += stats["files_changed"] + stats["files_removed"]
+                self.last_batch = {
+                    "paths": len(paths),
+                    "full_sync": full,
+                    "seconds": round(time.perf_counter() - start, 3),
+                    **stats,
+                }
+                self.last_error = None
+            except Exception as e:
+                logger.exception(f"Live index update failed for {self.root_path}")
+                self.last_error = str(e)
+                # Не теряем изменения: следующая попытка — полная синхронизация
+                self._request_full_sync()
+                self._stop.wait(max(self.debounce, 1.0))
+            finally:
+                self.busy = False
+
+    def stats(self) -> dict:
+        with self._cond:
+            oldest = self._first_pending_at
+            return {
+                "project": self.root_path,
+                "backend": self.backend,
+                "queue_depth": len(self._pending),
+                "full_sync_pending": self._full_sync,
+                "oldest_pending_s": round(time.monotonic() - oldest, 3) if oldest else 0.0,
+                "busy": self.busy,
+                "events": self.events,
+                "batches": self.batches,
+                "full_syncs": self.full_syncs,
+                "overflows": self.overflows,
+                "files_updated": self.files_updated,
+                "max_pending": self.max_pending,
+                "last_batch": self.last_batch,
+                "last_error": self.last_error,
+            }
+
+
+class WatcherRegistry:
+    """Active watchers keyed by absolute project path."""
+
+    def __init__(self):
+        self._watchers: dict[str, ProjectWatcher] = {}
+        self._lock = threading.Lock()
+
+    def start(self, project_path: str, model: str) -> ProjectWatcher:
+        key = os.path.abspath(project_path)
+        with self._lock:
+            watcher = self._watchers.get(key)
+            if watcher is None:
+                watcher = ProjectWatcher(key, model)
+                watcher.start()
+                self._watchers[key] = watcher
+            return watcher
+
+    def stop(self, project_path: str) -> bool:
+        with self._lock:
+            watcher = self._watchers.pop(os.path.abspath(project_path), None)
+        if watcher is None:
+            return False
+        watcher.stop()
+        return True
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [watcher.stats() for watcher in self._watchers.values()]
+
+
+watchers = WatcherRegistry()
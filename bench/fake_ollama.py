@@ -0,0 +1,142 @@
+"""
+Local stand-in for the Ollama HTTP API used by benchmarks.
+
+Embeddings are deterministic (seeded from the text hash, unit length),
+so runs are reproducible; latency is configurable per request and per input.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vector /= np.linalg.norm(vector) or 1.0
+    return vector.tolist()
+
+
+class FakeOllamaServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dim: int = 768,
+        latency_ms: float = 0.0,
+        per_item_ms: float = 0.0,
+        chat_reply: str = "search, index, vector",
+    ):
+        self.dim = dim
+        self.latency = latency_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.chat_reply = chat_reply
+        self.requests = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Иначе keep-alive + Nagle добавляют ~40 мс к каждому ответу
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                server.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+
+                if self.path == "/api/embed":
+                    inputs = request.get("input", [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    time.sleep(server.latency + server.per_item * len(inputs))
+                    self._send_json({
+                        "model": request.get("model", ""),
+                        "embeddings": [fake_embedding(text, server.dim) for text in inputs],
+                    })
+                elif self.path == "/api/embeddings":
+                    time.sleep(server.latency + server.per_item)
+                    self._send_json({"embedding": fake_embedding(request.get("prompt", ""), server.dim)})
+                elif self.path == "/api/chat":
+                    time.sleep(server.latency)
+                    self._send_chat(request)
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+
+            def _send_chat(self, request: dict):
+                message = {"role": "assistant", "content": server.chat_reply}
+                if not request.get("stream"):
+                    self._send_json({"model": request.get("model", ""), "message": message, "done": True})
+                    return
+                # Потоковый ответ: NDJSON, по слову на строку
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                words = server.chat_reply.split(" ")
+                for i, word in enumerate(words):
+                    piece = word if i == 0 else " " + word
+                    self._write_chunk({"model": request.get("model", ""), "message": {"role": "assistant", "content": piece}, "done": False})
+                    time.sleep(server.per_item)
+                self._write_chunk({"model": request.get("model", ""), "message": {"role": "assistant", "content": ""}, "done": True})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, payload: dict):
+                data = json.dumps(payload).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fake Ollama server for benchmarks")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeOllamaServer(port=args.port, dim=args.dim, latency_ms=args.latency_ms, per_item_ms=args.per_item_ms)
+    print(f"Fake Ollama listening on {fake.url}")
+    fake._httpd.serve_forever()
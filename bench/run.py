@@ -0,0 +1,242 @@
+"""
+Indexing and search benchmark.
+
+Generates a synthetic project, starts a local Ollama stand-in and measures
+chunking, indexing and search through the same code paths the server uses.
+The report is JSON so runs on different commits can be diffed:
+
+    python -m bench.run --files 2000 --output before.json
+    python -m bench.run --files 2000 --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.fake_ollama import FakeOllamaServer
+from bench.synth_repo import generate_queries, generate_repo
+
+
+EMBED_MODEL = "bench-embed"
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def peak_rss_mb() -> dict:
+    # На Linux ru_maxrss в килобайтах, на macOS — в байтах
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed_queries(func, queries: list[str]) -> list[float]:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_benchmark(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    project = os.path.join(work_dir, "bench-project")
+    os.makedirs(project)
+
+    with FakeOllamaServer(dim=args.dim, latency_ms=args.latency_ms, per_item_ms=args.per_item_ms) as fake:
+        # Настройки читаются при импорте app.config, поэтому окружение — до импорта
+        os.environ["RAG_MCP_OLLAMA_URL"] = fake.url
+        os.environ["RAG_MCP_CACHE_DIR"] = os.path.join(work_dir, "cache")
+        if not args.embedding_cache:
+            os.environ["RAG_MCP_EMBEDDING_CACHE_ENABLED"] = "false"
+        os.environ["RAG_MCP_VECTOR_BACKEND"] = args.backend
+        os.environ["RAG_MCP_VECTOR_DTYPE"] = args.vector_dtype
+
+        from app.chunker import load_and_chunk_project
+        from app.indexer import index_project_incremental
+        from app.store_registry import get_collection_name, resolve_db_path
+        from app.vector_store import VectorStoreManager
+
+        quiet = contextlib.redirect_stdout(sys.stderr if args.verbose else open(os.devnull, "w"))
+        report = {"params": vars(args).copy()}
+
+        start = time.perf_counter()
+        symbols = generate_repo(project, args.files, args.functions, seed=args.seed)
+        queries = generate_queries(symbols, args.queries, seed=args.seed)
+        report["generate_s"] = round(time.perf_counter() - start, 3)
+
+        with quiet:
+            start = time.perf_counter()
+            chunks = load_and_chunk_project(project, workers=args.workers)
+            elapsed = time.perf_counter() - start
+        report["chunking"] = {
+            "files": args.files,
+            "chunks": len(chunks),
+            "seconds": round(elapsed, 3),
+            "files_per_s": round(args.files / elapsed, 1),
+            "chunks_per_s": round(len(chunks) / elapsed, 1),
+        }
+        del chunks
+
+        store = VectorStoreManager(resolve_db_path(project), get_collection_name(project))
+        with quiet:
+            start = time.perf_counter()
+            stats = index_project_incremental(project, store, EMBED_MODEL, workers=args.workers)
+            elapsed = time.perf_counter() - start
+        report["indexing"] = {
+            **stats,
+            "seconds": round(elapsed, 3),
+            "files_per_s": round(stats["files_seen"] / elapsed, 1),
+            "chunks_per_s": round(stats["chunks_embedded"] / elapsed, 1),
+            "embed_requests": fake.requests,
+        }
+
+        with quiet:
+            start = time.perf_counter()
+            stats = index_project_incremental(project, store, EMBED_MODEL, workers=args.workers)
+            report["reindex_noop_s"] = round(time.perf_counter() - start, 3)
+
+            # Первый запрос прогревает HNSW-индекс и BM25 — не учитываем его.
+            # "vector" платит за эмбеддинг каждого запроса, последующие этапы
+            # получают его из кэша эмбеддингов, как повторный запрос на сервере
+            store.search(queries[0], EMBED_MODEL, n_results=args.top_k)
+            store.lexical.search(queries[0], n_results=args.top_k)
+            report["search"] = {
+                "vector": percentiles(timed_queries(
+                    lambda q: store.search(q, EMBED_MODEL, n_results=args.top_k), queries
+                )),
+                "lexical": percentiles(timed_queries(
+                    lambda q: store.lexical.search(q, n_results=args.top_k), queries
+                )),
+                "hybrid": percentiles(timed_queries(
+                    lambda q: store.hybrid_search(q, q, EMBED_MODEL, n_results=args.top_k), queries
+                )),
+            }
+            report["search"]["rerank"] = run_rerank(store, queries, args) if args.rerank else {"skipped": "disabled"}
+
+        store.close()
+        report["peak_rss_mb"] = peak_rss_mb()
+
+    if not args.keep:
+        import shutil
+
+        shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        report["work_dir"] = work_dir
+    return report
+
+
+def run_rerank(store, queries: list[str], args) -> dict:
+    """Hybrid search + cross-encoder, as search_project does. Needs sentence_transformers."""
+    try:
+        from app.reranker import get_reranker, rerank_stage
+
+        start = time.perf_counter()
+        get_reranker()
+        load_s = time.perf_counter() - start
+    except ImportError as e:
+        return {"skipped": f"reranker unavailable: {e}"}
+
+    def search_and_rerank(query):
+        hits = store.hybrid_search(query, query, EMBED_MODEL, n_results=args.top_k * 2)
+        return rerank_stage.rerank(query, hits, args.top_k)
+
+    cold = percentiles(timed_queries(search_and_rerank, queries))
+    warm = percentiles(timed_queries(search_and_rerank, queries))
+    return {"model_load_s": round(load_s, 3), "cold": cold, "warm": warm, "stage": rerank_stage.stats()}
+
+
+def compare(current: dict, baseline: dict, prefix: str = "") -> list[str]:
+    """Human-readable deltas for every numeric field present in both reports."""
+    lines = []
+    for key, value in current.items():
+        if key == "params" or key not in baseline:
+            continue
+        other = baseline[key]
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(other, dict):
+            lines.extend(compare(value, other, f"{name}."))
+        elif isinstance(value, (int, float)) and isinstance(other, (int, float)) and not isinstance(value, bool):
+            change = f"{(value - other) / other * 100:+.1f}%" if other else "n/a"
+            lines.append(f"{name}: {other} -> {value} ({change})")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="rag-mcp indexing/search benchmark")
+    parser.add_argument("--files", type=int, default=500, help="Files in the synthetic project")
+    parser.add_argument("--functions", type=int, default=8, help="Definitions per file")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None, help="Chunking processes (default: settings)")
+    parser.add_argument("--dim", type=int, default=768, help="Fake embedding dimension")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake Ollama latency per request")
+    parser.add_argument("--per-item-ms", type=float, default=0.0, help="Fake Ollama latency per embedded text")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy"], help="Vector backend")
+    parser.add_argument("--vector-dtype", default="float16", choices=["float16", "int8"], help="NumPy backend storage type")
+    parser.add_argument("--no-embedding-cache", dest="embedding_cache", action="store_false")
+    parser.add_argument("--rerank", action="store_true", help="Also time the cross-encoder stage")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated project and store")
+    parser.add_argument("--verbose", action="store_true", help="Show indexer output on stderr")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Baseline JSON report to diff against")
+    args = parser.parse_args(argv)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        **run_benchmark(args),
+    }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Synthetic project generator for benchmarks."""
+import os
+import random
+
+
+WORDS = [
+    "user", "order", "invoice", "payment", "session", "token", "cache", "index",
+    "vector", "search", "query", "report", "account", "profile", "config", "event",
+    "queue", "worker", "schema", "record", "batch", "stream", "client", "server",
+]
+
+
+def _name(rng: random.Random, parts: int = 2, camel: bool = False) -> str:
+    words = rng.sample(WORDS, parts)
+    if camel:
+        return words[0] + "".join(w.capitalize() for w in words[1:])
+    return "_".join(words)
+
+
+def _python_file(rng: random.Random, functions: int, symbols: list[str]) -> str:
+    lines = ["import os", "import json", ""]
+    class_name = _name(rng, 2, camel=True).capitalize()
+    lines.append(f"class {class_name}:")
+    lines.append(f'    """Handles {" ".join(rng.sample(WORDS, 4))}."""')
+    symbols.append(class_name)
+    for _ in range(max(1, functions // 2)):
+        method = _name(rng)
+        lines.append(f"    def {method}(self, {_name(rng, 1)}):")
+        lines.extend(f"        {_name(rng, 1)}_{i} = self.{_name(rng, 1)}({i})" for i in range(rng.randint(3, 12)))
+        lines.append(f"        return {_name(rng, 1)}_0")
+        lines.append("")
+    for _ in range(functions - functions // 2):
+        func = _name(rng)
+        symbols.append(func)
+        lines.append(f"def {func}({_name(rng, 1)}, {_name(rng, 1)}=None):")
+        lines.append(f'    """Computes the {" ".join(rng.sample(WORDS, 3))}."""')
+        lines.extend(f"    result_{i} = json.dumps({{'{_name(rng, 1)}': {i}}})" for i in range(rng.randint(3, 15)))
+        lines.append("    return result_0")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _ts_file(rng: random.Random, functions: int, symbols: list[str]) -> str:
+    lines = ["import { api } from './api';", ""]
+    for _ in range(functions):
+        func = _name(rng, 3, camel=True)
+        symbols.append(func)
+        lines.append(f"export async function {func}(id: string): Promise<number> {{")
+        lines.extend(f"  const {_name(rng, 2, camel=True)}{i} = await api.get(`/{rng.choice(WORDS)}/${{id}}`);" for i in range(rng.randint(3, 12)))
+        lines.append("  return 0;")
+        lines.append("}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _md_file(rng: random.Random, sections: int) -> str:
+    lines = [f"# {' '.join(rng.sample(WORDS, 3)).title()}", ""]
+    for _ in range(sections):
+        lines.append(f"## {' '.join(rng.sample(WORDS, 2)).title()}")
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 200))))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_repo(root: str, files: int, functions_per_file: int = 8, seed: int = 0) -> list[str]:
+    """
+    Writes a synthetic project (≈60% Python, 30% TypeScript, 10% Markdown)
+    under root and returns the defined symbol names, usable as queries.
+    """
+    rng = random.Random(seed)
+    symbols: list[str] = []
+    for i in range(files):
+        package = os.path.join(root, f"pkg{i % 20}", f"mod{i % 7}")
+        os.makedirs(package, exist_ok=True)
+        kind = rng.random()
+        if kind < 0.6:
+            path, content = os.path.join(package, f"file_{i}.py"), _python_file(rng, functions_per_file, symbols)
+        elif kind < 0.9:
+            path, content = os.path.join(package, f"file_{i}.ts"), _ts_file(rng, functions_per_file, symbols)
+        else:
+            path, content = os.path.join(package, f"file_{i}.md"), _md_file(rng, functions_per_file)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return symbols
+
+
+def generate_queries(symbols: list[str], count: int, seed: int = 0) -> list[str]:
+    """A mix of exact symbol lookups and natural-language questions."""
+    rng = random.Random(seed + 1)
+    queries = []
+    for i in range(count):
+        if i % 2 == 0 and symbols:
+            queries.append(rng.choice(symbols))
+        else:
+            queries.append(f"how does the {' '.join(rng.sample(WORDS, 2))} logic work?")
+    return queries
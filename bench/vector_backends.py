@@ -0,0 +1,150 @@
+"""
+Vector backend comparison: Chroma vs the NumPy engine (float16 / int8).
+
+Inserts the same clustered random vectors into every backend and reports
+write throughput, reopen time, query latency (with and without a metadata
+filter), recall@k against exact float32 search and size on disk:
+
+    python -m bench.vector_backends --items 50000 --dim 768 --output backends.json
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench.run import percentiles
+
+
+BACKENDS = [("chroma", {}), ("numpy", {"dtype": "float16"}), ("numpy", {"dtype": "int8"})]
+
+
+def make_dataset(items: int, dim: int, queries: int, files: int, seed: int):
+    """Vectors around a few hundred centroids (embeddings of code are far from uniform)."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(max(1, items // 200), dim)).astype(np.float32)
+    assignment = rng.integers(0, len(centroids), size=items)
+    vectors = centroids[assignment] + 0.35 * rng.normal(size=(items, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    picked = rng.integers(0, items, size=queries)
+    query_vectors = vectors[picked] + 0.25 * rng.normal(size=(queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    sources = [f"pkg{i % 20}/mod{i % files}.py" for i in range(items)]
+    return vectors, query_vectors, sources
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, allowed: np.ndarray | None = None) -> list[set[int]]:
+    truth = []
+    for query in queries:
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        if allowed is not None:
+            distances[~allowed] = np.inf
+        truth.append(set(np.argsort(distances)[:k].tolist()))
+    return truth
+
+
+def recall(hits: list[list[str]], truth: list[set[int]]) -> float:
+    found = sum(len({int(doc_id[1:]) for doc_id in ids} & expected) for ids, expected in zip(hits, truth))
+    return round(found / max(1, sum(len(expected) for expected in truth)), 4)
+
+
+def dir_size_mb(path: Path) -> float:
+    return round(sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / (1024 * 1024), 2)
+
+
+def run_backend(name: str, options: dict, vectors, queries, sources, truth, filtered_truth, args) -> dict:
+    from app.vector_backends import open_backend
+
+    db_path = Path(tempfile.mkdtemp(prefix=f"rag-vec-{name}-"))
+    try:
+        backend = open_backend(name, db_path, "bench", **options)
+        ids = [f"c{i}" for i in range(len(vectors))]
+        start = time.perf_counter()
+        for i in range(0, len(vectors), args.batch_size):
+            end = i + args.batch_size
+            backend.upsert(
+                ids[i:end],
+                vectors[i:end].tolist(),
+                [f"chunk {j}" for j in range(i, min(end, len(vectors)))],
+                [{"source": source, "start_line": 1} for source in sources[i:end]],
+            )
+        write_s = time.perf_counter() - start
+        backend.close()
+        del backend
+
+        start = time.perf_counter()
+        backend = open_backend(name, db_path, "bench", **options)
+        backend.query(queries[0].tolist(), args.top_k)
+        open_s = time.perf_counter() - start
+
+        hits, samples = [], []
+        for query in queries:
+            start = time.perf_counter()
+            result = backend.query(query.tolist(), args.top_k)
+            samples.append(time.perf_counter() - start)
+            hits.append([doc_id for doc_id, *_ in result])
+
+        where = {"source": sources[0]}
+        filtered_hits, filtered_samples = [], []
+        for query in queries:
+            start = time.perf_counter()
+            result = backend.query(query.tolist(), args.top_k, where=where)
+            filtered_samples.append(time.perf_counter() - start)
+            filtered_hits.append([doc_id for doc_id, *_ in result])
+
+        report = {
+            "write_items_per_s": round(len(vectors) / write_s, 1),
+            "open_and_first_query_s": round(open_s, 4),
+            "query": percentiles(samples),
+            f"recall@{args.top_k}": recall(hits, truth),
+            "filtered_query": percentiles(filtered_samples),
+            f"filtered_recall@{args.top_k}": recall(filtered_hits, filtered_truth),
+            "disk_mb": dir_size_mb(db_path),
+        }
+        backend.close()
+        return report
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chroma vs NumPy vector backend benchmark")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--files", type=int, default=7, help="Distinct sources per package (filter selectivity)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    vectors, queries, sources = make_dataset(args.items, args.dim, args.queries, args.files, args.seed)
+    truth = exact_top_k(vectors, queries, args.top_k)
+    allowed = np.asarray([source == sources[0] for source in sources])
+    filtered_truth = exact_top_k(vectors, queries, args.top_k, allowed)
+
+    report = {"params": vars(args).copy(), "backends": {}}
+    for name, options in BACKENDS:
+        label = "-".join([name, *options.values()])
+        try:
+            report["backends"][label] = run_backend(name, options, vectors, queries, sources, truth, filtered_truth, args)
+        except ImportError as e:
+            report["backends"][label] = {"skipped": str(e)}
+        print(f"{label} done", file=sys.stderr)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
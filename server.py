@@ -1,14 +1,26 @@
-import sys
-import os
-import logging
-import json
-import ollama
-from typing import Optional
-from mcp.server.fastmcp import FastMCP
-from app.chunker import load_and_chunk_project
-from app.vector_store import VectorStoreManager
-from sentence_transformers import CrossEncoder
-import numpy as np
+from app.startup import mark_ready, start_background_warmup, startup_timings, timed_phase
+
+with timed_phase("imports"):
+    import sys
+    import os
+    import asyncio
+    import logging
+    import json
+    import time
+    import functools
+    from concurrent.futures import ThreadPoolExecutor
+    from mcp.server.fastmcp import Context, FastMCP
+    from app.config import settings
+    from app.context_assembly import assemble_context, estimate_tokens, format_grouped_results, format_results
+    from app.context_store import context_path, context_stores, render_entries
+    from app.project_tree import project_trees
+    from app.jobs import JobManager
+    from app.metrics import metrics, profiler
+    from app.tokens import is_identifier_query
+    from app.reranker import rerank_stage
+    from app.rewrite_cache import QueryRewriteCache, normalize_query
+    from app.search_cache import SearchCache, index_generations, normalize_search_query
+    from app.store_registry import get_collection_name, registry, resolve_db_path
 
 # Setup Logging to be actually visible
 logging.basicConfig(
@@ -17,22 +29,129 @@ logging.basicConfig(
 logger = logging.getLogger("vox-brain")
 
 # Initialize FastMCP Server
-mcp = FastMCP("VOX Brain (RAG)", dependencies=["chromadb", "langchain-text-splitters"])
+with timed_phase("mcp_init"):
+    mcp = FastMCP("VOX Brain (RAG)", dependencies=["chromadb", "langchain-text-splitters"])
 
+# Фоновые задачи индексации — чтобы длинный индекс не блокировал остальные запросы
+jobs = JobManager(max_workers=settings.index_job_workers)
 
-def get_collection_name(project_path: str) -> str:
-    """Gets the collection name from the project path."""
-    project_name = os.path.basename(os.path.abspath(project_path))
-    return f"rag-mcp-{project_name}"
+_ollama_client = None
+
+rewrite_cache = QueryRewriteCache(
+    os.path.join(settings.cache_dir, "query_rewrites.json"),
+    max_entries=settings.rewrite_cache_size,
+    ttl=settings.rewrite_cache_ttl,
+    flush_delay=settings.rewrite_cache_flush_delay,
+)
+_pending_rewrites: dict[str, asyncio.Task] = {}
+
+# Повторный search_project/ask_project с тем же запросом не проходит конвейер заново
+search_cache = SearchCache(
+    max_entries=settings.search_cache_size,
+    max_bytes=int(settings.search_cache_max_mb * 1024 * 1024),
+)
+
+# Федеративный поиск: хранилища опрашиваются параллельно, но не больше federated_workers сразу
+federated_pool = ThreadPoolExecutor(max_workers=settings.federated_workers, thread_name_prefix="rag-federated")
+
+
+def get_ollama_client():
+    """Shared async Ollama client, so chat calls don't block the event loop."""
+    global _ollama_client
+    if _ollama_client is None:
+        import ollama
+
+        _ollama_client = ollama.AsyncClient(host=settings.ollama_url)
+    return _ollama_client
+
+
+def dump_prometheus():
+    """Writes the Prometheus text dump for a textfile collector, if configured."""
+    if not settings.metrics_prometheus_file:
+        return
+    path = os.path.expanduser(settings.metrics_prometheus_file)
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(metrics.prometheus())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {path}: {e}")
+
+
+def instrumented(name: str):
+    """Times a tool call as `tool.<name>` and lets profile_next_request capture it."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            metrics.inc(f"tool.{name}.calls")
+            try:
+                with metrics.span(f"tool.{name}"), profiler.capture(name):
+                    return await func(*args, **kwargs)
+            finally:
+                dump_prometheus()
+        return wrapper
+    return decorator
+
+
+def _run_index(project_path: str, model: str, full: bool, progress=None) -> dict:
+    """Blocking indexing body; runs on the job pool."""
+    # langchain и прочие тяжёлые зависимости грузятся только при первой индексации
+    from app.indexer import index_project_incremental, project_write_lock
+
+    collection_name = get_collection_name(project_path)
+
+    logger.info(f"📦 Syncing changed files into collection: {collection_name}")
+    try:
+        # Не пересекаемся с живыми обновлениями от watch_project
+        with (
+            registry.checkout(project_path) as vector_store,
+            project_write_lock(project_path),
+            metrics.span("tool.index_project"),
+            profiler.capture("index_project"),
+        ):
+            stats = index_project_incremental(
+                project_path, vector_store, model=model, full=full, progress=progress
+            )
+    finally:
+        dump_prometheus()
+    logger.info(f"✅ Indexing complete for {project_path}: {stats}")
+    sys.stdout.flush()
+    return stats
+
+
+def _format_index_stats(project_path: str, stats: dict) -> str:
+    text = (
+        f"Successfully indexed {get_collection_name(project_path)}: "
+        f"{stats['files_changed']} changed, {stats['files_unchanged']} unchanged, "
+        f"{stats['files_removed']} removed files; "
+        f"{stats['chunks_embedded']} chunks embedded, "
+        f"{stats['chunks_deduplicated']} near-duplicates collapsed, {stats['chunks_deleted']} deleted, "
+        f"{stats['chunks_relocated']} relocated, "
+        f"{stats['total_items']} total."
+    )
+    if stats["files_skipped"]:
+        reasons = ", ".join(f"{reason} {counts['files']}" for reason, counts in sorted(stats["skipped"].items()))
+        text += (
+            f" Skipped {stats['files_skipped']} files "
+            f"({stats['bytes_skipped'] / (1024 * 1024):.1f} MB, ~{stats['seconds_saved']}s saved): {reasons}."
+        )
+    return text
 
 
 @mcp.tool()
-async def index_project(project_path: str, model: str = "nomic-embed-text") -> str:
+async def index_project(
+    project_path: str, model: str = "nomic-embed-text", full: bool = False, wait: bool = False
+) -> str:
     """
     Indexes a project directory into the vector store.
+    Only files changed since the last run are re-embedded.
+    Runs as a background job; poll it with index_status.
     Args:
         project_path: Absolute path to the project root.
         model: The embedding model to use.
+        full: Drop the existing index and rebuild it from scratch.
+        wait: Block until indexing finishes instead of returning a job id.
     """
     logger.info(f"🚀 Starting indexing for: {project_path}")
 
@@ -40,31 +159,56 @@ async def index_project(project_path: str, model: str = "nomic-embed-text") -> s
         logger.error(f"❌ Invalid path: {project_path}")
         return f"Error: {project_path} is not a valid directory."
 
-    try:
-        collection_name = get_collection_name(project_path)
-        logger.info(f"📦 Loading and chunking files...")
-        documents = load_and_chunk_project(project_path)
+    project_path = os.path.abspath(project_path)
+    job = jobs.submit("index", project_path, _run_index, project_path, model, full)
 
-        logger.info(
-            f"💾 Upserting {len(documents)} chunks to collection: {collection_name}"
-        )
-        db_path="$project_path/.rag_db"
-        vector_store = VectorStoreManager(
-            db_path=db_path, collection_name=collection_name
-        )
-        vector_store.add_documents(documents, model=model)
+    if not wait:
+        return f"Indexing started for {project_path}. Job id: {job.id} (poll with index_status)."
 
-        logger.info(f"✅ Indexing complete for {project_path}")
-        sys.stdout.flush()
-        return f"Successfully indexed {len(documents)} chunks into {collection_name}."
+    try:
+        stats = await asyncio.wrap_future(job.future)
+        return _format_index_stats(project_path, stats)
     except Exception as e:
         logger.exception("🔥 Indexing failed")
         return f"Indexing failed: {str(e)}"
 
 
-# Инициализируем реранкер (лучше вынести в глобальную область или синглтон)
-# Модель ms-marco-MiniLM-L-6-v2 — золотой стандарт: быстрая и точная.
-reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+@mcp.tool()
+async def index_status(job_id: str = "") -> str:
+    """
+    Reports progress of background indexing jobs.
+    Args:
+        job_id: Job id returned by index_project; empty lists all jobs.
+    """
+    if job_id:
+        job = jobs.get(job_id)
+        if job is None:
+            return f"Unknown job id: {job_id}"
+        return json.dumps(job.to_dict(), ensure_ascii=False, indent=2)
+    return json.dumps([job.to_dict() for job in jobs.jobs()], ensure_ascii=False, indent=2)
+
+
+@mcp.tool()
+async def watch_project(project_path: str, model: str = "nomic-embed-text", enable: bool = True) -> str:
+    """
+    Keeps a project's index up to date as files change (debounced live updates).
+    Searches keep working while updates are applied; see server_status for queue stats.
+    Args:
+        project_path: Absolute path to the project root.
+        model: The embedding model to use.
+        enable: False stops watching the project.
+    """
+    from app.watcher import watchers
+
+    if not enable:
+        stopped = await asyncio.to_thread(watchers.stop, project_path)
+        return f"Stopped watching {project_path}." if stopped else f"{project_path} was not being watched."
+
+    if not os.path.isdir(project_path):
+        return f"Error: {project_path} is not a valid directory."
+    watcher = await asyncio.to_thread(watchers.start, project_path, model)
+    return f"Watching {watcher.root_path} ({watcher.backend}); changes are indexed after {watcher.debounce}s of quiet."
+
 
 #async def rewrite_query_for_code(query: str) -> str:
 #    prompt = f"Given the programming question: '{query}', list 3-5 technical keywords or function names that might appear in the source code. Output only keywords separated by commas."
@@ -85,13 +229,14 @@ reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
 #    keywords = response["message"]["content"]    # Результат: "AuthService, JWT, login, authenticate, token"
 #    return keywords
 
-async def rewrite_query_for_code(query: str) -> str:
+async def _fetch_rewrite(query: str) -> str:
     # Используем максимально сжатый системный промпт
     system_msg = "You are a technical search assistant. Output ONLY a comma-separated list of technical terms. No prose."
     user_msg = f"Translate this intent into code keywords: '{query}'"
 
+    metrics.inc("rewrite.llm_calls")
     try:
-        response = ollama.chat(
+        response = await get_ollama_client().chat(
             model="gemma3:4b-it-qat",
             messages=[
                 {"role": "system", "content": system_msg},
@@ -105,85 +250,425 @@ async def rewrite_query_for_code(query: str) -> str:
         )
         keywords = response["message"]["content"].strip()
         # Очистка от возможного мусора (кавычки, точки в конце)
-        return keywords.replace('"', '').replace('.', '')
+        keywords = keywords.replace('"', '').replace('.', '')
+        rewrite_cache.put(query, keywords)
+        return keywords
     except Exception as e:
+        metrics.inc("ollama.errors")
+        metrics.inc("rewrite.errors")
         logger.warning(f"Query expansion failed: {e}")
         return "" # Если упало, поиск пойдет просто по оригинальному запросу
+    finally:
+        _pending_rewrites.pop(normalize_query(query), None)
 
-@mcp.tool()
-async def search_project(project_path: str, query: str, top_k: int = 20) -> str:
+
+async def rewrite_query_for_code(query: str) -> str:
     """
-    Улучшенный поиск с реранжированием и структурированием для Gemma 3.
+    Expands the query with code keywords, served from the rewrite cache when possible.
+    With RAG_MCP_REWRITE_TIMEOUT set, gives up after that many seconds and lets the
+    rewrite finish in the background to fill the cache for the next call.
     """
+    cached = rewrite_cache.get(query)
+    if cached is not None:
+        metrics.inc("rewrite.cache_hits")
+        return cached
+
+    # Одинаковые запросы, пришедшие одновременно, ждут один и тот же вызов LLM
+    key = normalize_query(query)
+    task = _pending_rewrites.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_rewrite(query))
+        _pending_rewrites[key] = task
+
+    if settings.rewrite_timeout <= 0:
+        return await task
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=settings.rewrite_timeout)
+    except asyncio.TimeoutError:
+        metrics.inc("rewrite.timeouts")
+        logger.info(f"⏳ Query rewrite exceeded {settings.rewrite_timeout}s, searching with the raw query")
+        return ""
+
+
+async def _expand_query(query: str) -> tuple[str, bool]:
+    """Returns (combined query, complete); complete is False if the rewrite was wanted but didn't arrive."""
     # 1. Query Expansion (НЕ заменяем, а расширяем)
-    # Генерируем ключевые слова, которые могут быть в коде
-    search_terms = await rewrite_query_for_code(query)
+    # Генерируем ключевые слова, которые могут быть в коде.
+    # Голый идентификатор (`VectorStoreManager`) точно находит BM25 — LLM не нужен
+    rewrite_wanted = settings.query_rewrite and not is_identifier_query(query)
+    if rewrite_wanted:
+        with metrics.span("search.rewrite"):
+            search_terms = await rewrite_query_for_code(query)
+    else:
+        search_terms = ""
 
     # Объединяем: оригинальный вопрос + технические термины
     # Это гарантирует, что мы ищем и по смыслу, и по ключевым словам
-    combined_query = f"{query} {search_terms}"
+    combined_query = f"{query} {search_terms}".strip()
 
     logger.info(f"🔎 Combined Query: {combined_query}")
+    return combined_query, bool(search_terms) or not rewrite_wanted
 
-    collection_name = get_collection_name(project_path)
-    vector_store = VectorStoreManager(
-        db_path=".rag_db", collection_name=collection_name
-    )
 
+async def retrieve_results(project_path: str, query: str, top_k: int) -> list[dict]:
+    """
+    Query expansion, hybrid/vector retrieval and reranking.
+    Returns the best top_k hits (empty if nothing matched); raises on store errors.
+    Results are cached until the project's index changes.
+    """
+    return (await retrieve_many(project_path, [query], top_k))[0]
+
+
+async def retrieve_many(project_path: str, queries: list[str], top_k: int) -> list[list[dict]]:
+    """
+    retrieve_results for several queries at once: rewrites run concurrently,
+    then one embedding call, one multi-vector query and one batched rerank
+    cover every query that isn't already in the search cache.
+    """
+    # Поколение читаем до поиска: запись, завершившаяся во время поиска, сделает результат устаревшим
+    generation = index_generations.get(resolve_db_path(project_path))
+    cache_keys = [search_cache.key(project_path, query, top_k) for query in queries]
+    results: list[list[dict] | None] = [None] * len(queries)
+    if search_cache.enabled:
+        for i, key in enumerate(cache_keys):
+            results[i] = search_cache.get(key, generation)
+            if results[i] is not None:
+                metrics.inc("search.cache_hits")
+
+    # Повторы внутри пакета считаем один раз
+    pending: dict[tuple, list[int]] = {}
+    for i, key in enumerate(cache_keys):
+        if results[i] is None:
+            pending.setdefault(key, []).append(i)
+    if not pending:
+        return results
+    todo = [queries[indexes[0]] for indexes in pending.values()]
+
+    expanded = await asyncio.gather(*(_expand_query(query) for query in todo))
+    combined_queries = [combined for combined, _ in expanded]
+
+    # Блокирующие вызовы (Chroma, Ollama embeddings, CrossEncoder) уходят в потоки
+    n_results = max(top_k, settings.rerank_candidates)
+
+    # 1. Retrieval: Берем с запасом (пул кандидатов), чтобы было из чего выбирать
+    vector_store = await asyncio.to_thread(registry.acquire, project_path)
     try:
-        # 1. Retrieval: Берем с запасом (20 результатов), чтобы было из чего выбирать
-        initial_results = vector_store.search(
-            query_text=combined_query,  # Ищем по расширенному запросу
-            model="nomic-embed-text",
-            n_results=20
+        with metrics.span("search.retrieve"):
+            if settings.hybrid_search:
+                # Эмбеддинг — по исходному вопросу, ключевые слова — в BM25, затем RRF
+                initial_results = await asyncio.to_thread(
+                    vector_store.hybrid_search_many,
+                    query_texts=todo,
+                    lexical_queries=combined_queries,
+                    model="nomic-embed-text",
+                    n_results=n_results
+                )
+            else:
+                initial_results = await asyncio.to_thread(
+                    vector_store.search_many,
+                    query_texts=combined_queries,  # Ищем по расширенному запросу
+                    model="nomic-embed-text",
+                    n_results=n_results
+                )
+    finally:
+        registry.release(project_path)
+
+    # 2. Reranking: Сравниваем запрос с каждым найденным куском кода
+    # (одним батчем на все запросы, с кэшем уже посчитанных пар)
+    found = [i for i, hits in enumerate(initial_results) if hits]
+    reranked = [[] for _ in todo]
+    if found:
+        with metrics.span("search.rerank"):
+            scored = await asyncio.to_thread(
+                rerank_stage.rerank_many, [todo[i] for i in found], [initial_results[i] for i in found], top_k
+            )
+        for i, hits in zip(found, scored):
+            reranked[i] = hits
+            logger.info(f"✨ Reranking complete. Best score: {hits[0].get('rerank_score'):.4f}")
+    if len(found) < len(todo):
+        metrics.inc("search.empty", len(todo) - len(found))
+
+    for (key, indexes), hits, (_, complete) in zip(pending.items(), reranked, expanded):
+        # Ответ без переписанного запроса (таймаут/ошибка LLM) не кэшируем — следующий будет полнее
+        if complete:
+            search_cache.put(key, generation, hits)
+        results[indexes[0]] = hits
+        for i in indexes[1:]:
+            results[i] = [dict(hit) for hit in hits]
+    return results
+
+
+def _search_store(project_path: str, query: str, combined_query: str, embedding: list[float], n_results: int) -> list[dict]:
+    """One store's part of a federated search; runs on federated_pool."""
+    with registry.checkout(project_path) as vector_store, metrics.span("search.federated_store"):
+        if settings.hybrid_search:
+            hits = vector_store.hybrid_search_many(
+                [query], [combined_query], model="nomic-embed-text", n_results=n_results, query_embeddings=[embedding]
+            )[0]
+        else:
+            hits = vector_store.search_many(
+                [combined_query], model="nomic-embed-text", n_results=n_results, query_embeddings=[embedding]
+            )[0]
+    for hit in hits:
+        hit["project"] = project_path
+    return hits
+
+
+def _embed_federated_query(project_path: str, text: str) -> list[float]:
+    """Embeds the query through a store's embedding cache, as single-store search does."""
+    with registry.checkout(project_path) as vector_store:
+        return vector_store.embed_texts([text], "nomic-embed-text")[0]
+
+
+async def retrieve_federated(project_paths: list[str], query: str, top_k: int) -> tuple[list[dict], list[dict]]:
+    """
+    One query over several project stores. The query is rewritten and
+    embedded once, the stores are searched in parallel on federated_pool
+    (each within federated_timeout), and the pooled candidates go through
+    one global rerank. Returns (best top_k hits tagged with their
+    'project', per-store report).
+    """
+    roots = list(dict.fromkeys(os.path.abspath(path) for path in project_paths))
+    report = {root: {"project": root} for root in roots}
+    indexed = []
+    for root in roots:
+        # registry.acquire создал бы пустое хранилище внутри чужого каталога
+        if os.path.isdir(resolve_db_path(root)):
+            indexed.append(root)
+        else:
+            report[root]["status"] = "not indexed"
+    if not indexed:
+        return [], list(report.values())
+
+    generation = tuple(index_generations.get(resolve_db_path(root)) for root in indexed)
+    cache_key = ("federated", tuple(indexed), normalize_search_query(query), top_k)
+    cached = search_cache.get(cache_key, generation) if search_cache.enabled else None
+    if cached is not None:
+        metrics.inc("search.cache_hits")
+        for root in indexed:
+            report[root]["status"] = "cached"
+        return cached, list(report.values())
+
+    combined_query, complete = await _expand_query(query)
+
+    # Каждое хранилище даёт свою долю кандидатов в общий пул реранкинга
+    n_results = max(settings.federated_store_candidates, -(-top_k // len(indexed)))
+    loop = asyncio.get_running_loop()
+
+    async def search_one(root: str) -> list[dict]:
+        start = time.perf_counter()
+        future = loop.run_in_executor(
+            federated_pool, _search_store, root, query, combined_query, embedding, n_results
         )
+        try:
+            hits = await asyncio.wait_for(future, timeout=settings.federated_timeout or None)
+            report[root].update(status="ok", hits=len(hits))
+            return hits
+        except asyncio.TimeoutError:
+            # Поток доработает в фоне; ответ без этого хранилища не ждёт его
+            metrics.inc("search.federated_timeouts")
+            report[root]["status"] = "timeout"
+            return []
+        except Exception as e:
+            logger.error(f"⚠️ Federated search failed for {root}: {str(e)}")
+            report[root]["status"] = f"error: {e}"
+            return []
+        finally:
+            report[root]["seconds"] = round(time.perf_counter() - start, 3)
+
+    # Все хранилища вызова закреплены: пул не закрывает одно, пока соседний поток открывает другое
+    with registry.pinned(indexed):
+        # Кэш эмбеддингов первого хранилища: повторный запрос не идёт в Ollama
+        with metrics.span("search.embed_query"):
+            embedding = await asyncio.to_thread(
+                _embed_federated_query, indexed[0], query if settings.hybrid_search else combined_query
+            )
+        with metrics.span("search.retrieve"):
+            per_store = await asyncio.gather(*(search_one(root) for root in indexed))
+    candidates = [hit for hits in per_store for hit in hits]
+
+    results = []
+    if candidates:
+        with metrics.span("search.rerank"):
+            results = (await asyncio.to_thread(rerank_stage.rerank_many, [query], [candidates], top_k))[0]
+    else:
+        metrics.inc("search.empty")
+
+    # Неполный ответ (таймаут, ошибка хранилища или LLM) не кэшируем
+    if complete and all(report[root]["status"] == "ok" for root in indexed):
+        search_cache.put(cache_key, generation, results)
+    return results, list(report.values())
+
+
+def _format_store_report(stores: list[dict]) -> str:
+    lines = ["Stores searched:"]
+    for store in stores:
+        line = f"- {os.path.basename(store['project'])}: {store['status']}"
+        if "hits" in store:
+            line += f", {store['hits']} candidates"
+        if "seconds" in store:
+            line += f", {store['seconds']}s"
+        lines.append(line)
+    return "\n".join(lines)
 
-        if not initial_results:
-            return "No relevant results found."
 
-        # 2. Reranking: Сравниваем запрос с каждым найденным куском кода
-        # Формируем пары [вопрос, код] для оценки
-        pairs = [[query, res.get('content', '')] for res in initial_results]
-        scores = reranker.predict(pairs)
+@mcp.tool()
+@instrumented("search_project")
+async def search_project(project_path: str, query: str, top_k: int = 20) -> str:
+    """
+    Улучшенный поиск с реранжированием и структурированием для Gemma 3.
+    """
+    try:
+        reranked_results = await retrieve_results(project_path, query, top_k)
+        if not reranked_results:
+            return "No relevant results found."
 
-        # Добавляем скоры в результаты и сортируем
-        for i, res in enumerate(initial_results):
-            res['rerank_score'] = scores[i]
+        # 3. Formatting: Собираем контекст в XML-подобную структуру
+        with metrics.span("search.format"):
+            return format_results(reranked_results)
 
-        # Сортируем по убыванию релевантности и берем нужные top_k
-        reranked_results = sorted(
-            initial_results, key=lambda x: x['rerank_score'], reverse=True
-        )[:top_k]
+    except Exception as e:
+        logger.error(f"⚠️ Search/Rerank failed: {str(e)}")
+        return f"Search error: {str(e)}"
 
-        # 3. Formatting: Собираем контекст в XML-подобную структуру
-        formatted_output = ["<context>"]
-
-        for i, res in enumerate(reranked_results):
-            source = res.get('source', 'unknown')
-            content = res.get('content', '')
-            # Четко отделяем каждый документ
-            doc_block = (
-                f"### DOCUMENT {i+1}\n"
-                f"FILE_PATH: {source}\n"
-                f"CODE_CONTENT:\n{content}\n"
-                f"--- END OF DOCUMENT {i+1} ---"
-            )
-            formatted_output.append(doc_block)
 
-        formatted_output.append("</context>")
+@mcp.tool()
+@instrumented("search_project_batch")
+async def search_project_batch(project_path: str, queries: list[str], top_k: int = 10) -> str:
+    """
+    Runs several related searches at once, cheaper than separate search_project calls:
+    one embedding request, one vector query and one reranker pass for all queries.
+    Results are grouped by query; a chunk found by several queries is shown once.
+    Args:
+        project_path: Absolute path to the project root.
+        queries: Search queries (natural language or identifiers).
+        top_k: Results per query.
+    """
+    queries = [query for query in queries if query.strip()]
+    if not queries:
+        return "Error: no queries given."
+    try:
+        grouped = await retrieve_many(project_path, queries, top_k)
+        with metrics.span("search.format"):
+            return format_grouped_results(list(zip(queries, grouped)))
+    except Exception as e:
+        logger.error(f"⚠️ Batch search failed: {str(e)}")
+        return f"Search error: {str(e)}"
 
-        logger.info(f"✨ Reranking complete. Best score: {reranked_results[0].get('rerank_score'):.4f}")
-        return "\n\n".join(formatted_output)
 
+@mcp.tool()
+@instrumented("search_projects")
+async def search_projects(project_paths: list[str], query: str, top_k: int = 20) -> str:
+    """
+    Searches several indexed projects at once (e.g. services split across repositories).
+    Stores are searched in parallel, each within a timeout, and all hits are reranked together;
+    every document's FILE_PATH is prefixed with its project.
+    Args:
+        project_paths: Absolute paths to the project roots.
+        query: Search query (natural language or identifiers).
+        top_k: Results in total, across all projects.
+    """
+    if not project_paths:
+        return "Error: no projects given."
+    try:
+        results, stores = await retrieve_federated(project_paths, query, top_k)
+        with metrics.span("search.format"):
+            summary = _format_store_report(stores)
+            if not results:
+                return f"No relevant results found.\n\n{summary}"
+            return f"{format_results(results)}\n\n{summary}"
     except Exception as e:
-        logger.error(f"⚠️ Search/Rerank failed: {str(e)}")
+        logger.error(f"⚠️ Federated search failed: {str(e)}")
         return f"Search error: {str(e)}"
 
 
+@mcp.tool()
+@instrumented("find_symbol")
+async def find_symbol(project_path: str, name: str, include_code: bool = True) -> str:
+    """
+    Finds where a function/class/method is defined, via the symbol table (no embeddings).
+    Args:
+        project_path: Absolute path to the project root.
+        name: Symbol name, short (`search`) or qualified (`VectorStoreManager.search`).
+        include_code: Include the definition's chunk text.
+    """
+    try:
+        vector_store = await asyncio.to_thread(registry.acquire, project_path)
+        try:
+            matches = vector_store.symbols.lookup(name)
+            if not matches:
+                return f"Symbol '{name}' not found. Re-index the project if it was added recently."
+
+            chunks = {}
+            if include_code:
+                hits = await asyncio.to_thread(
+                    vector_store.get_by_ids, [m["chunk_id"] for m in matches]
+                )
+                chunks = {hit["id"]: hit["content"] for hit in hits}
+        finally:
+            registry.release(project_path)
+
+        blocks = []
+        for m in matches:
+            block = f"{m['name']} ({m['kind']}) — {m['source']}:{m['start_line']}-{m['end_line']}"
+            if m["chunk_id"] in chunks:
+                block += f"\n{chunks[m['chunk_id']]}"
+            blocks.append(block)
+        return "\n\n".join(blocks)
+    except Exception as e:
+        logger.error(f"⚠️ Symbol lookup failed: {str(e)}")
+        return f"Symbol lookup error: {str(e)}"
+
+
+async def _stream_answer(stream, ctx: Context | None, started: float) -> str:
+    """
+    Collects a streamed chat completion and forwards new text to the client
+    as progress notifications (each message is the text since the previous
+    one). The stream is closed on every exit, so a cancelled request (client
+    dropped or sent notifications/cancelled) also stops generation in Ollama.
+    """
+    parts = []
+    pending = []
+    first_token_at = None
+    last_sent = 0.0
+    try:
+        async for chunk in stream:
+            piece = chunk["message"]["content"] or ""
+            if not piece:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                metrics.observe("ask.ttft", first_token_at - started)
+                logger.info(f"⚡ First token after {first_token_at - started:.2f}s")
+            parts.append(piece)
+            pending.append(piece)
+
+            now = time.perf_counter()
+            if ctx is not None and now - last_sent >= settings.stream_progress_interval:
+                await ctx.report_progress(len(parts), settings.ask_num_predict, "".join(pending))
+                pending = []
+                last_sent = now
+        if ctx is not None and pending:
+            await ctx.report_progress(len(parts), settings.ask_num_predict, "".join(pending))
+    except asyncio.CancelledError:
+        metrics.inc("ask.cancelled")
+        logger.info(f"🛑 Generation cancelled after {len(parts)} chunks")
+        raise
+    finally:
+        # Закрытие HTTP-стрима — сигнал Ollama прекратить генерацию
+        await stream.aclose()
+    metrics.inc("ask.streamed_chunks", len(parts))
+    return "".join(parts)
+
 
 @mcp.tool()
+@instrumented("ask_project")
 async def ask_project(
-    project_path: str, question: str, model: str = "gemma3:4b-it-qat"
+    project_path: str,
+    question: str,
+    model: str = "gemma3:4b-it-qat",
+    stream: bool = True,
+    ctx: Context | None = None,
 ) -> str:
     """
     Asks a question about the project, using retrieved context to answer.
@@ -191,14 +676,20 @@ async def ask_project(
         project_path: Absolute path to the project root.
         question: The user's question.
         model: The Ollama model to use for generation (default: gemma3:4b-it-qat).
+        stream: Send the answer as it is generated via progress notifications
+            (needs a progressToken from the client); the full answer is returned at the end.
     """
+    started = time.perf_counter()
     logger.info(f"🤔 Asking '{model}' about {project_path}: '{question}'")
 
     # 1. Reuse search logic to get context
-    context = await search_project(project_path, question)
-
-    if context.startswith("Search error") or context == "No relevant results found.":
-        return f"Could not retrieve context to answer the question. Reason: {context}"
+    try:
+        results = await retrieve_results(project_path, question, settings.ask_top_k)
+    except Exception as e:
+        logger.error(f"⚠️ Search/Rerank failed: {str(e)}")
+        return f"Could not retrieve context to answer the question. Reason: Search error: {str(e)}"
+    if not results:
+        return "Could not retrieve context to answer the question. Reason: No relevant results found."
 
     # 2. Construct Prompt
 #    system_prompt = (
@@ -212,8 +703,9 @@ async def ask_project(
         "For every piece of information you provide, you MUST cite the source file using the format [SOURCE: filename]. "
     )
 
-    #user_prompt = f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:"
-    user_prompt = f"""
+    def build_user_prompt(context: str) -> str:
+        #user_prompt = f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:"
+        user_prompt = f"""
     ### SOURCE CODE CONTEXT
     --------------------------------------------------
     {context}
@@ -225,168 +717,248 @@ async def ask_project(
     ### ANSWER
     """
 
-    user_prompt += (
-        "#### Response Instructions:\n"
-        "1. Analyze the context provided above and identify the key snippets that directly relate to the question.\n"
-        "2. Provide a detailed answer using ONLY information from these snippets.\n"
-        "3. Cite the source file for each key assertion using the format [SOURCE: filename].\n"
-        "4. If information is missing, EXPLICITLY reply that you refuse to answer the specific part that is missing context.\n\n"
-        "#### Answer:"
+        user_prompt += (
+            "#### Response Instructions:\n"
+            "1. Analyze the context provided above and identify the key snippets that directly relate to the question.\n"
+            "2. Provide a detailed answer using ONLY information from these snippets.\n"
+            "3. Cite the source file for each key assertion using the format [SOURCE: filename].\n"
+            "4. If information is missing, EXPLICITLY reply that you refuse to answer the specific part that is missing context.\n\n"
+            "#### Answer:"
+        )
+        return user_prompt
+
+    # Контекст пакуем в то, что осталось от окна после промпта и ответа:
+    # соседние/пересекающиеся чанки одного файла склеиваются, дубликаты выкидываются
+    chars_per_token = settings.context_chars_per_token
+    overhead = estimate_tokens(system_prompt + build_user_prompt(""), chars_per_token)
+    budget = settings.ask_num_ctx - settings.ask_num_predict - overhead - settings.ask_context_margin
+    with metrics.span("ask.assemble"):
+        context, assembly = await asyncio.to_thread(
+            assemble_context, results, max(0, budget), chars_per_token, project_path
+        )
+    metrics.inc("ask.context_tokens", assembly["context_tokens"])
+    metrics.inc("ask.tokens_saved", assembly["tokens_saved"])
+    logger.info(
+        f"🧩 Context: {assembly['hits']} hits -> {assembly['packed_blocks']} blocks, "
+        f"~{assembly['context_tokens']} tokens (saved ~{assembly['tokens_saved']}, budget {budget})"
     )
+    user_prompt = build_user_prompt(context)
 
     try:
         # 3. Call Ollama
-        response = ollama.chat(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            options={
-                "temperature": 0.0,  # Делает ответы стабильными и точными
-                "num_ctx": 8192,     # Увеличиваем окно, чтобы влезло больше файлов (по умолчанию 2048)
-                "num_predict": 1024  # Ограничиваем длину ответа, чтобы экономить ресурсы
-            }
-        )
-        answer = response["message"]["content"]
+        with metrics.span("ask.generate"):
+            response = await get_ollama_client().chat(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                options={
+                    "temperature": 0.0,  # Делает ответы стабильными и точными
+                    "num_ctx": settings.ask_num_ctx,          # Увеличиваем окно, чтобы влезло больше файлов (по умолчанию 2048)
+                    "num_predict": settings.ask_num_predict   # Ограничиваем длину ответа, чтобы экономить ресурсы
+                },
+                stream=stream,
+            )
+            if stream:
+                answer = await _stream_answer(response, ctx, started)
+            else:
+                answer = response["message"]["content"]
         logger.info("💡 Answer generated successfully")
         return answer
     except Exception as e:
+        metrics.inc("ollama.errors")
         logger.exception("🔥 LLM generation failed")
         return f"Error generating answer: {str(e)}"
 
 
-@mcp.resource("vox://{project_id}/rules")
-def get_project_rules(project_id: str) -> str:
-    """Reads the project rules from the context store."""
-    docs_path = os.path.expanduser(f"$VOX_HOME/context/docs/{project_id}/docs.jsonl")
-    logger.info(f"📜 Reading rules from: {docs_path}")
+def _read_context_resource(project_id: str, doc_type: str, label: str, empty_label: str) -> str:
+    """Shared body of the rules/docs/notes resources (served from the cached store)."""
+    store = context_stores.get(project_id)
+    logger.info(f"📜 Reading {label} from: {store.path}")
 
-    if not os.path.exists(docs_path):
-        return "No rules found for this project."
-
-    rules = []
     try:
-        with open(docs_path, "r") as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    if data.get("type") == "rule":
-                        rules.append(f"### {data.get('title')}\n{data.get('content')}")
-                except json.JSONDecodeError:
-                    continue
+        if not store.exists():
+            return f"No {empty_label} found for this project."
+        text = store.render(doc_type)
     except Exception as e:
-        return f"Error reading rules: {str(e)}"
+        return f"Error reading {label}: {str(e)}"
+
+    return text if text else f"No {empty_label} found."
+
 
-    return "\n\n".join(rules) if rules else "No rules found."
+@mcp.resource("vox://{project_id}/rules")
+def get_project_rules(project_id: str) -> str:
+    """Reads the project rules from the context store."""
+    return _read_context_resource(project_id, "rule", "rules", "rules")
 
 
 @mcp.resource("vox://{project_id}/docs")
 def get_project_docs(project_id: str) -> str:
     """Reads the project documentation from the context store."""
-    docs_path = os.path.expanduser(f"$VOX_HOME/context/docs/{project_id}/docs.jsonl")
-    logger.info(f"📜 Reading docs from: {docs_path}")
-
-    if not os.path.exists(docs_path):
-        return "No documentation found for this project."
-
-    docs = []
-    try:
-        with open(docs_path, "r") as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    if data.get("type") == "doc":
-                        docs.append(f"### {data.get('title')}\n{data.get('content')}")
-                except json.JSONDecodeError:
-                    continue
-    except Exception as e:
-        return f"Error reading docs: {str(e)}"
-
-    return "\n\n".join(docs) if docs else "No documentation found."
+    return _read_context_resource(project_id, "doc", "docs", "documentation")
 
 
 @mcp.resource("vox://{project_id}/notes")
 def get_project_notes(project_id: str) -> str:
     """Reads the project notes from the context store."""
-    docs_path = os.path.expanduser(f"$VOX_HOME/context/docs/{project_id}/docs.jsonl")
-    logger.info(f"📜 Reading notes from: {docs_path}")
+    return _read_context_resource(project_id, "note", "notes", "notes")
 
-    if not os.path.exists(docs_path):
-        return "No notes found for this project."
 
-    notes = []
+@mcp.tool()
+async def query_context_store(
+    project_id: str, doc_type: str = "rule", title: str = "", offset: int = 0, limit: int = 20
+) -> str:
+    """
+    Pages through a project's rules/docs/notes without reading them all.
+    Args:
+        project_id: Project id in the VOX context store.
+        doc_type: Entry type: rule, doc or note.
+        title: Case-insensitive substring the title must contain (empty = all).
+        offset: Number of matching entries to skip.
+        limit: Max entries to return.
+    """
+    store = context_stores.get(project_id)
     try:
-        with open(docs_path, "r") as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    if data.get("type") == "note":
-                        notes.append(f"### {data.get('title')}\n{data.get('content')}")
-                except json.JSONDecodeError:
-                    continue
+        if not store.exists():
+            return f"No context store found for project {project_id}."
+        page, total = store.entries(doc_type, title=title, offset=max(0, offset), limit=max(1, limit))
     except Exception as e:
-        return f"Error reading notes: {str(e)}"
+        return f"Error reading context store: {str(e)}"
 
-    return "\n\n".join(notes) if notes else "No notes found."
+    if not page:
+        return f"No {doc_type} entries found (total matches: {total})."
+    shown = f"{offset + 1}-{offset + len(page)} of {total}"
+    return f"{doc_type} entries {shown}\n\n{render_entries(page)}"
 
 
-@mcp.resource("vox://{project_id}/tree")
-def get_project_tree(project_id: str) -> str:
-    """Gets the file tree structure of the project."""
-    # We need to resolve the project_id to a path first.
-    # We can use the $VOX_HOME/context/projects/{id}/config.json file
-    config_path = os.path.expanduser(
-        f"$VOX_HOME/context/projects/{project_id}/config.json"
-    )
+def _resolve_project_path(project_id: str) -> tuple[str | None, str | None]:
+    """Project root from $VOX_HOME/context/projects/{id}/config.json -> (path, error)."""
+    config_path = context_path("projects", project_id, "config.json")
 
     if not os.path.exists(config_path):
-        return f"Project {project_id} not found."
+        return None, f"Project {project_id} not found."
 
     try:
         with open(config_path, "r") as f:
             config = json.load(f)
             project_path = config.get("path")
     except Exception as e:
-        return f"Error reading project config: {str(e)}"
+        return None, f"Error reading project config: {str(e)}"
 
     if not project_path or not os.path.exists(project_path):
-        return f"Project path not found: {project_path}"
+        return None, f"Project path not found: {project_path}"
+    return project_path, None
 
-    logger.info(f"🌳 Generating tree for: {project_path}")
 
-    tree_lines = []
+def _render_tree(project_id: str, subtree: str = "", depth: int | None = None) -> str:
+    project_path, error = _resolve_project_path(project_id)
+    if error:
+        return error
+
+    logger.info(f"🌳 Generating tree for: {project_path}")
     try:
-        for root, dirs, files in os.walk(project_path):
-            # Filter excluded directories (basic)
-            dirs[:] = [
-                d
-                for d in dirs
-                if d
-                not in {
-                    ".git",
-                    "node_modules",
-                    "__pycache__",
-                    ".venv",
-                    "venv",
-                    "dist",
-                    "build",
-                }
-            ]
-
-            level = root.replace(project_path, "").count(os.sep)
-            indent = " " * 4 * (level)
-            tree_lines.append(f"{indent}{os.path.basename(root)}/")
-            subindent = " " * 4 * (level + 1)
-            for f in files:
-                if not f.startswith("."):  # Skip hidden files
-                    tree_lines.append(f"{subindent}{f}")
-
-        return "\n".join(tree_lines)
+        # Общий снимок с индексатором: перечитываются только изменившиеся каталоги
+        tree = project_trees.get(project_path)
+        tree.refresh(max_age=settings.tree_refresh_interval)
+        text = tree.render(subtree, max_depth=depth, max_entries=settings.tree_max_entries)
     except Exception as e:
         return f"Error generating tree: {str(e)}"
+    if text is None:
+        return f"Directory not found in project: {subtree}"
+    return text
+
+
+@mcp.resource("vox://{project_id}/tree")
+def get_project_tree(project_id: str) -> str:
+    """Gets the file tree structure of the project."""
+    return _render_tree(project_id)
+
+
+@mcp.tool()
+async def project_tree(project_id: str, subtree: str = "", depth: int = 0) -> str:
+    """
+    File tree of a project or one of its directories, from the cached snapshot.
+    Args:
+        project_id: Project id in the VOX context store.
+        subtree: Directory relative to the project root (empty = whole project).
+        depth: Directory levels to expand (0 = unlimited).
+    """
+    return await asyncio.to_thread(_render_tree, project_id, subtree, depth or None)
+
+
+@mcp.resource("vox://metrics")
+def get_metrics() -> str:
+    """Per-stage latency histograms and counters since server start (JSON)."""
+    return json.dumps(
+        {
+            **metrics.snapshot(),
+            "rerank": rerank_stage.stats(),
+            "rewrite_cache": rewrite_cache.stats(),
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
+
+
+@mcp.resource("vox://metrics/prometheus", mime_type="text/plain")
+def get_metrics_prometheus() -> str:
+    """The same metrics in Prometheus text exposition format."""
+    return metrics.prometheus()
+
+
+@mcp.resource("vox://metrics/profile")
+def get_last_profile() -> str:
+    """Result of the last capture armed with profile_next_request."""
+    if profiler.last is None:
+        return "No profile captured yet. Arm one with profile_next_request."
+    return json.dumps(profiler.last, ensure_ascii=False, indent=2)
+
+
+@mcp.tool()
+async def profile_next_request(tool: str = "search_project", mode: str = "cpu") -> str:
+    """
+    Profiles the next call of a tool; read the result from vox://metrics/profile.
+    Args:
+        tool: search_project, ask_project, find_symbol, index_project or `*` for any.
+        mode: cpu (cProfile), memory (tracemalloc) or both.
+    """
+    try:
+        profiler.arm(tool, mode)
+    except ValueError as e:
+        return f"Error: {e}"
+    return f"Next {tool} call will be profiled ({mode}). Result: vox://metrics/profile"
+
+
+def _watcher_stats() -> list[dict]:
+    # Модуль watcher грузится только если наблюдение включали
+    module = sys.modules.get("app.watcher")
+    return module.watchers.stats() if module else []
+
+
+@mcp.tool()
+async def server_status() -> str:
+    """Reports startup phase timings, open stores and background jobs."""
+    return json.dumps(
+        {
+            "startup": startup_timings(),
+            "stores": registry.stats(),
+            "rewrite_cache": rewrite_cache.stats(),
+            "search_cache": search_cache.stats(),
+            "rerank": rerank_stage.stats(),
+            "jobs": [job.to_dict() for job in jobs.jobs() if job.active],
+            "watchers": _watcher_stats(),
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
 
 
 if __name__ == "__main__":
+    # Модели грузятся лениво; с RAG_MCP_PREWARM прогреваем их в фоне, пока идёт handshake
+    if settings.prewarm:
+        start_background_warmup()
+    mark_ready()
+    logger.info(f"⏱️ Startup timings: {startup_timings()}")
     # When run directly, use Stdio transport (default for FastMCP)
     mcp.run()
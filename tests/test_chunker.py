@@ -0,0 +1,40 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.chunker import chunk_file
+from app.config import settings
+
+ATTRS = "\n".join(f"    ATTR_{i} = 'value number {i} for the class'" for i in range(12))
+METHODS = "\n".join(f"    def m{i}(self):\n        return {i}\n" for i in range(3))
+TAIL = "\n".join(f"    TAIL_{i} = '{'x' * 60}'" for i in range(10))
+BIG_CLASS = f"class Big:\n{ATTRS}\n\n{METHODS}\n{TAIL}\n"
+
+
+class SymbolChunkLinesTest(unittest.TestCase):
+    def setUp(self):
+        self._max_chars = settings.symbol_chunk_max_chars
+        settings.symbol_chunk_max_chars = 600
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+
+    def tearDown(self):
+        settings.symbol_chunk_max_chars = self._max_chars
+        self._tmp.cleanup()
+
+    def test_oversized_class_pieces_match_their_lines(self):
+        # Собственные строки большого класса — несколько несмежных диапазонов вокруг методов
+        (self.root / "big.py").write_text(BIG_CLASS, encoding="utf-8")
+        lines = BIG_CLASS.split("\n")
+
+        chunks = chunk_file(str(self.root / "big.py"), str(self.root))
+
+        class_chunks = [chunk for chunk in chunks if chunk.metadata["symbol"] == "Big"]
+        self.assertGreater(len(class_chunks), 1)
+        for chunk in chunks:
+            start, end = chunk.metadata["start_line"], chunk.metadata["end_line"]
+            self.assertEqual("\n".join(lines[start - 1 : end]).strip(), chunk.page_content.strip())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.config import settings
+from app.indexer import index_project_incremental
+from app.vector_store import VectorStoreManager
+from bench.fake_ollama import FakeOllamaServer
+
+MODULE = '''\
+def alpha():
+    return 1
+
+
+def beta():
+    return 2
+'''
+
+IMPORTS = "import os\nimport re\nimport sys\nimport json\n"
+
+
+class ShiftedLinesTest(unittest.TestCase):
+    def setUp(self):
+        self.ollama = FakeOllamaServer(dim=16).start()
+        self._saved = {name: getattr(settings, name) for name in ("ollama_url", "embedding_cache_enabled")}
+        settings.ollama_url = self.ollama.url
+        settings.embedding_cache_enabled = False
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name) / "project"
+        self.root.mkdir()
+        self.store = VectorStoreManager(str(Path(self._tmp.name) / "db"), "test", backend="numpy")
+        # Свой model name: эмбеддер кэшируется по модели вместе с адресом Ollama
+        self.model = f"fake-embed-{self.ollama.url}"
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+        self.ollama.stop()
+        for name, value in self._saved.items():
+            setattr(settings, name, value)
+
+    def _index(self):
+        return index_project_incremental(str(self.root), self.store, self.model, workers=1)
+
+    def _lines(self, symbol):
+        [entry] = self.store.symbols.lookup(symbol)
+        [hit] = self.store.get_by_ids([entry["chunk_id"]])
+        return (entry["start_line"], entry["end_line"]), (hit["start_line"], hit["end_line"])
+
+    def test_lines_inserted_above_function_update_stored_ranges(self):
+        path = self.root / "m.py"
+        path.write_text(MODULE, encoding="utf-8")
+        self._index()
+        self.assertEqual(self._lines("beta"), ((5, 6), (5, 6)))
+
+        path.write_text(IMPORTS + "\n" + MODULE, encoding="utf-8")
+        stats = self._index()
+
+        # Тексты alpha/beta не изменились: их не эмбеддим заново, но диапазоны строк обновляются
+        self.assertEqual(stats["chunks_relocated"], 2)
+        self.assertEqual(self._lines("alpha"), ((6, 7), (6, 7)))
+        self.assertEqual(self._lines("beta"), ((10, 11), (10, 11)))
+
+        stats = self._index()
+        self.assertEqual(stats["chunks_relocated"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
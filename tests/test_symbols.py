@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from app.chunker import chunk_file
+from app.manifest import assign_chunk_ids
+from app.symbols import SymbolTable, symbol_entries
+
+WIDGET_PY = '''\
+class Widget:
+    """A small class: chunked whole, as a single unit."""
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def title(self):
+        return self.name.title()
+
+    def render(self):
+        return f"<div>{self.title}</div>"
+'''
+
+SERVICE_TS = '''\
+export class Service {
+  private ready = false;
+
+  constructor(private readonly url: string) {}
+
+  async run(input: string): Promise<string> {
+    if (!this.ready) {
+      this.ready = true;
+    }
+    return input;
+  }
+
+  stop = () => {
+    this.ready = false;
+  };
+}
+'''
+
+
+class SmallClassMethodsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.table = SymbolTable(self.root / "symbols.json")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _index(self, filename, text):
+        path = self.root / filename
+        path.write_text(text, encoding="utf-8")
+        chunks = chunk_file(str(path), str(self.root))
+        chunk_ids = assign_chunk_ids(chunks)
+        self.table.update_file(filename, symbol_entries(chunks, chunk_ids))
+        return dict(zip(chunk_ids, chunks))
+
+    def _class_chunk(self, chunks, name):
+        [chunk_id] = [cid for cid, chunk in chunks.items() if chunk.metadata.get("symbol") == name]
+        return chunk_id
+
+    def test_python_method_of_small_class(self):
+        chunks = self._index("widget.py", WIDGET_PY)
+        class_chunk = self._class_chunk(chunks, "Widget")
+
+        for name in ("render", "Widget.render"):
+            [entry] = self.table.lookup(name)
+            self.assertEqual(entry["name"], "Widget.render")
+            self.assertEqual(entry["kind"], "method")
+            self.assertEqual(entry["chunk_id"], class_chunk)
+            self.assertEqual((entry["start_line"], entry["end_line"]), (11, 12))
+
+        [entry] = self.table.lookup("title")
+        self.assertEqual(entry["start_line"], 7)
+
+    def test_ts_method_of_small_class(self):
+        chunks = self._index("service.ts", SERVICE_TS)
+        class_chunk = self._class_chunk(chunks, "Service")
+
+        [entry] = self.table.lookup("run")
+        self.assertEqual(entry["name"], "Service.run")
+        self.assertEqual(entry["chunk_id"], class_chunk)
+        self.assertEqual((entry["start_line"], entry["end_line"]), (6, 11))
+        self.assertEqual([e["name"] for e in self.table.lookup("Service.stop")], ["Service.stop"])
+        # Тело метода не принимается за определения
+        self.assertEqual(self.table.lookup("if"), [])
+
+    def test_removing_file_drops_methods(self):
+        self._index("widget.py", WIDGET_PY)
+        self.table.remove_file("widget.py")
+        self.assertEqual(self.table.lookup("render"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()